@@ -1,19 +1,98 @@
-import json
-from tqdm import tqdm
+import json, re
 import pandas as pd
+import numpy as np
+from .snapshot_cache import SnapshotCache
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+# characters that can follow a complete JSON value
+DELIMITERS = " \t\n\r,:]}"
+
+class JSONStreamReader():
+    """Incremental reader for a JSON object of (large) arrays, like the output of LND 'describegraph'. Array items are decoded one by one."""
+    def __init__(self, fp, chunk_size=1<<20):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf, self.pos, self.eof = "", 0, False
+
+    def _fill(self):
+        if self.pos > 0:
+            self.buf, self.pos = self.buf[self.pos:], 0
+        chunk = self.fp.read(self.chunk_size)
+        if len(chunk) == 0:
+            self.eof = True
+        self.buf += chunk
+
+    def _peek(self):
+        """Skip whitespace and return the next character ('' at the end of the file)"""
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos+1]
+            self._fill()
+
+    def _expect(self, chars):
+        c = self._peek()
+        if c == "" or not c in chars:
+            raise json.JSONDecodeError("Expecting one of %r" % chars, self.buf, self.pos)
+        self.pos += 1
+        return c
+
+    def _decode(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number at the end of the buffer (e.g. '2.' of '2.5') might continue in the next chunk
+                if self.eof or (end < len(self.buf) and self.buf[end] in DELIMITERS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def items(self):
+        """Yield (key, item) pairs for items of array values and (key, value) pairs for other values"""
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._decode()
+            self._expect(":")
+            if self._peek() == "[":
+                self.pos += 1
+                if self._peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, self._decode()
+                        if self._expect(",]") == "]":
+                            break
+            else:
+                yield key, self._decode()
+            if self._expect(",}") == "}":
+                return
+
+def read_graph_json(json_file, node_keys, edge_keys, chunk_size=1<<20):
+    """Stream nodes and edges of an LN graph json file into columnar buffers. Only the selected keys are kept."""
+    columns = {"nodes":{k:[] for k in node_keys}, "edges":{k:[] for k in edge_keys}}
+    with open(json_file) as f:
+        for key, record in JSONStreamReader(f, chunk_size).items():
+            if key in columns and isinstance(record, dict):
+                for k, values in columns[key].items():
+                    values.append(record.get(k))
+    return pd.DataFrame(columns["nodes"], columns=node_keys), pd.DataFrame(columns["edges"], columns=edge_keys)
 
 def load_temp_data(json_files, node_keys=["pub_key","last_update"], edge_keys=["node1_pub","node2_pub","last_update","capacity"]):
     """Load LN graph json files from several snapshots"""
     node_info, edge_info = [], []
     for idx, json_f in enumerate(json_files):
-        with open(json_f) as f:
-            try:
-                tmp_json = json.load(f)
-            except json.JSONDecodeError:
-                print("JSONDecodeError: " + json_f)
-                continue
-        new_nodes = pd.DataFrame(tmp_json["nodes"])[node_keys]
-        new_edges = pd.DataFrame(tmp_json["edges"])[edge_keys]
+        try:
+            new_nodes, new_edges = read_graph_json(json_f, node_keys, edge_keys)
+        except json.JSONDecodeError:
+            print("JSONDecodeError: " + json_f)
+            continue
         new_nodes["snapshot_id"] = idx
         new_edges["snapshot_id"] = idx
         print(json_f, len(new_nodes), len(new_edges))
@@ -29,27 +108,31 @@ def load_temp_data(json_files, node_keys=["pub_key","last_update"], edge_keys=["
 
 def generate_directed_graph(edges, policy_keys=['disabled', 'fee_base_msat', 'fee_rate_milli_msat', 'min_htlc']):
     """Generate directed graph data from undirected payment channels."""
-    directed_edges = []
-    indices = edges.index
-    for idx in tqdm(indices):
-        row = edges.loc[idx]
-        e1 = [row[x] for x in ["snapshot_id","node1_pub","node2_pub","last_update","channel_id","capacity"]]
-        e2 = [row[x] for x in ["snapshot_id","node2_pub","node1_pub","last_update","channel_id","capacity"]]
-        if row["node2_policy"] == None:
-            e1 += [None for x in policy_keys]
-        else:
-            e1 += [row["node2_policy"][x] for x in policy_keys]
-        if row["node1_policy"] == None:
-            e2 += [None for x in policy_keys]
-        else:
-            e2 += [row["node1_policy"][x] for x in policy_keys]
-        directed_edges += [e1, e2]
-    cols = ["snapshot_id","src","trg","last_update","channel_id","capacity"] + policy_keys
-    directed_edges_df = pd.DataFrame(directed_edges, columns=cols)
+    cols = ["snapshot_id","src","trg","last_update","channel_id","capacity"]
+    directions = []
+    # the policy of the target node applies to the directed edge
+    for src_col, trg_col, policy_col in [("node1_pub","node2_pub","node2_policy"), ("node2_pub","node1_pub","node1_policy")]:
+        directed = edges[["snapshot_id",src_col,trg_col,"last_update","channel_id","capacity"]].reset_index(drop=True)
+        directed.columns = cols
+        policies = pd.DataFrame.from_records([p if isinstance(p, dict) else {} for p in edges[policy_col]], columns=policy_keys)
+        directions.append(pd.concat([directed, policies], axis=1))
+    # keep both directions of a channel next to each other
+    N = len(edges)
+    order = np.arange(2*N).reshape(2,N).T.ravel()
+    directed_edges_df = pd.concat(directions, ignore_index=True).iloc[order].reset_index(drop=True)
     return directed_edges_df
 
-def preprocess_json_file(json_file):
-    """Generate directed graph data (traffic simulator input format) from json LN snapshot file."""
+def preprocess_json_file(json_file, cache_dir=None):
+    """Generate directed graph data (traffic simulator input format) from json LN snapshot file. If 'cache_dir' is set, the result is cached by the content hash of the file."""
+    if cache_dir != None:
+        cache = SnapshotCache(cache_dir)
+        key = cache.file_key(json_file, prefix="json_")
+        if cache.snapshots(key) != None:
+            print("Load preprocessed snapshot from cache: %s" % key)
+            return cache.load(key, 0)
+        directed_df = preprocess_json_file(json_file)
+        cache.store(key, directed_df)
+        return directed_df
     json_files = [json_file]
     print("\ni.) Load data")
     EDGE_KEYS = ["node1_pub","node2_pub","last_update","capacity","channel_id",'node1_policy','node2_policy']
@@ -70,4 +153,15 @@ def preprocess_json_file(json_file):
     for col in ["fee_base_msat","fee_rate_milli_msat","min_htlc"]:
         directed_df[col] = directed_df[col].astype("float64")
     return directed_df
-    
\ No newline at end of file
+    
+def load_preprocessed_snapshot(edges_file, snapshot_id, cache_dir=None):
+    """Load the directed edges of a single snapshot from a preprocessed edge file (e.g. 'ln_edges.csv'). If 'cache_dir' is set, the file is parsed only once and later only the requested snapshot partition is loaded."""
+    if cache_dir is None:
+        snapshots = pd.read_csv(edges_file)
+        return snapshots[snapshots["snapshot_id"]==snapshot_id]
+    cache = SnapshotCache(cache_dir)
+    key = cache.file_key(edges_file, prefix="csv_")
+    if cache.snapshots(key) is None:
+        print("Partition preprocessed snapshots into cache: %s" % key)
+        cache.store(key, pd.read_csv(edges_file))
+    return cache.load(key, snapshot_id)
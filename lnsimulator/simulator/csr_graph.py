@@ -0,0 +1,514 @@
+import networkx as nx
+import numpy as np
+from heapq import heappush, heappop
+from itertools import count
+
+from .shared_arrays import publish_arrays, attach_arrays
+from .graph_preprocessing import POLICY_KEYS, FEE_KEYS, calculate_tx_fee
+
+STRUCTURE_KEYS = ["indptr", "indices", "src", "rev_edges", "rev_indptr"]
+
+class _AdjacencyView():
+    """Read-only view of the outgoing edges of a node (mimics G[u] of networkx)"""
+    def __init__(self, graph, u):
+        self.graph = graph
+        self.u = u
+
+    def __getitem__(self, v):
+        e = self.graph.edge_id(self.u, v)
+        if e is None:
+            raise KeyError(v)
+        return self.graph.edge_data(e)
+
+    def __contains__(self, v):
+        return self.graph.has_edge(self.u, v)
+
+    def __iter__(self):
+        return iter(self.graph.successors(self.u))
+
+class _SearchBuffers():
+    """Reusable heap and distance buffers of the bidirectional search (shared between graph views)"""
+    def __init__(self, N):
+        self.gen = 0
+        self.seen = [[0]*N, [0]*N]
+        self.done = [[0]*N, [0]*N]
+        self.dist = [[0.0]*N, [0.0]*N]
+        self.pred = [[-1]*N, [-1]*N]
+        self.heaps = [[], []]
+
+class SharedGraphHandle():
+    """Picklable reference to a CSR graph published in shared memory"""
+    def __init__(self, spec, nodes, excluded, succ_order, pred_order):
+        self.spec = spec
+        self.nodes = nodes
+        self.excluded = excluded
+        self.succ_order = succ_order
+        self.pred_order = pred_order
+
+    def attach(self):
+        return CSRGraph.from_shared_memory(self)
+
+class CSRGraph():
+    """Integer-indexed CSR adjacency of the payment graph for fast path search. Edge removals are tracked with an activity mask."""
+    def __init__(self, nodes, indptr, indices, weights, active, present):
+        self.nodes_list = list(nodes)
+        self.index = dict(zip(self.nodes_list, range(len(self.nodes_list))))
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        # edge sources and reverse adjacency (grouped by target in forward edge order)
+        self.src = np.repeat(np.arange(len(self.nodes_list), dtype=np.int64), np.diff(indptr))
+        self.rev_edges = np.argsort(indices, kind="stable").astype(np.int64)
+        self.rev_indptr = np.concatenate([[0], np.cumsum(np.bincount(indices, minlength=len(self.nodes_list)))]).astype(np.int64)
+        self._init_edge_keys()
+        self._init_state(active, present)
+
+    def _init_edge_keys(self):
+        keys = (self.src * len(self.nodes_list) + self.indices).tolist()
+        self._edge_keys = dict(zip(keys, range(len(keys))))
+
+    def _init_state(self, active, present):
+        self.active = active
+        self.present = present
+        self.excluded = frozenset()
+        # adjacency order overrides for nodes with re-added edges (networkx appends them)
+        self._succ_order = {}
+        self._pred_order = {}
+        self._own_state = True
+        self._own_weights = False
+        self._buffers = _SearchBuffers(len(self.nodes_list))
+        # number of nodes settled by path searches
+        self.expanded = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_buffers"]
+        state.pop("_shm", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._buffers = _SearchBuffers(len(self.nodes_list))
+
+    @classmethod
+    def from_networkx(cls, G, capacity_map=None):
+        """Build CSR graph from the output of 'generate_graph_for_path_search'. Channels of 'capacity_map' that are missing from 'G' are added as inactive edges as they can be restored later by depletion."""
+        nodes = list(G.nodes())
+        present = [1] * len(nodes)
+        index = dict(zip(nodes, range(len(nodes))))
+        # fee policy is stored if the edges have it (payments with different amounts)
+        first_edge = next(iter(G.edges(data=True)), (None, None, {}))
+        policy_keys = [key for key in POLICY_KEYS if key in first_edge[2]]
+        adj = [[(v, d.get("total_fee", 1), d.get("capacity", 1), 1) + tuple(d[key] for key in policy_keys) for v, d in G._adj[u].items()] for u in nodes]
+        if capacity_map != None:
+            policy = getattr(capacity_map, "policy", {})
+            for e, ((src, trg), (_, fee, total_cap)) in enumerate(capacity_map.items()):
+                for u in [src, trg]:
+                    if not u in index:
+                        index[u] = len(nodes)
+                        nodes.append(u)
+                        present.append(0)
+                        adj.append([])
+                if not G.has_edge(src, trg):
+                    values = tuple(policy[key][e] if key in policy else np.nan for key in policy_keys)
+                    adj[index[src]].append((trg, fee, total_cap, 0) + values)
+        indptr = np.zeros(len(nodes)+1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(x) for x in adj])
+        flat = [item for row in adj for item in row]
+        indices = np.array([index[item[0]] for item in flat], dtype=np.int64)
+        weights = {
+            "total_fee": np.array([item[1] for item in flat], dtype=np.float64),
+            "capacity": np.array([item[2] for item in flat], dtype=np.float64),
+        }
+        for i, key in enumerate(policy_keys):
+            weights[key] = np.array([item[4+i] for item in flat], dtype=np.float64)
+        active = np.array([item[3] for item in flat], dtype=np.uint8)
+        return cls(nodes, indptr, indices, weights, active, np.array(present, dtype=np.uint8))
+
+    def to_shared_memory(self):
+        """Publish the CSR arrays and the current edge state in shared memory. It returns the shared memory block (the caller must close and unlink it) and a picklable handle for 'CSRGraph.from_shared_memory'."""
+        arrays = {key: getattr(self, key) for key in STRUCTURE_KEYS}
+        arrays["active"] = self.active
+        arrays["present"] = self.present
+        for key, arr in self.weights.items():
+            arrays["weight_" + key] = arr
+        shm, spec = publish_arrays(arrays)
+        return shm, SharedGraphHandle(spec, self.nodes_list, self.excluded, self._succ_order, self._pred_order)
+
+    @classmethod
+    def from_shared_memory(cls, handle):
+        """Attach to a CSR graph published by 'to_shared_memory' without copying its arrays. Modifications are applied on private copies."""
+        shm, arrays = attach_arrays(handle.spec)
+        G = cls.__new__(cls)
+        G.nodes_list = list(handle.nodes)
+        G.index = dict(zip(G.nodes_list, range(len(G.nodes_list))))
+        for key in STRUCTURE_KEYS:
+            setattr(G, key, arrays[key])
+        G.weights = {key[len("weight_"):]: arr for key, arr in arrays.items() if key.startswith("weight_")}
+        G._init_edge_keys()
+        G._init_state(arrays["active"], arrays["present"])
+        G.excluded = handle.excluded
+        G._succ_order, G._pred_order = handle.succ_order, handle.pred_order
+        # shared arrays are read-only: copy edge state before the first modification
+        G._own_state = False
+        G._shm = shm
+        return G
+
+    def view(self, excluded=[]):
+        """Return a copy-on-write view of the graph where the 'excluded' nodes (and their edges) are hidden"""
+        H = CSRGraph.__new__(CSRGraph)
+        H.__dict__.update(self.__dict__)
+        H.excluded = self.excluded.union(self.index[n] for n in excluded if n in self.index)
+        # edge state and weights are shared, both graphs copy them before writing
+        self._own_state, H._own_state = False, False
+        self._own_weights, H._own_weights = False, False
+        return H
+
+    def copy(self):
+        return self.view()
+
+    def overlay(self, active, present, weights={}, rev_edges=None):
+        """Return a view with another edge activity mask, node presence and optionally other weight arrays"""
+        H = self.view()
+        if rev_edges is not None:
+            H.rev_edges = rev_edges
+        H.active, H.present = active, present
+        H._succ_order, H._pred_order = {}, {}
+        H._own_state = True
+        if len(weights) > 0:
+            H.weights = dict(self.weights, **weights)
+        return H
+
+    def _ensure_own_state(self):
+        if not self._own_state:
+            self.active = self.active.copy()
+            self.present = self.present.copy()
+            self._succ_order = {k: list(v) for k, v in self._succ_order.items()}
+            self._pred_order = {k: list(v) for k, v in self._pred_order.items()}
+            self._own_state = True
+
+    ### networkx compatible interface ###
+
+    def __contains__(self, n):
+        i = self.index.get(n)
+        return i != None and self.present[i] == 1 and not i in self.excluded
+
+    def nodes(self):
+        return [n for n in self.index if n in self]
+
+    def number_of_nodes(self):
+        return len(self.nodes())
+
+    def number_of_edges(self):
+        return sum(len(self.successors(n)) for n in self.nodes())
+
+    def edge_id(self, u, v):
+        """Return the index of edge (u,v) if it is active, otherwise None"""
+        e = self._edge_id(u, v)
+        if e != None and self.active[e] == 1 and not int(self.src[e]) in self.excluded and not int(self.indices[e]) in self.excluded:
+            return e
+        return None
+
+    def _edge_id(self, u, v):
+        i, j = self.index.get(u), self.index.get(v)
+        if i == None or j == None:
+            return None
+        return self._edge_keys.get(i * len(self.nodes_list) + j)
+
+    def edge_data(self, e):
+        return {key: float(arr[e]) for key, arr in self.weights.items()}
+
+    def has_edge(self, u, v):
+        return self.edge_id(u, v) != None
+
+    def __getitem__(self, u):
+        if not u in self:
+            raise KeyError(u)
+        return _AdjacencyView(self, u)
+
+    def _ordered_edges(self, i, direction):
+        if direction == 0:
+            order = self._succ_order.get(i)
+            if order is None:
+                order = range(int(self.indptr[i]), int(self.indptr[i+1]))
+        else:
+            order = self._pred_order.get(i)
+            if order is None:
+                order = self.rev_edges.data[self.rev_indptr[i]:self.rev_indptr[i+1]]
+        active = self.active.data
+        return [e for e in order if active[e]]
+
+    def successors(self, u):
+        indices = self.indices.data
+        return [self.nodes_list[indices[e]] for e in self._ordered_edges(self.index[u], 0) if not indices[e] in self.excluded]
+
+    def predecessors(self, v):
+        src = self.src.data
+        return [self.nodes_list[src[e]] for e in self._ordered_edges(self.index[v], 1) if not src[e] in self.excluded]
+
+    def remove_edge(self, u, v):
+        e = self.edge_id(u, v)
+        if e is None:
+            raise nx.NetworkXError("The edge %s-%s is not in the graph" % (u, v))
+        self._ensure_own_state()
+        self.active[e] = 0
+        i, j = int(self.src[e]), int(self.indices[e])
+        if i in self._succ_order:
+            self._succ_order[i].remove(e)
+        if j in self._pred_order:
+            self._pred_order[j].remove(e)
+
+    def add_weighted_edges_from(self, ebunch, weight="weight"):
+        for u, v, w in ebunch:
+            e = self._edge_id(u, v)
+            if e is None:
+                raise ValueError("Edge %s-%s is unknown for the CSR graph" % (u, v))
+            if weight in self.weights and self.weights[weight][e] != w:
+                if not self._own_weights:
+                    self.weights = {key: arr.copy() for key, arr in self.weights.items()}
+                    self._own_weights = True
+                self.weights[weight][e] = w
+            if self.active[e] == 1:
+                continue
+            self._ensure_own_state()
+            i, j = int(self.src[e]), int(self.indices[e])
+            # re-added edges are moved to the end of the adjacency (as in networkx)
+            if not i in self._succ_order:
+                self._succ_order[i] = self._ordered_edges(i, 0)
+            if not j in self._pred_order:
+                self._pred_order[j] = self._ordered_edges(j, 1)
+            self._succ_order[i].append(e)
+            self._pred_order[j].append(e)
+            self.active[e] = 1
+            self.present[i] = 1
+            self.present[j] = 1
+
+    def set_edge_weight(self, u, v, weight, value):
+        """Update the weight of a known edge (active or not) without changing the adjacency"""
+        e = self._edge_id(u, v)
+        if e is None:
+            raise ValueError("Edge %s-%s is unknown for the CSR graph" % (u, v))
+        if self.weights[weight][e] != value:
+            if not self._own_weights:
+                self.weights = {key: arr.copy() for key, arr in self.weights.items()}
+                self._own_weights = True
+            self.weights[weight][e] = value
+
+    ### path search ###
+
+    def shortest_path(self, source, target, weight="total_fee", scope=None, amount=None):
+        """Bidirectional Dijkstra search of a payment with the same tie breaking as 'networkx.shortest_path'. Node and edge ids examined by the search are appended to 'scope'."""
+        s, t = self.index[source], self.index[target]
+        if s == t:
+            return [source]
+        cost = self._cost_view(weight, amount)
+        free_last_hop = weight in FEE_KEYS
+        capacity = self.weights["capacity"].data
+        indptr, indices, src = self.indptr.data, self.indices.data, self.src.data
+        rev_indptr, rev_edges = self.rev_indptr.data, self.rev_edges.data
+        active = self.active.data
+        orders = [self._succ_order, self._pred_order]
+        ends = [indices, src]
+        excluded = self.excluded
+        buffers = self._buffers
+        buffers.gen += 1
+        gen = buffers.gen
+        seen, done, dist, pred, heaps = buffers.seen, buffers.done, buffers.dist, buffers.pred, buffers.heaps
+        heaps[0].clear()
+        heaps[1].clear()
+        c = count()
+        for d, n in [(0, s), (1, t)]:
+            seen[d][n] = gen
+            dist[d][n] = 0
+            pred[d][n] = -1
+            heappush(heaps[d], (0, next(c), n))
+        finaldist, meet = None, -1
+        direction = 1
+        expanded = 0
+        while heaps[0] and heaps[1]:
+            direction = 1 - direction
+            other = 1 - direction
+            d_v, _, v = heappop(heaps[direction])
+            done_d = done[direction]
+            if done_d[v] == gen:
+                continue
+            done_d[v] = gen
+            expanded += 1
+            if scope is not None:
+                scope[direction].append(v)
+            if done[other][v] == gen:
+                self.expanded += expanded
+                return self._reconstruct(meet)
+            order = orders[direction].get(v)
+            if order is None:
+                if direction == 0:
+                    order = range(indptr[v], indptr[v+1])
+                else:
+                    order = rev_edges[rev_indptr[v]:rev_indptr[v+1]]
+            end, seen_d, dist_d, pred_d, heap = ends[direction], seen[direction], dist[direction], pred[direction], heaps[direction]
+            seen_o, dist_o = seen[other], dist[other]
+            for e in order:
+                if not active[e] or (amount != None and capacity[e] < amount):
+                    continue
+                w = end[e]
+                if done_d[w] == gen or w in excluded:
+                    continue
+                # edge into the target: forward edge to 't' or backward edge from 't'
+                vw_dist = d_v + (0.0 if free_last_hop and (w == t or v == t) else cost[e])
+                if seen_d[w] != gen or vw_dist < dist_d[w]:
+                    seen_d[w] = gen
+                    dist_d[w] = vw_dist
+                    pred_d[w] = v
+                    heappush(heap, (vw_dist, next(c), w))
+                    if scope is not None:
+                        scope[2].append(e)
+                    if seen_o[w] == gen:
+                        finaldist_w = vw_dist + dist_o[w]
+                        if finaldist is None or finaldist > finaldist_w:
+                            finaldist, meet = finaldist_w, w
+        self.expanded += expanded
+        raise nx.NetworkXNoPath("No path between %s and %s." % (source, target))
+
+    def astar_path(self, source, target, bounds, weight="total_fee", amount=None):
+        """A* search of a payment with lower bounds of the remaining cost for each node id (see 'LandmarkIndex.bounds')"""
+        s, t = self.index[source], self.index[target]
+        if s == t:
+            return [source]
+        cost = self._cost_view(weight, amount)
+        free_last_hop = weight in FEE_KEYS
+        capacity = self.weights["capacity"].data
+        indptr, indices, active = self.indptr.data, self.indices.data, self.active.data
+        order_map, excluded = self._succ_order, self.excluded
+        inf = float("inf")
+        buffers = self._buffers
+        buffers.gen += 1
+        gen = buffers.gen
+        seen, done, dist, pred, heap = buffers.seen[0], buffers.done[0], buffers.dist[0], buffers.pred[0], buffers.heaps[0]
+        heap.clear()
+        c = count()
+        seen[s], dist[s], pred[s] = gen, 0, -1
+        heappush(heap, (bounds[s], next(c), s))
+        expanded = 0
+        while heap:
+            _, _, v = heappop(heap)
+            if done[v] == gen:
+                continue
+            done[v] = gen
+            expanded += 1
+            if v == t:
+                self.expanded += expanded
+                path = [t]
+                while pred[path[-1]] != -1:
+                    path.append(pred[path[-1]])
+                return [self.nodes_list[i] for i in reversed(path)]
+            d_v = dist[v]
+            order = order_map.get(v)
+            if order is None:
+                order = range(indptr[v], indptr[v+1])
+            for e in order:
+                if not active[e] or (amount != None and capacity[e] < amount):
+                    continue
+                w = indices[e]
+                if done[w] == gen or w in excluded or bounds[w] == inf:
+                    continue
+                vw_dist = d_v + (0.0 if free_last_hop and w == t else cost[e])
+                if seen[w] != gen or vw_dist < dist[w]:
+                    seen[w] = gen
+                    dist[w] = vw_dist
+                    pred[w] = v
+                    heappush(heap, (vw_dist + bounds[w], next(c), w))
+        self.expanded += expanded
+        raise nx.NetworkXNoPath("No path between %s and %s." % (source, target))
+
+    def shortest_path_tree(self, source, weight="total_fee", targets=None):
+        """Single-source Dijkstra search. It returns distances, predecessors and (for fee weights) the predecessors of payment targets."""
+        cost = self._cost_view(weight)
+        free_last_hop = weight in FEE_KEYS
+        indptr, indices, active = self.indptr.data, self.indices.data, self.active.data
+        order_map, excluded = self._succ_order, self.excluded
+        remaining = None if targets is None else set(self.index[n] for n in targets if n in self.index)
+        buffers = self._buffers
+        buffers.gen += 1
+        gen = buffers.gen
+        seen, done, dist, pred, heap = buffers.seen[0], buffers.done[0], buffers.dist[0], buffers.pred[0], buffers.heaps[0]
+        # labels of the nodes as payment targets: the last hop is free
+        final_seen, final_dist, final_pred = buffers.seen[1], buffers.dist[1], buffers.pred[1]
+        final_nodes = []
+        heap.clear()
+        c = count()
+        s = self.index[source]
+        seen[s], dist[s], pred[s] = gen, 0, -1
+        heappush(heap, (0, next(c), s))
+        settled = []
+        while heap:
+            d_v, _, v = heappop(heap)
+            if done[v] == gen:
+                continue
+            done[v] = gen
+            settled.append(v)
+            if remaining != None:
+                remaining.discard(v)
+                if len(remaining) == 0:
+                    break
+            order = order_map.get(v)
+            if order is None:
+                order = range(indptr[v], indptr[v+1])
+            for e in order:
+                if not active[e]:
+                    continue
+                w = indices[e]
+                if done[w] == gen or w in excluded:
+                    continue
+                vw_dist = d_v + cost[e]
+                if seen[w] != gen or vw_dist < dist[w]:
+                    seen[w] = gen
+                    dist[w] = vw_dist
+                    pred[w] = v
+                    heappush(heap, (vw_dist, next(c), w))
+                # settled nodes already have a final label that is at most 'd_v'
+                if free_last_hop and (final_seen[w] != gen or d_v < final_dist[w]):
+                    if final_seen[w] != gen:
+                        final_seen[w] = gen
+                        final_nodes.append(w)
+                    final_dist[w] = d_v
+                    final_pred[w] = v
+        self.expanded += len(settled)
+        names = self.nodes_list
+        tree_dist = {names[v]: dist[v] for v in settled}
+        tree_pred = {names[v]: names[pred[v]] for v in settled if pred[v] != -1}
+        if not free_last_hop:
+            return tree_dist, tree_pred, None
+        return tree_dist, tree_pred, {names[w]: (final_dist[w], names[final_pred[w]]) for w in final_nodes}
+
+    def _cost_view(self, weight, amount=None):
+        if amount != None and weight == "total_fee":
+            # fees of the most recent payment amounts
+            if not "_amount_costs" in self.__dict__ or self._amount_weights is not self.weights:
+                self._amount_costs, self._amount_weights = {}, self.weights
+            if not amount in self._amount_costs:
+                if not all(key in self.weights for key in POLICY_KEYS):
+                    raise ValueError("The fee policy of the edges is required for payments with different amounts!")
+                if len(self._amount_costs) >= 64:
+                    self._amount_costs.pop(next(iter(self._amount_costs)))
+                self._amount_costs[amount] = calculate_tx_fee(self.weights, amount).data
+            return self._amount_costs[amount]
+        if weight is None:
+            if not "_unit" in self.__dict__:
+                self._unit = np.ones(len(self.indices), dtype=np.float64)
+            return self._unit.data
+        if not weight in self.weights:
+            raise ValueError("Unsupported weight for CSR graph: %s" % weight)
+        return self.weights[weight].data
+
+    def _reconstruct(self, meet):
+        path = []
+        curr = meet
+        while curr != -1:
+            path.append(curr)
+            curr = self._buffers.pred[0][curr]
+        path.reverse()
+        curr = self._buffers.pred[1][meet]
+        while curr != -1:
+            path.append(curr)
+            curr = self._buffers.pred[1][curr]
+        return [self.nodes_list[i] for i in path]
@@ -0,0 +1,248 @@
+import json, time, socket, threading, socketserver, traceback
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+from ..ln_utils import preprocess_json_file, load_preprocessed_snapshot
+from .transaction_simulator import TransactionSimulator, get_total_income_for_routers, get_total_fee_for_sources, calc_optimal_base_fee
+from .parameter_sweep import DEFAULT_PARAMS, EDGE_PARAMS
+
+DEFAULT_PORT = 8735
+# result tables that can be requested with the 'outputs' field of a job
+OUTPUTS = ["router_incomes", "source_fees", "lengths", "opt_fees", "transactions"]
+
+def to_json(obj):
+    """JSON line of a response (NumPy scalars are converted to Python values)"""
+    return json.dumps(obj, default=lambda o: o.item() if isinstance(o, np.generic) else str(o)) + "\n"
+
+def frame_records(df, top=None):
+    if top != None:
+        df = df.head(top)
+    return df.to_dict("records")
+
+class SimulationDaemon():
+    """Simulation service that keeps loaded snapshots and prepared simulators in memory between jobs"""
+    def __init__(self, max_simulators=8, max_baselines=32, cache_dir=None):
+        self.snapshots = {}
+        self.simulators = OrderedDict()
+        self.baselines = OrderedDict()
+        self.max_simulators = max_simulators
+        self.max_baselines = max_baselines
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.num_jobs = 0
+
+    def add_snapshot(self, name, edges, merchants=None):
+        """Register preprocessed directed edges. Cached simulators of a replaced snapshot are dropped."""
+        if merchants is None:
+            merchants = list(pd.unique(edges["src"]))
+        self.snapshots[name] = (edges, list(merchants))
+        for key in [key for key in self.simulators if key[0] == name]:
+            del self.simulators[key]
+        for key in [key for key in self.baselines if key[0] == name]:
+            del self.baselines[key]
+
+    def load_snapshot(self, name="default", json_file=None, edges_file=None, snapshot_id=None, merchants=None, merchants_file=None):
+        if json_file != None:
+            edges = preprocess_json_file(json_file, cache_dir=self.cache_dir)
+        elif edges_file != None and snapshot_id != None:
+            edges = load_preprocessed_snapshot(edges_file, int(snapshot_id), cache_dir=self.cache_dir)
+        else:
+            raise ValueError("Set 'json_file' or 'edges_file' and 'snapshot_id' to load a snapshot!")
+        if merchants_file != None:
+            merchants = list(pd.read_csv(merchants_file)["pub_key"])
+        self.add_snapshot(name, edges, merchants)
+        return {"snapshot":name, "directed_edges":len(edges), "merchants":len(self.snapshots[name][1])}
+
+    def cell(self, job):
+        """Simulator parameters of a job (missing values are set to the defaults)"""
+        return {name:job.get(name, value) for name, value in DEFAULT_PARAMS.items()}
+
+    def get_simulator(self, snapshot, cell):
+        """Simulator for the cell with newly sampled transactions. The prepared edge table and graphs of the snapshot are reused for the same edge filter and 'with_depletion' setting."""
+        if not snapshot in self.snapshots:
+            raise ValueError("Snapshot '%s' is not loaded!" % snapshot)
+        key = (snapshot, json.dumps([cell[name] for name in EDGE_PARAMS + ["with_depletion"]]))
+        base = self.simulators.get(key)
+        if base is None:
+            edges, merchants = self.snapshots[snapshot]
+            base = TransactionSimulator(edges, merchants, cell["amount"], cell["count"], epsilon=cell["epsilon"], drop_disabled=cell["drop_disabled"], drop_low_cap=cell["drop_low_cap"], with_depletion=cell["with_depletion"], time_window=cell["time_window"], seed=cell["seed"])
+            self.simulators[key] = base
+            if len(self.simulators) > self.max_simulators:
+                self.simulators.popitem(last=False)
+            return base
+        self.simulators.move_to_end(key)
+        return base.derive(count=cell["count"], epsilon=cell["epsilon"], seed=cell["seed"])
+
+    def simulate(self, job):
+        cell = self.cell(job)
+        simulate_params = job.get("simulate", {})
+        sim = self.get_simulator(job.get("snapshot", "default"), cell)
+        shortest_paths, alternative_paths, all_router_fees, _ = sim.simulate(**simulate_params)
+        total_income = get_total_income_for_routers(all_router_fees)
+        result = {
+            "params":cell,
+            "success_rate":float(sim.transactions["success"].mean()),
+            "total_income":float(total_income["fee"].sum()),
+            "num_routers":int(len(total_income)),
+            "metrics":sim.metrics.to_dict(),
+        }
+        outputs = job.get("outputs", [])
+        unknown = set(outputs).difference(OUTPUTS)
+        if len(unknown) > 0:
+            raise ValueError("Unknown outputs: %s (use one of %s)" % (sorted(unknown), OUTPUTS))
+        top = job.get("top")
+        if "router_incomes" in outputs:
+            result["router_incomes"] = frame_records(total_income, top)
+        if "source_fees" in outputs:
+            result["source_fees"] = frame_records(get_total_fee_for_sources(sim.transactions, shortest_paths).reset_index(), top)
+        if "lengths" in outputs:
+            result["lengths"] = {int(length):int(cnt) for length, cnt in shortest_paths["length"].value_counts().items()}
+        if "opt_fees" in outputs:
+            if not simulate_params.get("with_node_removals", False):
+                raise ValueError("Optimal base fees require 'with_node_removals' in the 'simulate' parameters!")
+            opt_fees_df, _ = calc_optimal_base_fee(shortest_paths, alternative_paths, all_router_fees)
+            result["opt_fees"] = frame_records(opt_fees_df, top)
+        if "transactions" in outputs:
+            result["transactions"] = frame_records(sim.transactions, top)
+        if job.get("output_dir") != None:
+            sim.export(job["output_dir"], job.get("file_format", "csv"))
+        return result, total_income
+
+    def what_if(self, job):
+        nodes = job.get("nodes", [])
+        # baseline and scenario are simulated on the same transactions and channel balances
+        if job.get("seed") is None:
+            job = dict(job, seed=int(np.random.randint(2**31)))
+        baseline_key = (job.get("snapshot", "default"), json.dumps([self.cell(job), job.get("simulate", {})], sort_keys=True))
+        if baseline_key in self.baselines:
+            baseline, baseline_income = self.baselines[baseline_key]
+            self.baselines.move_to_end(baseline_key)
+        else:
+            baseline, baseline_income = self.simulate(dict(job, outputs=[], output_dir=None))
+            self.baselines[baseline_key] = (baseline, baseline_income)
+            if len(self.baselines) > self.max_baselines:
+                self.baselines.popitem(last=False)
+        scenario_job = dict(job, simulate=dict(job.get("simulate", {}), **job.get("scenario", {})))
+        scenario, scenario_income = self.simulate(scenario_job)
+        incomes = pd.DataFrame({"node":nodes}).merge(baseline_income, on="node", how="left").merge(scenario_income, on="node", how="left", suffixes=("_baseline","_scenario")).fillna(0.0)
+        scenario.pop("metrics")
+        return {
+            "baseline":{key:value for key, value in baseline.items() if key != "metrics"},
+            "scenario":scenario,
+            "success_rate_diff":scenario["success_rate"] - baseline["success_rate"],
+            "nodes":incomes.to_dict("records"),
+        }
+
+    def status(self):
+        return {
+            "snapshots":{name:{"directed_edges":len(edges), "merchants":len(merchants)} for name, (edges, merchants) in self.snapshots.items()},
+            "simulators":[{"snapshot":key[0], "filter":json.loads(key[1])} for key in self.simulators],
+            "baselines":len(self.baselines),
+            "jobs":self.num_jobs,
+        }
+
+    def run_job(self, job):
+        """Execute a job and return its response. Errors are reported in the response."""
+        start = time.perf_counter()
+        response = {"id":job.get("id"), "type":job.get("type", "simulate")}
+        try:
+            with self.lock:
+                job_type = response["type"]
+                if job_type == "load":
+                    params = {key:job[key] for key in ["json_file", "edges_file", "snapshot_id", "merchants", "merchants_file"] if key in job}
+                    response["result"] = self.load_snapshot(job.get("snapshot", "default"), **params)
+                elif job_type == "simulate":
+                    response["result"] = self.simulate(job)[0]
+                elif job_type == "what_if":
+                    response["result"] = self.what_if(job)
+                elif job_type in ["status", "snapshots"]:
+                    response["result"] = self.status()
+                else:
+                    raise ValueError("Invalid job type: %s" % job_type)
+                self.num_jobs += 1
+            response["status"] = "ok"
+        except Exception as e:
+            response["status"] = "error"
+            response["error"] = "%s: %s" % (type(e).__name__, e)
+            traceback.print_exc()
+        response["seconds"] = time.perf_counter() - start
+        return response
+
+    def serve(self, host="127.0.0.1", port=DEFAULT_PORT):
+        """Serve JSON line jobs over a TCP socket until a 'shutdown' job is received"""
+        with JobServer((host, port), self) as server:
+            print("Simulation daemon is listening on %s:%i" % server.server_address[:2])
+            server.serve_forever()
+        print("Simulation daemon STOPPED")
+
+class JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                response = {"id":None, "status":"error", "error":"Invalid JSON: %s" % e}
+            else:
+                if job.get("type") == "shutdown":
+                    self.wfile.write(to_json({"id":job.get("id"), "type":"shutdown", "status":"ok"}).encode())
+                    threading.Thread(target=self.server.shutdown).start()
+                    return
+                response = self.server.simulation_daemon.run_job(job)
+            self.wfile.write(to_json(response).encode())
+            self.wfile.flush()
+
+class JobServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, server_address, simulation_daemon):
+        self.simulation_daemon = simulation_daemon
+        super().__init__(server_address, JobHandler)
+
+class SimulationClient():
+    """Client of a running simulation daemon (see 'SimulationDaemon.serve')"""
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, timeout=None):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.rfile = self.sock.makefile("rb")
+        self.next_id = 0
+
+    def _send(self, jobs):
+        for job in jobs:
+            self.sock.sendall(to_json(job).encode())
+
+    def stream(self, jobs):
+        """Submit jobs and yield the responses in the order of completion. Jobs are sent in the background, so results can be consumed while the remaining jobs are submitted."""
+        jobs = list(jobs)
+        for job in jobs:
+            if job.get("id") is None:
+                job["id"] = self.next_id
+                self.next_id += 1
+        sender = threading.Thread(target=self._send, args=(jobs,), daemon=True)
+        sender.start()
+        for _ in range(len(jobs)):
+            line = self.rfile.readline()
+            if len(line) == 0:
+                raise ConnectionError("The simulation daemon closed the connection!")
+            yield json.loads(line)
+        sender.join()
+
+    def run(self, job):
+        """Submit a single job and return its response"""
+        return next(self.stream([job]))
+
+    def shutdown(self):
+        return self.run({"type":"shutdown"})
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
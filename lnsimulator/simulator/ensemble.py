@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import math
+import concurrent.futures
+
+from .transaction_simulator import TransactionSimulator, get_total_income_for_routers, calc_optimal_base_fee
+
+_ensemble_state = {}
+
+def init_ensemble_worker(simulator, simulate_params):
+    """Store the simulator and the simulate parameters in the worker process"""
+    _ensemble_state["simulator"] = simulator
+    _ensemble_state["simulate_params"] = simulate_params
+
+def ensemble_worker(run_item):
+    run_id, seed = run_item
+    return simulate_run(_ensemble_state["simulator"], _ensemble_state["simulate_params"], run_id, seed)
+
+def simulate_run(simulator, simulate_params, run_id, seed):
+    """Run one ensemble member on its own random stream and return its router incomes, success rate and optimal base fees"""
+    sim = simulator.spawn(seed)
+    shortest_paths, alternative_paths, all_router_fees, _ = sim.simulate(**simulate_params)
+    incomes = get_total_income_for_routers(all_router_fees)
+    incomes["node"] = incomes["node"].astype(str)
+    incomes["run"] = run_id
+    success = pd.DataFrame({"run":[run_id], "success_rate":[sim.transactions["success"].mean()]})
+    if simulate_params.get("with_node_removals", False):
+        opt_fees, _ = calc_optimal_base_fee(shortest_paths, alternative_paths, all_router_fees)
+        opt_fees = opt_fees[["node","opt_delta","income_diff"]].copy()
+        opt_fees["node"] = opt_fees["node"].astype(str)
+        opt_fees["run"] = run_id
+    else:
+        opt_fees = pd.DataFrame(columns=["node","opt_delta","income_diff","run"])
+    return incomes, success, opt_fees
+
+def normal_quantile(p, tol=1e-12):
+    """Inverse of the standard normal distribution function (bisection on 'math.erf')"""
+    low, high = -40.0, 40.0
+    while high - low > tol:
+        mid = (low + high) / 2.0
+        if 0.5 * (1.0 + math.erf(mid / math.sqrt(2.0))) < p:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2.0
+
+def add_confidence_interval(aggr, col, confidence):
+    """Add normal approximation confidence interval of the mean of 'col' (aggregated with mean, std and count)"""
+    z = normal_quantile(0.5 + confidence / 2.0)
+    half_width = z * aggr[col+"_std"].fillna(0.0) / np.sqrt(aggr["num_runs"])
+    aggr[col+"_ci_low"] = aggr[col+"_mean"] - half_width
+    aggr[col+"_ci_high"] = aggr[col+"_mean"] + half_width
+    return aggr
+
+def aggregate_runs(df, key, cols, confidence):
+    grouped = df.groupby(key) if key != None else df.assign(_all=0).groupby("_all")
+    parts = []
+    for col in cols:
+        aggr = grouped[col].agg(["mean","std","count"])
+        aggr.columns = [col+"_mean", col+"_std", "num_runs"]
+        parts.append(add_confidence_interval(aggr, col, confidence).drop("num_runs", axis=1))
+    aggr = pd.concat(parts, axis=1)
+    aggr["num_runs"] = grouped.size()
+    return aggr.reset_index(drop=key is None)
+
+def run_ensemble(edges, merchants, amount_sat, count, num_runs=10, seed=None, max_workers=2, confidence=0.95, simulator_params={}, simulate_params={}):
+    """Run 'num_runs' simulations on independent random streams of 'seed' and aggregate their results with confidence intervals"""
+    seeds = np.random.SeedSequence(seed).spawn(num_runs)
+    # transactions of the base simulator are not used: each run samples its own transactions
+    simulator = TransactionSimulator(edges, merchants, amount_sat, count, seed=seed, **simulator_params)
+    params = dict({"max_threads":1}, **simulate_params)
+    runs = list(enumerate(seeds))
+    if max_workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers, initializer=init_ensemble_worker, initargs=(simulator, params)) as executor:
+            results = list(executor.map(ensemble_worker, runs))
+    else:
+        results = [simulate_run(simulator, params, run_id, s) for run_id, s in runs]
+    incomes = pd.concat([r[0] for r in results], ignore_index=True)
+    # routers without income in a run count with zero income
+    income_table = incomes.pivot_table(index="node", columns="run", values="fee", aggfunc="sum").reindex(columns=range(num_runs)).fillna(0.0)
+    traffic_table = incomes.pivot_table(index="node", columns="run", values="num_trans", aggfunc="sum").reindex(columns=range(num_runs)).fillna(0.0)
+    incomes = pd.DataFrame({
+        "node":np.repeat(income_table.index.values, num_runs),
+        "income":income_table.values.ravel(),
+        "traffic":traffic_table.values.ravel(),
+    })
+    router_incomes = aggregate_runs(incomes, "node", ["income","traffic"], confidence).sort_values("income_mean", ascending=False)
+    success_rates = aggregate_runs(pd.concat([r[1] for r in results], ignore_index=True), None, ["success_rate"], confidence)
+    opt_fees = pd.concat([r[2] for r in results], ignore_index=True)
+    if len(opt_fees) > 0:
+        opt_fees = aggregate_runs(opt_fees.astype({"opt_delta":"float64","income_diff":"float64"}), "node", ["opt_delta","income_diff"], confidence).sort_values("income_diff_mean", ascending=False)
+    return router_incomes.reset_index(drop=True), success_rates, opt_fees.reset_index(drop=True)
@@ -1,23 +1,64 @@
 import networkx as nx
 import numpy as np
 import pandas as pd
+from collections import OrderedDict
 
-def populate_route(route, k, G, router_weights=None):
+class CommonNeighborIndex():
+    """Lazily populated LRU index of common directed neighbors: nodes 'm' with edges n1->m and m->n2"""
+    def __init__(self, G, max_entries=100000):
+        self.G = G
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.by_first = {}
+        self.by_second = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, n1, n2):
+        key = (n1, n2)
+        neigh = self.entries.get(key)
+        if neigh is None:
+            neigh = sorted(set(self.G.successors(n1)).intersection(self.G.predecessors(n2)))
+            self.entries[key] = neigh
+            self.by_first.setdefault(n1, set()).add(key)
+            self.by_second.setdefault(n2, set()).add(key)
+            if len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+        else:
+            self.entries.move_to_end(key)
+        return neigh
+
+    def _drop(self, key):
+        del self.entries[key]
+        self.by_first[key[0]].discard(key)
+        self.by_second[key[1]].discard(key)
+
+    def invalidate(self, changes):
+        """Drop node pairs whose common neighbors could be modified by the edge changes (see 'process_path')"""
+        for change in changes:
+            u, v = change[1], change[2]
+            # edge u->v is either the first (n1=u, m=v) or the second (m=u, n2=v) edge of a pair
+            for key in list(self.by_first.get(u, [])) + list(self.by_second.get(v, [])):
+                if key in self.entries:
+                    self._drop(key)
+
+def populate_route(route, k, G, router_weights=None, rng=np.random, index=None):
     """Populate short routes with random neighbors"""
+    if index is None:
+        index = CommonNeighborIndex(G)
     path = route.copy()
     trial_cnt = 0
     max_trials = 10
     success = True
-    target = route[-1].replace("_trg","")
+    target = route[-1]
     while len(path) < k+1:
-        pos = np.random.choice(range(len(path)-1))
+        # drawing an index is equivalent to choosing from the sequence (without converting it to an array)
+        pos = rng.choice(len(path)-1)
         n1, n2 = path[pos], path[pos+1]
-        # find common directed neighbor
-        neigh = set(G.successors(n1)).intersection(set(G.predecessors(n2)))
-        if target in neigh:
-            neigh.remove(target)
-        # exclude loops
-        neigh = list(neigh.difference(set(path)))
+        # find common directed neighbor, exclude loops
+        on_path = set(path)
+        neigh = [n for n in index.get(n1, n2) if n != target and not n in on_path]
         if len(neigh) == 0:
             trial_cnt += 1
             if trial_cnt == max_trials:
@@ -30,7 +71,7 @@ def populate_route(route, k, G, router_weights=None):
             sum_ = np.sum(weights)
             if sum_ > 0:
                  probas = weights / sum_
-        new_node = np.random.choice(neigh, p=probas)
+        new_node = neigh[rng.choice(len(neigh), p=probas)]
         path.insert(pos+1, new_node)
     # finalize the instance
     return success, tuple(path)
@@ -57,84 +98,125 @@ def validate_path(route, G):
         return valid
     else:
         print("Node duplication!")
-        return False 
+        return False
 
-def mix_routes(route_1, route_2, G):
+def mix_routes(route_1, route_2, G, rng=np.random, index=None):
     """Randomly select neighbors from other routes"""
-    target = route_1[-1].replace("_trg","")
+    if index is None:
+        index = CommonNeighborIndex(G)
+    target = route_1[-1]
+    on_route_1 = set(route_1)
+    on_route_2 = set(route_2[1:-1])
     res = []
     for i in range(1,len(route_1)-1):
         n1, n2 = route_1[i-1], route_1[i+1]
-        neigh = set(G.successors(n1)).intersection(set(G.predecessors(n2)))
-        neigh = neigh.difference(set(route_1))
-        if target in neigh:
-            neigh.remove(target)
-        neigh = list(neigh.intersection(set(route_2[1:-1])))
+        neigh = [n for n in index.get(n1, n2) if n != target and n in on_route_2 and not n in on_route_1]
         if len(neigh) > 0:
             r1 = list(route_1)
-            r1[i] = np.random.choice(neigh)
+            r1[i] = neigh[rng.choice(len(neigh))]
             if not validate_path(r1, G):
                 raise RuntimeError("Invalid path: %s" % r1)
             res.append(tuple(r1))
     return res
 
 class GeneticPaymentRouter():
-    def __init__(self, k, G, router_weights=None):
+    """Genetic search for minimal cost routes with exactly 'k' hops. The router can be reused while the graph changes (see 'invalidate')."""
+    def __init__(self, k, G, router_weights=None, rng=np.random, max_index_entries=100000):
         self.k = k
         self.G = G
         self.router_weights = router_weights
-        
+        self.rng = rng
+        self.index = CommonNeighborIndex(G, max_index_entries)
+        self.node_ids = {}
+        self.fees = {}
+
+    def invalidate(self, changes):
+        self.index.invalidate(changes)
+        for change in changes:
+            self.fees.pop((self.node_ids.get(change[1]), self.node_ids.get(change[2])), None)
+
     def _init_population(self, route, size):
         population = []
         for _ in range(size):
-            success, path = populate_route(route, self.k, self.G, self.router_weights)
+            success, path = populate_route(route, self.k, self.G, self.router_weights, self.rng, self.index)
             if success:
                 population.append(path)
         # remove duplications
-        return list(set(population))
-    
+        return sorted(set(population))
+
+    def _encode(self, population):
+        """Population as an integer array with one row per route"""
+        node_ids = self.node_ids
+        flat = []
+        for route in population:
+            for n in route:
+                i = node_ids.get(n)
+                if i is None:
+                    i = len(node_ids)
+                    node_ids[n] = i
+                flat.append(i)
+        return np.array(flat, dtype=np.int64).reshape(len(population), -1)
+
+    def _edge_fees(self, src, trg):
+        fees = np.empty(len(src), dtype=np.float64)
+        nodes = None
+        for pos, key in enumerate(zip(src.tolist(), trg.tolist())):
+            fee = self.fees.get(key)
+            if fee is None:
+                if nodes is None:
+                    nodes = list(self.node_ids.keys())
+                fee = self.G[nodes[key[0]]][nodes[key[1]]]["total_fee"]
+                self.fees[key] = fee
+            fees[pos] = fee
+        return fees
+
     def _eval_population(self, population):
-        costs = [calculate_cost(item, self.G) for item in population]
-        pop_df = pd.DataFrame(list(zip(population, costs)), columns=["route","cost"])
-        opt_record = pop_df.nsmallest(1,"cost").values
-        opt_path, opt_cost = opt_record[0,0], opt_record[0,1]
-        return pop_df, opt_path, opt_cost
-    
-    def _gen_offsprings(self, pop_df, cnt, times=5):
+        """Costs of all routes (the last edge has no routing cost) and the route with minimal cost"""
+        routes = self._encode(population)
+        # fees are looked up once for each distinct edge
+        edges, inverse = np.unique(routes[:, :-2] * len(self.node_ids) + routes[:, 1:-1], return_inverse=True)
+        fees = self._edge_fees(edges // len(self.node_ids), edges % len(self.node_ids))
+        edge_fees = fees[inverse.reshape(routes.shape[0], -1)]
+        costs = np.zeros(len(population))
+        for j in range(edge_fees.shape[1]):
+            costs += edge_fees[:, j]
+        opt_idx = int(np.argmin(costs))
+        return costs, population[opt_idx], costs[opt_idx]
+
+    def _gen_offsprings(self, population, costs, cnt, times=5):
         """Generate offsprings from best individuals. Additional random individuals are also sampled from the previous population"""
-        individuals = list(pop_df["route"])
-        N = len(individuals)
-        parents = list(pop_df.nsmallest(cnt, "cost")["route"])
+        individuals = population
+        parents = [population[i] for i in np.argsort(costs, kind="stable")[:cnt]]
         L = len(parents)
         offsprings = []
         for _ in range(times):
             # random permutation
-            np.random.shuffle(parents)
+            self.rng.shuffle(parents)
             # generate new offsprings pairwise
             for i in range(0,L-1,2):
                 p1, p2 = parents[i], parents[i+1]
-                offsprings += mix_routes(p1, p2, self.G)
-                offsprings += mix_routes(p2, p1, self.G)
-        unique_offsprings = list(set(offsprings))
-        rnd_indices = set(np.random.choice(range(L), size=len(unique_offsprings), replace=True))
+                offsprings += mix_routes(p1, p2, self.G, self.rng, self.index)
+                offsprings += mix_routes(p2, p1, self.G, self.rng, self.index)
+        unique_offsprings = sorted(set(offsprings))
+        rnd_indices = sorted(set(self.rng.choice(L, size=len(unique_offsprings), replace=True)))
         return unique_offsprings + [individuals[j] for j in rnd_indices]
-            
+
     def run(self, route, size=100, best_ratio=0.25, iterations=5, verbose=False):
         """Run fixed size minimal cost search with genetic algorithm"""
         pop = self._init_population(route, size)
         if len(pop) == 0:
             return calculate_cost(route, self.G), len(route)-1, route, -1
         else:
-            pop_df, opt_path, opt_cost = self._eval_population(pop)
+            costs, opt_path, opt_cost = self._eval_population(pop)
             if verbose:
                 print("init", len(pop), opt_cost)
             for idx in range(iterations):
-                pop = self._gen_offsprings(pop_df, int(size*best_ratio))
+                pop = self._gen_offsprings(pop, costs, int(size*best_ratio))
                 if len(pop) == 0:
                     if verbose:
                         print("Empty population in %i round!" % (idx+1))
                     break
-                pop_df, new_path, new_cost = self._eval_population(pop)
+                costs, new_path, new_cost = self._eval_population(pop)
                 if new_cost < opt_cost:
                     opt_cost = new_cost
                     opt_path = new_path
@@ -0,0 +1,121 @@
+import numpy as np
+from collections import OrderedDict
+
+from .graph_preprocessing import init_capacity_structure, populate_capacities, generate_graph_for_path_search
+from .csr_graph import CSRGraph
+from .landmarks import LandmarkIndex
+from .metrics import SimulationMetrics
+
+class PreparedGraphCache():
+    """Memoized graph and capacity preparation for repeated simulations on the same channels"""
+    def __init__(self, edges, amount_sat, with_depletion, verbose=False, max_entries=4):
+        self.edges = edges
+        self.amount = amount_sat
+        self.with_depletion = with_depletion
+        self.verbose = verbose
+        self.max_entries = max_entries
+        self.base = None
+        self.graphs = OrderedDict()
+
+    def _cached(self, cache, key, build):
+        value = cache.get(key)
+        if value is None:
+            value = build()
+            cache[key] = value
+            if len(cache) > self.max_entries:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return value
+
+    def _scenario(self, base, cap_change_nodes, capacity_fraction):
+        """Mask of the remaining channels (None if every channel is kept) and channel capacities after a capacity change"""
+        total_cap = base["capacity_map"].total_cap
+        if len(cap_change_nodes) > 0 and capacity_fraction < 1.0:
+            filt = (self.edges["src"].isin(cap_change_nodes) | self.edges["trg"].isin(cap_change_nodes)).values
+            total_cap = total_cap.copy()
+            total_cap[filt] *= capacity_fraction
+            return total_cap >= self.amount, total_cap
+        return None, total_cap
+
+    def _base(self):
+        if self.base is None:
+            self.base = {"capacity_map":init_capacity_structure(self.edges)}
+        return self.base
+
+    def _base_csr(self, base):
+        if not "csr" in base:
+            # every channel is stored, capacities only switch edges on and off
+            csr = CSRGraph.from_networkx(generate_graph_for_path_search(self.edges, 0))
+            capacity_map = base["capacity_map"]
+            base["edge_map"] = np.array([csr._edge_id(s, t) for s, t in zip(capacity_map.src, capacity_map.trg)], dtype=np.int64)
+            base["csr"] = csr
+        return base["csr"]
+
+    def _csr_overlay(self, base, keep, total_cap, cap=None):
+        csr = self._base_csr(base)
+        ids = np.arange(len(total_cap)) if keep is None else np.where(keep)[0]
+        if cap is None:
+            cap = total_cap[ids]
+        on = cap >= self.amount
+        # depleted edges keep their channel capacity as in 'CSRGraph.from_networkx'
+        values = np.where(on, cap, total_cap[ids])
+        active = np.zeros(len(csr.indices), dtype=np.uint8)
+        capacity = csr.weights["capacity"].copy()
+        mapping = base["edge_map"][ids]
+        active[mapping[on]] = 1
+        capacity[mapping] = values
+        present = np.zeros(len(csr.nodes_list), dtype=np.uint8)
+        present[csr.src[active == 1]] = 1
+        present[csr.indices[active == 1]] = 1
+        return csr.overlay(active, present, {"capacity":capacity}, self._reverse_order(csr, mapping[on]))
+
+    def landmarks(self, nodes, weight="total_fee"):
+        """Landmark index of every channel (see 'LandmarkIndex'). It is valid for each prepared graph, as they only contain a subset of the channels with the same fees."""
+        base = self._base()
+        index = base.setdefault("landmarks", {})
+        key = (tuple(nodes), weight)
+        if not key in index:
+            index[key] = LandmarkIndex(self._base_csr(base), nodes, weight)
+        return index[key]
+
+    def _reverse_order(self, csr, rows):
+        """Incoming edges ordered by the node order of the graph built from the edge list 'rows' (networkx adds nodes in the order of first appearance)"""
+        sequence = np.empty(2*len(rows), dtype=np.int64)
+        sequence[0::2] = csr.src[rows]
+        sequence[1::2] = csr.indices[rows]
+        rank = np.full(len(csr.nodes_list), len(sequence), dtype=np.int64)
+        nodes, first = np.unique(sequence, return_index=True)
+        rank[nodes] = first
+        return np.lexsort((rank[csr.src], csr.indices))
+
+    def prepare(self, cap_change_nodes=[], capacity_fraction=1.0, engine="networkx", rng=np.random, metrics=None):
+        """Return the initial capacity state and the graph for path search (the graph may be shared between calls, see 'init_search_graph')"""
+        metrics = SimulationMetrics() if metrics is None else metrics
+        with metrics.stage("capacity_init"):
+            base = self._base()
+            keep, total_cap = self._scenario(base, cap_change_nodes, capacity_fraction)
+            if self.with_depletion:
+                template = base["capacity_map"]
+                capacity_map = template.copy() if keep is None else template.subset(keep, total_cap)
+                edges_with_capacity = populate_capacities(capacity_map, self.amount, rng)
+                if self.verbose:
+                    print("Edges with capacity: %i->%i" % (len(capacity_map), len(edges_with_capacity)))
+            else:
+                capacity_map = None
+        with metrics.stage("graph_construction"):
+            if engine == "csr":
+                G = self._csr_overlay(base, keep, total_cap, None if capacity_map is None else capacity_map.cap)
+            elif self.with_depletion:
+                G = generate_graph_for_path_search(edges_with_capacity, self.amount)
+            else:
+                key = None if keep is None else (frozenset(cap_change_nodes), capacity_fraction)
+                G = self._cached(self.graphs, key, lambda: generate_graph_for_path_search(self._scenario_edges(keep, total_cap), self.amount))
+        return capacity_map, G
+
+    def _scenario_edges(self, keep, total_cap):
+        if keep is None:
+            return self.edges
+        edges = self.edges[keep].copy()
+        edges["capacity"] = total_cap[keep]
+        return edges
@@ -2,6 +2,13 @@ import networkx as nx
 import pandas as pd
 import numpy as np
 
+from .shared_arrays import publish_arrays, attach_arrays
+
+# fee policy of the edges: fees for other payment amounts are calculated from it (see 'calculate_tx_fee')
+POLICY_KEYS = ["fee_base_msat", "fee_rate_milli_msat"]
+# fee attributes of the edges: the receiver of a payment charges no fee, so they are zero on the last hop of a path
+FEE_KEYS = ["total_fee"] + POLICY_KEYS
+
 def prepare_edges_for_simulation(edges, amount_sat, drop_disabled, drop_low_cap, time_window=None, ts_upper_bound=None, verbose=True):
     """Preprocess LN graph snapshot with different edge filters."""
     E = len(edges)
@@ -37,6 +44,8 @@ def prepare_edges_for_simulation(edges, amount_sat, drop_disabled, drop_low_cap,
     directed_aggr_edges = grouped.agg({
         "capacity":"sum",
         "total_fee":"mean",
+        "fee_base_msat":"mean",
+        "fee_rate_milli_msat":"mean",
     }).reset_index()
     if verbose:
         print("Total number of deleted directed channels:", len(edges) - len(tmp_edges))
@@ -59,67 +68,166 @@ def init_node_params(edges, providers, verbose=True):
     #get_trg_proba(node_variables, eps=0.95, active_providers)
     return node_variables, active_providers, active_ratio
 
-def generate_graph_for_path_search(edges, transactions, amount_sat):
-    """Generate pseudo edges and generate graph for path search."""
-    targets = list(transactions["target"].unique())
-    #sources = list(transactions["source"].unique())
-    #participants = set(sources).union(set(targets))
+def check_amount(amount_sat, func_name):
+    """Reject the former call shape (edges, transactions, amount_sat): the payment graph no longer depends on the transactions"""
+    if isinstance(amount_sat, pd.DataFrame):
+        raise TypeError("%s() no longer takes the transactions, call it with (edges, amount_sat)!" % func_name)
+
+def generate_graph_for_path_search(edges, amount_sat):
+    """Generate graph for path search. The path search only lets the target of a payment be its last hop, and the last hop is free (see 'find_shortest_path')."""
+    check_amount(amount_sat, "generate_graph_for_path_search")
     # drop edges with low capacity
-    edges_tmp = edges[edges["capacity"]>=amount_sat].copy()
-    # add pseudo targets
-    ps_edges = edges_tmp[edges_tmp["trg"].isin(targets)].copy()
-    ps_edges["trg"] = ps_edges["trg"].apply(lambda x: str(x) + "_trg")
-    ps_edges["total_fee"] = 0.0
-    ps_edges["fee_base_msat"] = 0.0
-    ps_edges["fee_rate_milli_msat"] = 0.0
-    # initialize transaction graph
-    all_edges = pd.concat([edges_tmp, ps_edges], sort=False)
+    edges_tmp = edges[edges["capacity"]>=amount_sat]
     # networkx versiom >= 2: from_pandas_edgelist
-    G = nx.from_pandas_edgelist(all_edges, source="src", target="trg", edge_attr=["total_fee","capacity"], create_using=nx.DiGraph())
+    edge_attr = ["total_fee","capacity"] + [key for key in POLICY_KEYS if key in edges.columns]
+    G = nx.from_pandas_edgelist(edges_tmp, source="src", target="trg", edge_attr=edge_attr, create_using=nx.DiGraph())
     return G
 
 def calculate_tx_fee(df, amount_sat):
+    """Fee of a payment from the fee policy of edges (frame, edge attributes or arrays)"""
     # first part: fee_base_msat -> fee_base_sat
     # second part: milli_msat == 10^-6 sat : fee_rate_milli_msat -> fee_rate_sat
     return df["fee_base_msat"] / 1000.0 + amount_sat * df["fee_rate_milli_msat"] / 10.0**6
 
-def init_capacities(edges, transactions, amount_sat, verbose=False):
+class CapacityState():
+    """Capacity state of directed channels stored in NumPy arrays. capacity_map[(src,trg)] returns [current_cap, total_fee, total_cap]."""
+    def __init__(self, src, trg, cap, fee, total_cap, rev=None, index=None, policy={}):
+        self.src = list(src)
+        self.trg = list(trg)
+        self.index = index if index != None else dict(zip(zip(self.src, self.trg), range(len(self.src))))
+        self.fee = np.asarray(fee, dtype=np.float64)
+        self.total_cap = np.asarray(total_cap, dtype=np.float64)
+        self.policy = {key:np.asarray(arr, dtype=np.float64) for key, arr in policy.items()}
+        if rev is None:
+            rev = np.array([self.index.get(key, -1) for key in zip(self.trg, self.src)], dtype=np.int64)
+        self.rev = rev
+        self._set_cap(np.asarray(cap, dtype=np.float64))
+
+    def _set_cap(self, cap):
+        self.cap = cap
+        # memoryviews are used for fast scalar access during path processing
+        self._cap = cap.data
+        self._fee = self.fee.data
+
+    def copy(self):
+        """Copy the current capacities while sharing the static edge arrays"""
+        H = CapacityState.__new__(CapacityState)
+        H.__dict__.update(self.__dict__)
+        H._set_cap(self.cap.copy())
+        return H
+
+    def subset(self, keep, total_cap=None):
+        """Capacity state restricted to the edges of the boolean mask 'keep'. Reverse edge indices are remapped and 'total_cap' optionally replaces the channel capacities."""
+        ids = np.where(keep)[0]
+        new_pos = np.cumsum(keep) - 1
+        rev = self.rev[ids]
+        has_rev = rev >= 0
+        has_rev[has_rev] = keep[rev[has_rev]]
+        rev = np.where(has_rev, new_pos[rev], -1)
+        total_cap = self.total_cap if total_cap is None else total_cap
+        policy = {key:arr[ids] for key, arr in self.policy.items()}
+        return CapacityState([self.src[e] for e in ids], [self.trg[e] for e in ids], self.cap[ids], self.fee[ids], total_cap[ids], rev=rev, policy=policy)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ["_cap", "_fee", "_shm"]:
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._set_cap(self.cap)
+
+    def to_shared_memory(self):
+        """Publish the capacity arrays in shared memory. It returns the block (the caller must close and unlink it) and a picklable handle."""
+        arrays = {"cap": self.cap, "fee": self.fee, "total_cap": self.total_cap, "rev": self.rev}
+        for key, arr in self.policy.items():
+            arrays["policy_" + key] = arr
+        shm, spec = publish_arrays(arrays)
+        return shm, SharedCapacityHandle(spec, self.src, self.trg)
+
+    @classmethod
+    def from_shared_memory(cls, handle):
+        """Attach to capacities published by 'to_shared_memory' without copying the arrays (they are read-only, use 'copy' before updates)"""
+        shm, arrays = attach_arrays(handle.spec)
+        policy = {key[len("policy_"):]: arr for key, arr in arrays.items() if key.startswith("policy_")}
+        C = cls(handle.src, handle.trg, arrays["cap"], arrays["fee"], arrays["total_cap"], rev=arrays["rev"], policy=policy)
+        C._shm = shm
+        return C
+
+    def edge_id(self, src, trg):
+        return self.index.get((src, trg))
+
+    ### mapping interface ###
+
+    def __getitem__(self, key):
+        e = self.index[key]
+        return [self._cap[e], self._fee[e], float(self.total_cap[e])]
+
+    def __setitem__(self, key, value):
+        e = self.index[key]
+        self._cap[e] = value[0]
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.src)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def keys(self):
+        return self.index.keys()
+
+    def items(self):
+        for e, key in enumerate(zip(self.src, self.trg)):
+            yield key, [self._cap[e], self._fee[e], float(self.total_cap[e])]
+
+class SharedCapacityHandle():
+    """Picklable reference to a capacity state published in shared memory"""
+    def __init__(self, spec, src, trg):
+        self.spec = spec
+        self.src = src
+        self.trg = trg
+
+    def attach(self):
+        return CapacityState.from_shared_memory(self)
+
+def init_capacity_structure(edges):
+    """Capacity state of the channels with zero capacities (see 'populate_capacities')"""
+    policy = {key:edges[key].values for key in POLICY_KEYS if key in edges.columns}
+    return CapacityState(edges["src"], edges["trg"], np.zeros(len(edges)), edges["total_fee"].values, edges["capacity"].values, policy=policy)
+
+def init_capacities(edges, amount_sat, verbose=False, rng=np.random):
     """Initialize capacity map for path search"""
-    tx_targets = set(transactions["target"])
-    # init capacity dict
-    keys = list(zip(edges["src"], edges["trg"]))
-    is_trg = edges["trg"].apply(lambda x: x in tx_targets)
-    # [current_cap, total_fee, is_trg, total_cap]
-    vals = [list(item) for item in zip([None]*len(edges), edges["total_fee"], is_trg, edges["capacity"])]
-    capacity_map = dict(zip(keys,vals))
-    # extract channels
-    channels = set()
-    for s, t in keys:
-        if (s,t) in channels or (t,s) in channels:
-            continue
-        else:
-            channels.add((s,t))
-    edges_with_capacity = populate_capacities(channels, capacity_map, amount_sat)
+    check_amount(amount_sat, "init_capacities")
+    capacity_map = init_capacity_structure(edges)
+    edges_with_capacity = populate_capacities(capacity_map, amount_sat, rng)
     if verbose:
         print("Edges with capacity: %i->%i" % (len(edges),len(edges_with_capacity))) 
     return capacity_map, edges_with_capacity
     
-def populate_capacities(channels, capacity_map, amount_sat):
+def populate_capacities(capacity_map, amount_sat, rng=np.random):
     """Initialize the capacity state of each channel at random"""
-    edge_records = []
-    for src, trg in channels:
-        c1 = capacity_map[(src,trg)][3]
-        if (trg,src) in capacity_map:
-            c2 = capacity_map[(trg,src)][3]
-            cap = max(c1, c2)
-            rnd = np.random.random()
-            cap1, cap2 = cap * rnd, cap * (1.0-rnd)
-            capacity_map[(trg,src)][0] = cap2
-            if cap2 >= amount_sat:
-                edge_records.append((trg, src, cap2, capacity_map[(trg,src)][1]))
-        else:
-            cap1 = c1
-        capacity_map[(src,trg)][0] = cap1
-        if cap1 >= amount_sat:
-            edge_records.append((src, trg, cap1, capacity_map[(src,trg)][1]))
-    return pd.DataFrame(edge_records, columns=["src","trg","capacity","total_fee"])
+    rev = capacity_map.rev
+    total_cap = capacity_map.total_cap
+    cap = total_cap.copy()
+    # channels with both directions: the larger capacity is split at random
+    first = np.where(rev > np.arange(len(rev)))[0]
+    second = rev[first]
+    channel_cap = np.maximum(total_cap[first], total_cap[second])
+    rnd = rng.random(len(first))
+    cap[first] = channel_cap * rnd
+    cap[second] = channel_cap * (1.0-rnd)
+    capacity_map._set_cap(cap)
+    with_capacity = np.where(cap >= amount_sat)[0]
+    edge_records = pd.DataFrame({
+        "src":[capacity_map.src[e] for e in with_capacity],
+        "trg":[capacity_map.trg[e] for e in with_capacity],
+        "capacity":cap[with_capacity],
+        "total_fee":capacity_map.fee[with_capacity],
+    })
+    for key, arr in capacity_map.policy.items():
+        edge_records[key] = arr[with_capacity]
+    return edge_records
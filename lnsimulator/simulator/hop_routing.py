@@ -0,0 +1,103 @@
+import numpy as np
+from heapq import heappush, heappop
+from itertools import count
+
+from .csr_graph import CSRGraph
+
+class HopConstrainedRouter():
+    """Cheapest loop-free path with exactly 'k' hops (at least 'k' hops if 'min_length=True')"""
+    def __init__(self, k, G, capacity_map=None, min_length=False, max_expansions=100000):
+        self.k = k
+        self.min_length = min_length
+        self.max_expansions = max_expansions
+        # the mirror must know every channel that could be restored by depletion
+        self.G = G if isinstance(G, CSRGraph) else CSRGraph.from_networkx(G, capacity_map)
+        self.mirrored = not isinstance(G, CSRGraph)
+
+    def invalidate(self, changes):
+        if not self.mirrored:
+            return
+        for change in changes:
+            if change[0] == "remove":
+                self.G.remove_edge(change[1], change[2])
+            else:
+                self.G.add_weighted_edges_from([(change[1], change[2], change[3])], weight="total_fee")
+
+    def _relax(self, bound, src, dst, fee):
+        """Minimal cost to reach the target with one more hop"""
+        new_bound = np.full(len(bound), np.inf)
+        np.minimum.at(new_bound, src, fee + bound[dst])
+        return new_bound
+
+    def _lower_bounds(self, s, t):
+        """Lower bounds of the remaining cost from each node for 0..k required hops"""
+        G = self.G
+        usable = G.active == 1
+        if len(G.excluded) > 0:
+            usable &= ~np.isin(G.src, list(G.excluded)) & ~np.isin(G.indices, list(G.excluded))
+        # the source cannot be revisited, the target can only be the last node
+        usable &= (G.indices != s) & (G.src != t)
+        src, dst = G.src[usable], G.indices[usable]
+        fee = np.where(dst == t, 0.0, G.weights["total_fee"][usable])
+        bound = np.full(len(G.nodes_list), np.inf)
+        bound[t] = 0.0
+        if self.min_length:
+            # without hop constraint: Bellman-Ford iterations until convergence
+            while True:
+                new_bound = np.minimum(bound, self._relax(bound, src, dst, fee))
+                if np.array_equal(new_bound, bound):
+                    break
+                bound = new_bound
+        bounds = [bound]
+        for _ in range(self.k):
+            bounds.append(self._relax(bounds[-1], src, dst, fee))
+        return [b.tolist() for b in bounds]
+
+    def shortest_path(self, source, target):
+        """Cheapest path with the required number of hops or None if there is no such path (or the search was stopped)"""
+        G = self.G
+        s, t = G.index.get(source), G.index.get(target)
+        if s is None or t is None:
+            return None
+        bounds = self._lower_bounds(s, t)
+        k = self.k
+        if bounds[k][s] == np.inf:
+            return None
+        indptr, indices, active, fee = G.indptr.data, G.indices.data, G.active.data, G.weights["total_fee"].data
+        excluded = G.excluded
+        c = count()
+        heap = [(bounds[k][s], next(c), 0.0, (s,))]
+        expansions = 0
+        while heap and expansions < self.max_expansions:
+            _, _, cost, path = heappop(heap)
+            v, hops = path[-1], len(path)-1
+            if v == t and (hops == k or (self.min_length and hops > k)):
+                return [G.nodes_list[i] for i in path]
+            if v == t or (hops >= k and not self.min_length):
+                continue
+            expansions += 1
+            remaining = max(k - hops - 1, 0)
+            for e in range(indptr[v], indptr[v+1]):
+                if not active[e]:
+                    continue
+                w = indices[e]
+                if w in path or w in excluded:
+                    continue
+                lb = bounds[remaining][w]
+                if lb == np.inf:
+                    continue
+                # the receiver charges no fee
+                w_cost = cost if w == t else cost + fee[e]
+                heappush(heap, (w_cost + lb, next(c), w_cost, path + (w,)))
+        return None
+
+    def run(self, route):
+        """Replace 'route' with the cheapest path with the required number of hops. It returns the cost (without the last edge), length, path and status (-1 if no path was found: then the original route is returned)."""
+        path = self.shortest_path(route[0], route[-1])
+        if path is None:
+            return self._cost(route), len(route)-1, route, -1
+        return self._cost(path), len(path)-1, path, 0
+
+    def _cost(self, route):
+        fee = self.G.weights["total_fee"]
+        return float(sum(fee[self.G._edge_id(route[i], route[i+1])] for i in range(len(route)-2)))
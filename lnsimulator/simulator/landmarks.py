@@ -0,0 +1,94 @@
+import numpy as np
+from heapq import heappush, heappop
+
+# node statistics of 'init_node_params' that landmarks can be selected by
+LANDMARK_SELECTIONS = ["degree", "total_capacity"]
+
+def select_landmarks(node_variables, num_landmarks=8, by="degree"):
+    """Hub nodes with the highest degree or total capacity (see 'init_node_params')"""
+    if not by in LANDMARK_SELECTIONS:
+        raise ValueError("Invalid landmark selection: %s (use one of %s)" % (by, LANDMARK_SELECTIONS))
+    hubs = node_variables.sort_values(by, ascending=False, kind="stable").head(num_landmarks)
+    return list(hubs["pub_key"])
+
+def _distances(N, offsets, edges, ends, cost, source):
+    """Dijkstra distances from 'source' over every edge (the edges of node v are edges[offsets[v]:offsets[v+1]])"""
+    dist = [np.inf] * N
+    done = [False] * N
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d_v, v = heappop(heap)
+        if done[v]:
+            continue
+        done[v] = True
+        for e in edges[offsets[v]:offsets[v+1]]:
+            w = ends[e]
+            vw_dist = d_v + cost[e]
+            if vw_dist < dist[w]:
+                dist[w] = vw_dist
+                heappush(heap, (vw_dist, w))
+    return dist
+
+class LandmarkIndex():
+    """Lower bounds of the payment cost from landmark distances for A* search"""
+    def __init__(self, G, landmarks, weight="total_fee"):
+        if not weight in G.weights:
+            raise ValueError("Unsupported weight for landmarks: %s" % weight)
+        self.weight = weight
+        self.nodes_list = G.nodes_list
+        self.index = G.index
+        self.landmarks = [n for n in landmarks if n in G.index]
+        N = len(G.nodes_list)
+        cost = G.weights[weight]
+        cost_list = cost.tolist()
+        indptr, indices = G.indptr.tolist(), G.indices.tolist()
+        rev_indptr, rev_edges, src = G.rev_indptr.tolist(), G.rev_edges.tolist(), G.src.tolist()
+        forward = list(range(len(indices)))
+        ids = [G.index[n] for n in self.landmarks]
+        self.dist_from = np.array([_distances(N, indptr, forward, indices, cost_list, l) for l in ids]).reshape(len(ids), N)
+        self.dist_to = np.array([_distances(N, rev_indptr, rev_edges, src, cost_list, l) for l in ids]).reshape(len(ids), N)
+        # payment to t: the closest incoming neighbor from a landmark, the farthest to a landmark
+        self.target_from = np.full((len(ids), N), np.inf)
+        self.target_to = np.full((len(ids), N), -np.inf)
+        for i in range(len(ids)):
+            np.minimum.at(self.target_from[i], G.indices, self.dist_from[i][G.src])
+            np.maximum.at(self.target_to[i], G.indices, self.dist_to[i][G.src])
+        self._cached = (None, None, None)
+        self._aligned = (None, None)
+
+    def _bounds(self, t):
+        with np.errstate(invalid="ignore"):
+            # d(v,u) >= d(L,u) - d(L,v) and d(v,u) >= d(v,L) - d(u,L) for the last router u
+            bounds = np.concatenate([self.target_from[:, t:t+1] - self.dist_from, self.dist_to - self.target_to[:, t:t+1]])
+        # no information if both distances are infinite
+        bounds[np.isnan(bounds)] = -np.inf
+        bounds = np.maximum(np.max(bounds, axis=0, initial=-np.inf), 0.0)
+        bounds[t] = 0.0
+        return bounds
+
+    def _positions(self, nodes_list):
+        """Node ids of the index for each node of 'nodes_list' (None if the order is the same)"""
+        if nodes_list is self.nodes_list:
+            return None
+        if not self._aligned[0] is nodes_list:
+            positions = None if nodes_list == self.nodes_list else np.array([self.index.get(n, -1) for n in nodes_list], dtype=np.int64)
+            self._aligned = (nodes_list, positions)
+        return self._aligned[1]
+
+    def bounds(self, target, nodes_list=None):
+        """Lower bounds of the payment cost from each node to 'target' (infinite if the target cannot be reached). The list is ordered by the node ids of the index or by 'nodes_list' (e.g. of another CSR graph)."""
+        nodes_list = self.nodes_list if nodes_list is None else nodes_list
+        if self._cached[0] == target and self._cached[1] is nodes_list:
+            return self._cached[2]
+        t = self.index.get(target)
+        if t is None:
+            bounds = [0.0] * len(nodes_list)
+        else:
+            bounds = self._bounds(t)
+            positions = self._positions(nodes_list)
+            if positions is not None:
+                bounds = np.where(positions >= 0, bounds[positions], 0.0)
+            bounds = bounds.tolist()
+        self._cached = (target, nodes_list, bounds)
+        return bounds
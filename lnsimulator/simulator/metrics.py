@@ -0,0 +1,99 @@
+import os, json, copy, time
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
+
+class SimulationMetrics():
+    """Wall time of simulation stages and counters of the path search"""
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+        self.stages = OrderedDict()
+        self.counters = Counter()
+        self.buckets = []
+        self._depth = 0
+
+    def copy(self):
+        M = copy.copy(self)
+        M.stages = copy.deepcopy(self.stages)
+        M.counters = Counter(self.counters)
+        M.buckets = list(self.buckets)
+        return M
+
+    def add_time(self, name, seconds, calls=1):
+        record = self.stages.get(name)
+        if record is None:
+            record = {"seconds":0.0, "calls":0}
+            self.stages[name] = record
+        record["seconds"] += seconds
+        record["calls"] += calls
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            if self.profiler != None and self._depth == 1:
+                with self.profiler(name):
+                    yield self
+            else:
+                yield self
+        finally:
+            self._depth -= 1
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_bucket(self, node, num_transactions, seconds, worker):
+        """Timing of a node removal bucket processed by a worker process"""
+        self.buckets.append({"node":node, "transactions":num_transactions, "seconds":seconds, "worker":worker})
+
+    def seconds(self, name):
+        return self.stages[name]["seconds"] if name in self.stages else 0.0
+
+    def worker_summary(self):
+        workers = {}
+        for bucket in self.buckets:
+            record = workers.setdefault(str(bucket["worker"]), {"buckets":0, "transactions":0, "seconds":0.0, "max_bucket_seconds":0.0})
+            record["buckets"] += 1
+            record["transactions"] += bucket["transactions"]
+            record["seconds"] += bucket["seconds"]
+            record["max_bucket_seconds"] = max(record["max_bucket_seconds"], bucket["seconds"])
+        return workers
+
+    def to_dict(self, max_buckets=20):
+        """Stage timings, counters and derived rates (transactions per second, nodes expanded per search). Only the slowest 'max_buckets' node removal buckets are listed."""
+        counters = dict(self.counters)
+        rates = {}
+        routing_time = self.seconds("routing")
+        if routing_time > 0:
+            rates["transactions_per_second"] = counters.get("transactions", 0) / routing_time
+        if counters.get("searches", 0) > 0 and "nodes_expanded" in counters:
+            rates["nodes_expanded_per_search"] = counters["nodes_expanded"] / counters["searches"]
+        removal_time = self.seconds("node_removals")
+        if removal_time > 0:
+            rates["node_removal_transactions_per_second"] = sum(b["transactions"] for b in self.buckets) / removal_time
+        slowest = sorted(self.buckets, key=lambda b: b["seconds"], reverse=True)[:max_buckets]
+        return {"stages":self.stages, "counters":counters, "rates":rates, "workers":self.worker_summary(), "slowest_buckets":slowest}
+
+    def export(self, output_dir):
+        with open("%s/metrics.json" % output_dir, "w") as fp:
+            json.dump(self.to_dict(), fp, indent=2)
+
+class CProfileHook():
+    """Profiler hook that profiles each outermost stage with cProfile. Statistics of repeated stages are accumulated and dumped to '<output_dir>/<stage>.prof'."""
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.profiles = {}
+
+    @contextmanager
+    def __call__(self, name):
+        import cProfile
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+        profiler = self.profiles.setdefault(name, cProfile.Profile())
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            profiler.dump_stats("%s/%s.prof" % (self.output_dir, name))
@@ -0,0 +1,175 @@
+import os, json, math, itertools
+import pandas as pd
+import multiprocessing
+import concurrent.futures
+
+from .transaction_simulator import TransactionSimulator, calc_optimal_base_fee
+
+# default values of the simulator parameters that are not set in the grid
+DEFAULT_PARAMS = {
+    "amount":60000,
+    "count":7000,
+    "epsilon":0.8,
+    "drop_disabled":True,
+    "drop_low_cap":True,
+    "with_depletion":True,
+    "time_window":None,
+    "seed":None,
+}
+# parameters of the edge filter: cells with the same values share the prepared edge table
+EDGE_PARAMS = ["amount", "drop_disabled", "drop_low_cap", "time_window"]
+
+def expand_grid(grid):
+    """Return the list of parameter cells for a grid specification. Grid values are lists of parameter values (or single values)."""
+    unknown = set(grid.keys()).difference(DEFAULT_PARAMS.keys())
+    if len(unknown) > 0:
+        raise ValueError("Unknown grid parameters: %s" % sorted(unknown))
+    names = list(DEFAULT_PARAMS.keys())
+    values = []
+    for name in names:
+        value = grid.get(name, DEFAULT_PARAMS[name])
+        values.append(value if isinstance(value, list) else [value])
+    cells = [dict(zip(names, combination)) for combination in itertools.product(*values)]
+    # cells with the same edge filter (and prepared graphs) are scheduled after each other
+    return sorted(cells, key=lambda cell: json.dumps([cell[name] for name in EDGE_PARAMS + ["with_depletion"]]))
+
+def cell_id(cell):
+    """Name of the output folder of a parameter cell"""
+    return "_".join("%s=%s" % (name, cell[name]) for name in DEFAULT_PARAMS.keys())
+
+def append_record(path, record, lock=None):
+    """Append a completed cell to the checkpoint file. Parallel workers write under the shared 'lock'."""
+    line = json.dumps(record) + "\n"
+    if lock != None:
+        lock.acquire()
+    try:
+        with open(path, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        if lock != None:
+            lock.release()
+
+class SweepCheckpoint():
+    """Record of the completed cells of a parameter sweep. Each completed cell is appended as one JSON line to 'completed.jsonl' in the sweep output folder."""
+    def __init__(self, output_dir):
+        self.path = "%s/completed.jsonl" % output_dir
+        self.records = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    line = line.strip()
+                    # the last line could be partial if the sweep was killed while writing
+                    if len(line) > 0:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        self.records[record["cell_id"]] = record
+
+    def is_completed(self, cell):
+        return cell_id(cell) in self.records
+
+    def add(self, record):
+        self.records[record["cell_id"]] = record
+        append_record(self.path, record)
+
+    def summary(self):
+        records = [dict(record["params"], cell_id=cell, **record["stats"]) for cell, record in self.records.items()]
+        return pd.DataFrame(records)
+
+def run_cell(simulator, output_dir, simulate_params, find_alternative_paths=True):
+    """Simulate payments for one cell and export the results (and optimal base fees) to 'output_dir'"""
+    shortest_paths, alternative_paths, all_router_fees, _ = simulator.simulate(weight="total_fee", with_node_removals=find_alternative_paths, **simulate_params)
+    total_income, total_fee = simulator.export(output_dir)
+    if find_alternative_paths:
+        opt_fees_df, p_altered = calc_optimal_base_fee(shortest_paths, alternative_paths, all_router_fees)
+        opt_fees_df.to_csv("%s/opt_fees.csv" % output_dir, index=False)
+    return {
+        "success_rate":float(simulator.transactions["success"].mean()),
+        "total_income":float(total_income["fee"].sum()),
+        "num_routers":int(len(total_income)),
+    }
+
+_sweep_state = {}
+
+def init_sweep_worker(edges, merchants, simulate_params, find_alternative_paths, checkpoint_path, lock=None):
+    """Store the sweep inputs and the checkpoint file in the worker process"""
+    _sweep_state["inputs"] = (edges, merchants, simulate_params, find_alternative_paths)
+    _sweep_state["checkpoint"] = (checkpoint_path, lock)
+    _sweep_state["edge_key"] = None
+
+def edge_key(cell):
+    """Key of the edge filter of a cell"""
+    return json.dumps([cell[name] for name in EDGE_PARAMS])
+
+def group_cells(items, max_size=None):
+    """Group (cell, output folder) items by the edge filter of the cell, keeping the order of the items. Groups larger than 'max_size' are split."""
+    groups = {}
+    for item in items:
+        groups.setdefault(edge_key(item[0]), []).append(item)
+    if max_size == None:
+        return list(groups.values())
+    return [group[i:i+max_size] for group in groups.values() for i in range(0, len(group), max_size)]
+
+def get_simulator(edges, merchants, cell):
+    """Return a simulator for the cell and whether the prepared edge table of the previous cell was reused"""
+    key = edge_key(cell)
+    reused = _sweep_state.get("edge_key") == key
+    if reused:
+        simulator = _sweep_state["simulator"].derive(count=cell["count"], epsilon=cell["epsilon"], with_depletion=cell["with_depletion"], seed=cell["seed"])
+    else:
+        simulator = TransactionSimulator(edges, merchants, cell["amount"], cell["count"], epsilon=cell["epsilon"], drop_disabled=cell["drop_disabled"], drop_low_cap=cell["drop_low_cap"], with_depletion=cell["with_depletion"], time_window=cell["time_window"], seed=cell["seed"])
+    _sweep_state["edge_key"] = key
+    _sweep_state["simulator"] = simulator
+    return simulator, reused
+
+def sweep_worker(cell_item):
+    cell, cell_dir = cell_item
+    edges, merchants, simulate_params, find_alternative_paths = _sweep_state["inputs"]
+    print("\n# Cell: %s" % cell_id(cell))
+    simulator, reused = get_simulator(edges, merchants, cell)
+    stats = run_cell(simulator, cell_dir, simulate_params, find_alternative_paths)
+    record = {"cell_id":cell_id(cell), "params":cell, "stats":stats}
+    # the cell is recorded as soon as it is finished, not when its group returns
+    checkpoint_path, lock = _sweep_state["checkpoint"]
+    append_record(checkpoint_path, record, lock)
+    return record, reused
+
+def sweep_group_worker(group):
+    """Run the cells of one edge filter group after each other, so that the prepared edge table is reused"""
+    return [sweep_worker(item) for item in group]
+
+def run_sweep(edges, merchants, grid, output_dir, max_workers=2, simulate_params={}, find_alternative_paths=True):
+    """Run the simulation for every cell of the parameter grid. Completed cells are skipped when an interrupted sweep is restarted."""
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    checkpoint = SweepCheckpoint(output_dir)
+    cells = expand_grid(grid)
+    pending = [(cell, "%s/%s" % (output_dir, cell_id(cell))) for cell in cells if not checkpoint.is_completed(cell)]
+    print("Parameter sweep: %i cells, %i completed, %i pending" % (len(cells), len(cells)-len(pending), len(pending)))
+    # node removals run in the sweep workers
+    params = dict({"max_threads":1}, **simulate_params)
+    # cells of the same edge filter share the prepared edge table, large groups are split to use every worker
+    groups = group_cells(pending, max(1, int(math.ceil(len(pending) / max(1, max_workers)))))
+    num_reused = 0
+    if max_workers > 1 and len(groups) > 1:
+        lock = multiprocessing.Lock()
+        with concurrent.futures.ProcessPoolExecutor(max_workers, initializer=init_sweep_worker, initargs=(edges, merchants, params, find_alternative_paths, checkpoint.path, lock)) as executor:
+            futures = [executor.submit(sweep_group_worker, group) for group in groups]
+            for future in concurrent.futures.as_completed(futures):
+                for record, reused in future.result():
+                    num_reused += reused
+                    checkpoint.records[record["cell_id"]] = record
+    else:
+        init_sweep_worker(edges, merchants, params, find_alternative_paths, checkpoint.path)
+        for item in pending:
+            record, reused = sweep_worker(item)
+            num_reused += reused
+            checkpoint.records[record["cell_id"]] = record
+    print("Prepared edge tables: %i for %i cells (%i reused)" % (len(pending)-num_reused, len(pending), num_reused))
+    summary = checkpoint.summary()
+    summary.to_csv("%s/sweep_summary.csv" % output_dir, index=False)
+    print("Parameter sweep DONE")
+    return summary
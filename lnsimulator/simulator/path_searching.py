@@ -1,103 +1,428 @@
+import time
 import networkx as nx
 import pandas as pd
 import numpy as np
-import copy
-from collections import Counter
+from collections import Counter, ChainMap, OrderedDict
 
 from .genetic_routing import GeneticPaymentRouter
+from .hop_routing import HopConstrainedRouter
+from .speculative_routing import SpeculativePathSearch
+from .csr_graph import CSRGraph
+from .graph_preprocessing import CapacityState, FEE_KEYS, calculate_tx_fee
 
-def get_shortest_paths(init_capacities, G_origi, transactions, hash_transactions=True, cost_prefix="", weight="total_fee", required_length=None):
-    G = G_origi.copy()# copy due to forthcoming graph capacity changes!!!
-    capacity_map = copy.deepcopy(init_capacities)
+ENGINES = ["networkx", "csr"]
+# routing of payments with 'required_length': stochastic genetic search or exact search for exactly (or at least) the required length
+LENGTH_ROUTINGS = ["genetic", "exact_length", "min_length"]
+# point-to-point search of payments: bidirectional Dijkstra or A* with landmark bounds (see 'LandmarkIndex')
+SEARCHES = ["bidirectional", "alt"]
+
+def init_search_graph(G_origi, capacity_map, engine="networkx", excluded=[]):
+    """Prepare a private copy of the graph for path search with the selected engine. Nodes in 'excluded' are hidden from the search."""
+    if isinstance(G_origi, CSRGraph):
+        # copy-on-write view: node exclusion is O(1) and only modified edge state is copied
+        return G_origi.view(excluded)
+    elif engine == "networkx":
+        if len(excluded) > 0:
+            G_origi = nx.restricted_view(G_origi, excluded, [])
+        return G_origi.copy()# copy due to forthcoming graph capacity changes!!!
+    elif engine == "csr":
+        return CSRGraph.from_networkx(G_origi, capacity_map).view(excluded)
+    else:
+        raise ValueError("Invalid path search engine: %s (use one of %s)" % (engine, ENGINES))
+
+def init_capacity_state(init_capacities):
+    """Private capacity state for path search. For array based capacities only the current capacity array is copied, while updates of a capacity dict are stored in a private layer over the initial capacities (copy-on-write)."""
+    if init_capacities is None:
+        return None
+    elif isinstance(init_capacities, CapacityState):
+        return init_capacities.copy()
+    return ChainMap({}, init_capacities)
+
+def payment_weight(weight, target, amount=None):
+    """Edge cost function of networkx for a payment to 'target'"""
+    if amount != None:
+        if weight == "total_fee":
+            return lambda u, v, d: None if d["capacity"] < amount else (0.0 if v == target else calculate_tx_fee(d, amount))
+        elif weight is None:
+            return lambda u, v, d: None if d["capacity"] < amount else 1
+        raise ValueError("Unsupported weight for payments with different amounts: %s" % weight)
+    if weight in FEE_KEYS:
+        return lambda u, v, d: 0.0 if v == target else d.get(weight, 1)
+    # every hop has the same cost as in the search without target
+    return weight
+
+def find_shortest_path(G, source, target, weight, amount=None, landmarks=None):
+    """Shortest path of a payment. The last hop is free (see 'payment_weight')."""
+    if landmarks != None:
+        if isinstance(G, CSRGraph):
+            return G.astar_path(source, target, landmarks.bounds(target, G.nodes_list), weight=weight, amount=amount)
+        bounds, index = landmarks.bounds(target), landmarks.index
+        return nx.astar_path(G, source, target, heuristic=lambda u, _: bounds[index[u]], weight=payment_weight(weight, target, amount))
+    if isinstance(G, CSRGraph):
+        return G.shortest_path(source, target, weight=weight, amount=amount)
+    else:
+        return nx.shortest_path(G, source=source, target=target, weight=payment_weight(weight, target, amount))
+
+class ShortestPathTree():
+    """Single-source shortest path tree stored with distances and predecessors"""
+    def __init__(self, source, dist, pred, final=None):
+        self.source = source
+        self.dist = dist
+        self.pred = pred
+        self.final = final
+
+    def path(self, target):
+        if self.final != None:
+            if not target in self.final or target == self.source:
+                raise nx.NetworkXNoPath("No path between %s and %s." % (self.source, target))
+            path = [target, self.final[target][1]]
+        elif not target in self.dist:
+            raise nx.NetworkXNoPath("No path between %s and %s." % (self.source, target))
+        else:
+            path = [target]
+        while path[-1] != self.source:
+            path.append(self.pred[path[-1]])
+        path.reverse()
+        return path
+
+    def affected_by(self, change, weight="total_fee"):
+        """Check whether an edge removal or (re-)addition could modify any path of the tree"""
+        if change[0] == "remove":
+            _, u, v = change
+            return self.pred.get(v) == u or (self.final != None and v in self.final and self.final[v][1] == u)
+        else:
+            _, u, v, fee = change
+            if not u in self.dist:
+                return False
+            # for other weights the lowest possible cost is assumed
+            w = fee if weight == "total_fee" else (1 if weight is None else 0.0)
+            if not v in self.dist or self.dist[u] + w < self.dist[v]:
+                return True
+            # the edge as the free last hop of a payment
+            return self.final != None and (not v in self.final or self.dist[u] < self.final[v][0])
+
+def compute_shortest_path_tree(G, source, weight, targets=None):
+    if isinstance(G, CSRGraph):
+        dist, pred, final = G.shortest_path_tree(source, weight=weight, targets=targets)
+    else:
+        pred_lists, dist = nx.dijkstra_predecessor_and_distance(G, source, weight=weight)
+        pred = {v: p[0] for v, p in pred_lists.items() if len(p) > 0}
+        final = None
+        if weight in FEE_KEYS:
+            # nodes are settled in the order of 'dist': the first predecessor with minimal distance is kept (as in the search)
+            final = {}
+            for v, d_v in dist.items():
+                for w in G._adj[v]:
+                    if (targets is None or w in targets) and (not w in final or d_v < final[w][0]):
+                        final[w] = (d_v, v)
+    return ShortestPathTree(source, dist, pred, final)
+
+class ShortestPathTreeCache():
+    """Shortest path trees of transaction sources, invalidated by edge changes"""
+    def __init__(self, G, weight, transactions, with_depletion, max_trees=256):
+        self.G = G
+        self.weight = weight
+        self.with_depletion = with_depletion
+        self.max_trees = max_trees
+        self.trees = OrderedDict()
+        self.remaining = Counter(transactions["source"])
+        if with_depletion:
+            self.targets = None
+        else:
+            self.targets = transactions.groupby("source")["target"].apply(set).to_dict()
+        self.num_trees = 0
+
+    def path(self, source, target):
+        tree = self.trees.get(source)
+        if tree is None:
+            # early stopping is only safe if the graph does not change
+            targets = None if self.targets is None else self.targets[source]
+            tree = compute_shortest_path_tree(self.G, source, self.weight, targets)
+            self.num_trees += 1
+            self.trees[source] = tree
+            if len(self.trees) > self.max_trees:
+                self.trees.popitem(last=False)
+        else:
+            self.trees.move_to_end(source)
+        self.remaining[source] -= 1
+        if self.remaining[source] == 0:
+            del self.trees[source]
+        return tree.path(target)
+
+    def invalidate(self, changes):
+        for change in changes:
+            for source in [s for s, tree in self.trees.items() if tree.affected_by(change, self.weight)]:
+                del self.trees[source]
+
+def init_length_router(length_routing, required_length, G, capacity_map, rng=np.random):
+    if length_routing == "genetic":
+        return GeneticPaymentRouter(required_length, G, rng=rng)#, router_weights)
+    elif length_routing in ["exact_length", "min_length"]:
+        return HopConstrainedRouter(required_length, G, capacity_map, min_length=(length_routing == "min_length"))
+    else:
+        raise ValueError("Invalid length routing: %s (use one of %s)" % (length_routing, LENGTH_ROUTINGS))
+
+class RoutingOptions():
+    """Path search options of the payment routing (see 'validate')"""
+    def __init__(self, weight="total_fee", required_length=None, length_routing="genetic", batch_sources=False, speculative_threads=None, min_amount=None, landmarks=None):
+        self.weight = weight
+        self.required_length = required_length
+        self.length_routing = length_routing
+        self.batch_sources = batch_sources
+        self.speculative_threads = speculative_threads
+        self.min_amount = min_amount
+        self.landmarks = landmarks
+
+    def validate(self, capacity_map=None):
+        """Raise a ValueError for unsupported combinations of the options (and of the capacity state 'capacity_map' if it is given)"""
+        if not self.length_routing in LENGTH_ROUTINGS:
+            raise ValueError("Invalid length routing: %s (use one of %s)" % (self.length_routing, LENGTH_ROUTINGS))
+        if self.speculative_threads != None and (self.batch_sources or self.required_length != None):
+            raise ValueError("Speculative routing does not support 'batch_sources' and 'required_length'!")
+        if self.min_amount != None and (self.batch_sources or self.required_length != None or self.speculative_threads != None):
+            raise ValueError("Payments with different amounts do not support 'batch_sources', 'required_length' and 'speculative_threads'!")
+        if self.min_amount != None and capacity_map != None and not isinstance(capacity_map, CapacityState):
+            raise ValueError("Payments with different amounts require an array based capacity state (see 'init_capacities')!")
+        if self.landmarks != None and (self.batch_sources or self.speculative_threads != None):
+            raise ValueError("Landmark search does not support 'batch_sources' and 'speculative_threads'!")
+        if self.landmarks != None and self.weight != self.landmarks.weight:
+            raise ValueError("Landmark bounds were computed for weight '%s', not for '%s'!" % (self.landmarks.weight, self.weight))
+        return self
+
+    def for_node_removals(self):
+        """Options of the alternative path search with a removed router: paths are searched sequentially and not extended to the required length"""
+        return RoutingOptions(self.weight, batch_sources=self.batch_sources, min_amount=self.min_amount, landmarks=self.landmarks)
+
+def get_shortest_paths(init_capacities, G_origi, transactions, hash_transactions=True, cost_prefix="", options=None, engine="networkx", excluded=[], path_table=None, rng=np.random, metrics=None):
+    """Route transactions on a private copy of the graph and the capacities (see 'route_transactions'). Without 'options' the default 'RoutingOptions' are used."""
+    start = time.perf_counter()
+    capacity_map = init_capacity_state(init_capacities)
+    G = init_search_graph(G_origi, capacity_map, engine, excluded)
+    if metrics != None:
+        metrics.add_time("search_graph_init", time.perf_counter() - start)
+    return route_transactions(capacity_map, G, transactions, hash_transactions, cost_prefix, options, path_table, rng, metrics)
+
+def route_transactions(capacity_map, G, transactions, hash_transactions=True, cost_prefix="", options=None, path_table=None, rng=np.random, metrics=None):
+    """Route transactions on a prepared search graph. The graph and the capacity state are updated in place."""
+    options = (RoutingOptions() if options is None else options).validate(capacity_map)
+    weight, required_length, length_routing = options.weight, options.required_length, options.length_routing
+    batch_sources, speculative_threads, min_amount, landmarks = options.batch_sources, options.speculative_threads, options.min_amount, options.landmarks
     with_depletion = capacity_map != None
+    tree_cache = ShortestPathTreeCache(G, weight, transactions, with_depletion) if batch_sources else None
+    speculation = SpeculativePathSearch(G, transactions, weight, speculative_threads) if speculative_threads != None else None
+    # edge changes invalidate cached shortest path trees and the state of the length router
+    edge_changes = [] if batch_sources or required_length != None or metrics != None or speculation != None else None
+    length_router = None
+    search_time, length_time, depletion_time = 0.0, 0.0, 0.0
+    num_searches, num_removals, num_additions = 0, 0, 0
+    expanded_start = getattr(G, "expanded", None)
     shortest_paths = []
     total_depletions = dict()
     router_fee_tuples = []
     hashed_transactions = {}
     genetic_rounds = []
-    for idx, row in transactions.iterrows():
-        p, cost = [], None
-        try:
-            S, T = row["source"], row["target"] + "_trg"
-            if (not S in G.nodes()) or (not T in G.nodes()):
-                shortest_paths.append((row["transaction_id"], cost, len(p)-1, p))
+    paths = None if path_table is None else path_table.empty_like()
+    if batch_sources and not with_depletion:
+        # the graph does not change: transactions of the same source are routed together
+        ordered_transactions = transactions.sort_values("source", kind="stable")
+    else:
+        ordered_transactions = transactions
+    try:
+        for idx, row in ordered_transactions.iterrows():
+            p, cost = [], None
+            try:
+                S, T = row["source"], row["target"]
+                if (not S in G) or (not T in G):
+                    shortest_paths.append(path_record(row["transaction_id"], cost, p, paths))
+                    continue
+                start = time.perf_counter()
+                try:
+                    if tree_cache != None:
+                        p = tree_cache.path(S, T)
+                    elif speculation != None:
+                        num_searches += 1
+                        p = speculation.path(S, T)
+                    else:
+                        num_searches += 1
+                        p = find_shortest_path(G, S, T, weight, None if min_amount is None else row["amount_SAT"], landmarks)
+                finally:
+                    search_time += time.perf_counter() - start
+                if required_length != None:
+                    if len(p) > 2 and len(p)-1 < required_length:
+                        # extend only non-direct short chanels!
+                        start = time.perf_counter()
+                        if length_router is None:
+                            length_router = init_length_router(length_routing, required_length, G, capacity_map, rng)
+                        if length_routing == "genetic":
+                            _, _, p_new, num_rounds = length_router.run(p, size=100, best_ratio=0.25)
+                        else:
+                            _, _, p_new, num_rounds = length_router.run(p)
+                        length_time += time.perf_counter() - start
+                        genetic_rounds.append(num_rounds)
+                        if num_rounds != -1:
+                            p = p_new
+                if row["target"] in p[:-1]:
+                    raise RuntimeError("Loop detected: %s" % row["target"])
+                start = time.perf_counter()
+                cost, router_fees, depletions = process_path(p, row["amount_SAT"], capacity_map, G,  "total_fee", with_depletion, edge_changes, min_amount)
+                if edge_changes != None and len(edge_changes) > 0:
+                    num_removals += sum(1 for change in edge_changes if change[0] == "remove")
+                    num_additions += sum(1 for change in edge_changes if change[0] == "add")
+                    if tree_cache != None:
+                        tree_cache.invalidate(edge_changes)
+                    if speculation != None:
+                        speculation.invalidate(edge_changes)
+                    if length_router != None:
+                        length_router.invalidate(edge_changes)
+                    edge_changes.clear()
+                depletion_time += time.perf_counter() - start
+                if with_depletion:
+                    for dep_node in depletions:
+                        total_depletions[dep_node] = total_depletions.get(dep_node, 0) + 1
+                routers = list(router_fees.keys())
+                router_fee_tuples += list(zip([row["transaction_id"]]*len(router_fees),router_fees.keys(),router_fees.values()))
+                if hash_transactions:
+                    for router in routers:
+                        if not router in hashed_transactions:
+                            hashed_transactions[router] = []
+                        hashed_transactions[router].append(row)
+            except nx.NetworkXNoPath:
                 continue
-            p = nx.shortest_path(G, source=S, target=T, weight=weight)
-            if required_length != None:
-                if len(p) > 2 and len(p)-1 < required_length:
-                    # extend only non-direct short chanels!
-                    gpr = GeneticPaymentRouter(required_length, G)#, router_weights)
-                    _, _, p_new, num_rounds = gpr.run(p, size=100, best_ratio=0.25)
-                    genetic_rounds.append(num_rounds)
-                    if num_rounds != -1:
-                        p = p_new
-            if row["target"] in p:
-                raise RuntimeError("Loop detected: %s" % row["target"])
-            cost, router_fees, depletions = process_path(p, row["amount_SAT"], capacity_map, G,  "total_fee", with_depletion)
-            if with_depletion:
-                for dep_node in depletions:
-                    total_depletions[dep_node] = total_depletions.get(dep_node, 0) + 1
-            routers = list(router_fees.keys())
-            router_fee_tuples += list(zip([row["transaction_id"]]*len(router_fees),router_fees.keys(),router_fees.values()))
-            if hash_transactions:
-                for router in routers:
-                    if not router in hashed_transactions:
-                        hashed_transactions[router] = []
-                    hashed_transactions[router].append(row)
-        except nx.NetworkXNoPath:
-            continue
-        except:
-            raise
-        finally:
-            shortest_paths.append((row["transaction_id"], cost, len(p)-1, p))
+            except:
+                raise
+            finally:
+                shortest_paths.append(path_record(row["transaction_id"], cost, p, paths))
+    finally:
+        # stop the speculative search workers even if routing fails
+        if speculation != None:
+            speculation.close()
     if hash_transactions:
         for node in hashed_transactions:
             hashed_transactions[node] = pd.DataFrame(hashed_transactions[node], columns=transactions.columns)
     elif required_length!=None:
         cnt = Counter(genetic_rounds)
         print(cnt.most_common())
+    if metrics != None:
+        if tree_cache != None:
+            num_searches += tree_cache.num_trees
+        metrics.add_time("path_search", search_time, num_searches)
+        metrics.add_time("depletion_updates", depletion_time, len(transactions))
+        if len(genetic_rounds) > 0:
+            metrics.add_time("length_routing", length_time, len(genetic_rounds))
+            metrics.count("length_routing_failures", genetic_rounds.count(-1))
+        metrics.count("transactions", len(transactions))
+        metrics.count("searches", num_searches)
+        metrics.count("edge_removals", num_removals)
+        metrics.count("edge_additions", num_additions)
+        if speculation != None:
+            metrics.count("speculative_batches", speculation.num_batches)
+            metrics.count("speculative_conflicts", speculation.num_conflicts)
+        if expanded_start != None:
+            metrics.count("nodes_expanded", G.expanded - expanded_start)
     all_router_fees = pd.DataFrame(router_fee_tuples, columns=["transaction_id","node","fee"])
-    return pd.DataFrame(shortest_paths, columns=["transaction_id", cost_prefix+"cost", "length", "path"]), hashed_transactions,  all_router_fees, total_depletions
+    columns = ["transaction_id", cost_prefix+"cost", "length"]
+    shortest_paths = pd.DataFrame(shortest_paths, columns=columns if paths != None else columns + ["path"])
+    if ordered_transactions is not transactions:
+        order = transaction_order(shortest_paths, transactions)
+        shortest_paths = shortest_paths.iloc[order].reset_index(drop=True)
+        if paths != None:
+            paths = paths.take(order)
+        all_router_fees = restore_transaction_order(all_router_fees, transactions).reset_index(drop=True)
+        for node in hashed_transactions:
+            hashed_transactions[node] = restore_transaction_order(hashed_transactions[node], transactions)
+    if paths != None:
+        path_table.extend(paths)
+        all_router_fees["node"] = pd.Categorical.from_codes([path_table.encode(n) for n in all_router_fees["node"]], categories=path_table.nodes)
+    return shortest_paths, hashed_transactions,  all_router_fees, total_depletions
+
+def path_record(transaction_id, cost, path, path_table=None):
+    if path_table != None:
+        path_table.add(path)
+        return (transaction_id, cost, len(path)-1)
+    return (transaction_id, cost, len(path)-1, path)
+
+def transaction_order(df, transactions):
+    """Positions that sort records by the position of their transaction in 'transactions'"""
+    positions = pd.Series(np.arange(len(transactions)), index=transactions["transaction_id"].values)
+    return np.argsort(df["transaction_id"].map(positions).values, kind="stable")
 
-def process_path(path, amount_in_satoshi, capacity_map, G, weight, with_depletion):
+def restore_transaction_order(df, transactions):
+    """Reorder records by the position of their transaction in 'transactions'"""
+    return df.iloc[transaction_order(df, transactions)]
+
+def process_path(path, amount_in_satoshi, capacity_map, G, weight, with_depletion, changes=None, min_amount=None):
+    """Router fees and channel depletions of a payment"""
     routers = {}
     depletions = []
     N = len(path)
     for i in range(N-2):
         n1, n2 = path[i], path[i+1]
-        routers[n2] = G[n1][n2][weight]
+        routers[n2] = G[n1][n2][weight] if min_amount is None else calculate_tx_fee(G[n1][n2], amount_in_satoshi)
         if with_depletion:
-            n2_removed = process_forward_edge(capacity_map, G, amount_in_satoshi, n1, n2)
+            n2_removed = process_forward_edge(capacity_map, G, amount_in_satoshi, n1, n2, changes, min_amount)
             if n2_removed:
                 depletions.append(n2)
-            process_backward_edge(capacity_map, G, amount_in_satoshi, n2, n1)
-    # last node in path is always a pseudo node
-    n1, n2 = path[N-2], path[N-1].replace("_trg","")
+            process_backward_edge(capacity_map, G, amount_in_satoshi, n2, n1, changes, min_amount)
+    # last hop: the receiver charges no fee
+    n1, n2 = path[N-2], path[N-1]
     if with_depletion:
-        n2_removed = process_forward_edge(capacity_map, G, amount_in_satoshi, n1, n2)
+        n2_removed = process_forward_edge(capacity_map, G, amount_in_satoshi, n1, n2, changes, min_amount)
         if n2_removed:
             depletions.append(n2)
-        process_backward_edge(capacity_map, G, amount_in_satoshi, n2, n1)
+        process_backward_edge(capacity_map, G, amount_in_satoshi, n2, n1, changes, min_amount)
     return np.sum(list(routers.values())), routers, depletions
 
-def process_forward_edge(capacity_map, G, amount_in_satoshi, src, trg):
+def store_edge_capacity(capacity_map, G, e):
+    """Store the current capacity of a channel in the graph. Fee policy is restored for re-added networkx edges."""
+    src, trg, cap = capacity_map.src[e], capacity_map.trg[e], capacity_map._cap[e]
+    if isinstance(G, CSRGraph):
+        G.set_edge_weight(src, trg, "capacity", cap)
+    elif G.has_edge(src, trg):
+        G[src][trg].update({key:arr[e] for key, arr in capacity_map.policy.items()}, capacity=cap)
+
+def process_forward_edge(capacity_map, G, amount_in_satoshi, src, trg, changes=None, min_amount=None):
     removed = False
-    cap, fee, is_trg, total_cap = capacity_map[(src,trg)]
+    if isinstance(capacity_map, CapacityState):
+        e = capacity_map.index[(src,trg)]
+        cap = capacity_map._cap[e]
+    else:
+        cap, fee, total_cap = capacity_map[(src,trg)]
     if cap < amount_in_satoshi:
         raise RuntimeError("forward %i: %s-%s" % (cap,src,trg))
-    if cap < 2*amount_in_satoshi: # cannot route more transactions
+    threshold = amount_in_satoshi if min_amount is None else min_amount
+    if cap < amount_in_satoshi + threshold: # cannot route more transactions
         removed = True
         G.remove_edge(src, trg)
-        if is_trg:
-            G.remove_edge(src, trg+'_trg')
-    capacity_map[(src,trg)] = [cap-amount_in_satoshi, fee, is_trg, total_cap]
+        if changes != None:
+            changes.append(("remove", src, trg))
+    if isinstance(capacity_map, CapacityState):
+        capacity_map._cap[e] = cap-amount_in_satoshi
+        if min_amount != None and not removed:
+            store_edge_capacity(capacity_map, G, e)
+    else:
+        capacity_map[(src,trg)] = [cap-amount_in_satoshi, fee, total_cap]
     return removed
     
-def process_backward_edge(capacity_map, G, amount_in_satoshi, src, trg):
-    if (src,trg) in capacity_map:
-        cap, fee, is_trg, total_cap = capacity_map[(src,trg)]
+def process_backward_edge(capacity_map, G, amount_in_satoshi, src, trg, changes=None, min_amount=None):
+    if isinstance(capacity_map, CapacityState):
+        e = capacity_map.index.get((src,trg))
+        if e is None:
+            return
+        cap, fee = capacity_map._cap[e], capacity_map._fee[e]
+        restored = cap < (amount_in_satoshi if min_amount is None else min_amount)
+        if restored: # it can route transactions again
+            update_backward_edge(G, src, trg, fee, changes)
+        capacity_map._cap[e] = cap+amount_in_satoshi
+        if min_amount != None or (restored and not isinstance(G, CSRGraph)):
+            store_edge_capacity(capacity_map, G, e)
+    elif (src,trg) in capacity_map:
+        cap, fee, total_cap = capacity_map[(src,trg)]
         if cap < amount_in_satoshi: # it can route transactions again
-            G.add_weighted_edges_from([(src,trg,fee)], weight="total_fee")
-            if is_trg:
-                G.add_weighted_edges_from([(src,trg+'_trg',0.0)], weight="total_fee")
-        capacity_map[(src,trg)] = [cap+amount_in_satoshi, fee, is_trg, total_cap]
+            update_backward_edge(G, src, trg, fee, changes)
+        capacity_map[(src,trg)] = [cap+amount_in_satoshi, fee, total_cap]
+
+def update_backward_edge(G, src, trg, fee, changes=None):
+    """Restore a depleted edge in the search graph"""
+    G.add_weighted_edges_from([(src,trg,fee)], weight="total_fee")
+    if changes != None:
+        changes.append(("add", src, trg, fee))
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+from array import array
+
+FILE_FORMATS = ["csv", "parquet", "feather"]
+
+class PathTable():
+    """Columnar storage of payment paths: node ids of all paths in one int32 array with offsets"""
+    def __init__(self, nodes=None):
+        self.nodes = [] if nodes is None else list(nodes)
+        self.node_ids = dict(zip(self.nodes, range(len(self.nodes))))
+        self._path_nodes = array("i")
+        self._offsets = array("q", [0])
+
+    @classmethod
+    def from_paths(cls, paths, nodes=None):
+        table = cls(nodes)
+        for p in paths:
+            table.add(p)
+        return table
+
+    def encode(self, node):
+        idx = self.node_ids.get(node)
+        if idx is None:
+            idx = len(self.nodes)
+            self.node_ids[node] = idx
+            self.nodes.append(node)
+        return idx
+
+    def add(self, path):
+        self._path_nodes.extend([self.encode(n) for n in path])
+        self._offsets.append(len(self._path_nodes))
+
+    @property
+    def path_nodes(self):
+        return np.frombuffer(self._path_nodes, dtype=np.int32) if len(self._path_nodes) > 0 else np.zeros(0, dtype=np.int32)
+
+    @property
+    def offsets(self):
+        return np.frombuffer(self._offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return [self.nodes[idx] for idx in self._path_nodes[self._offsets[i]:self._offsets[i+1]]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_lists(self):
+        return list(self)
+
+    def empty_like(self):
+        """Empty table that shares the node dictionary of this table"""
+        table = PathTable()
+        table.nodes, table.node_ids = self.nodes, self.node_ids
+        return table
+
+    def take(self, indices):
+        """Return a new table (with shared node dictionary) with the paths at the given positions"""
+        indices = np.asarray(indices, dtype=np.int64)
+        offsets = self.offsets
+        starts, lengths = offsets[indices], offsets[indices+1] - offsets[indices]
+        new_offsets = np.zeros(len(indices)+1, dtype=np.int64)
+        new_offsets[1:] = np.cumsum(lengths)
+        positions = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+        table = self.empty_like()
+        table._path_nodes = array("i", self.path_nodes[positions].tobytes())
+        table._offsets = array("q", new_offsets.tobytes())
+        return table
+
+    def extend(self, other):
+        """Append the paths of a table with shared node dictionary"""
+        if other.nodes is not self.nodes:
+            raise ValueError("Path tables must share their node dictionary")
+        base = len(self._path_nodes)
+        self._path_nodes.extend(other._path_nodes)
+        self._offsets.extend(array("q", (other.offsets[1:] + base).tobytes()))
+
+    def to_arrow(self):
+        """Paths as an Arrow list array of node ids (no copy of the id buffer)"""
+        import pyarrow as pa
+        return pa.LargeListArray.from_arrays(pa.array(self.offsets), pa.array(self.path_nodes))
+
+    def nodes_frame(self):
+        return pd.DataFrame({"node_id":np.arange(len(self.nodes), dtype=np.int32), "pub_key":self.nodes})
+
+def check_file_format(file_format):
+    """Validate the export file format. Parquet and Feather (Arrow IPC) files require the optional pyarrow dependency."""
+    if not file_format in FILE_FORMATS:
+        raise ValueError("Invalid file format: %s (use one of %s)" % (file_format, FILE_FORMATS))
+    if file_format != "csv":
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("Exporting to '%s' requires pyarrow: pip install lnsimulator[arrow]" % file_format)
+
+def write_table(df, path_prefix, file_format):
+    """Write a DataFrame (or Arrow table) in the given file format. The file extension is appended to 'path_prefix'."""
+    check_file_format(file_format)
+    fp = "%s.%s" % (path_prefix, file_format)
+    if file_format == "csv":
+        df.to_csv(fp, index=False)
+        return fp
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+    table = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df, preserve_index=False)
+    if file_format == "parquet":
+        pq.write_table(table, fp)
+    else:
+        feather.write_feather(table, fp)
+    return fp
+
+def paths_to_arrow(shortest_paths, path_table=None):
+    """Arrow table of path records where the 'path' column holds lists of node ids"""
+    import pyarrow as pa
+    if path_table is None:
+        path_table = PathTable.from_paths(shortest_paths["path"])
+    records = shortest_paths.drop(columns=["path"], errors="ignore")
+    table = pa.Table.from_pandas(records, preserve_index=False)
+    return table.append_column("path", path_table.to_arrow()), path_table
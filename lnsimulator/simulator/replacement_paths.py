@@ -0,0 +1,183 @@
+import numpy as np
+import pandas as pd
+from heapq import heappush, heappop
+from collections import OrderedDict
+
+from .csr_graph import CSRGraph
+from .graph_preprocessing import FEE_KEYS
+
+class BackwardSearch():
+    """Resumable Dijkstra search towards a target node along incoming edges"""
+    def __init__(self, adjacency, t, free_last_hop=False):
+        self.indptr, self.ends, self.cost = adjacency
+        N = len(self.indptr) - 1
+        self.dist, self.succ = [np.inf]*N, [-1]*N
+        self.done = [False]*N
+        self.free_last_hop = free_last_hop
+        self.t = t
+        self.dist[t] = 0.0
+        self.heap = [(0.0, t)]
+        self.radius = 0.0
+
+    def settle(self, v):
+        """Continue the search until 'v' is settled (or every reachable node is settled)"""
+        indptr, ends, cost = self.indptr, self.ends, self.cost
+        dist, succ, done, heap = self.dist, self.succ, self.done, self.heap
+        while not done[v] and heap:
+            d_u, u = heappop(heap)
+            if done[u]:
+                continue
+            done[u] = True
+            self.radius = d_u
+            free = self.free_last_hop and u == self.t
+            for pos in range(indptr[u], indptr[u+1]):
+                w = ends[pos]
+                wu_dist = d_u + (0.0 if free else cost[pos])
+                if wu_dist < dist[w]:
+                    dist[w] = wu_dist
+                    succ[w] = u
+                    heappush(heap, (wu_dist, w))
+        if not heap:
+            self.radius = np.inf
+
+    def lower_bound(self, v):
+        """Distance of a settled node, otherwise the radius of the search"""
+        return self.dist[v] if self.done[v] else self.radius
+
+    def passes(self, v, r):
+        """Check whether the shortest path of a settled node 'v' to the target passes through 'r'"""
+        succ = self.succ
+        while v != -1:
+            if v == r:
+                return True
+            v = succ[v]
+        return False
+
+class ReplacementPathSearch():
+    """Cheapest alternative paths of a payment that avoid one of the routers of its original path"""
+    def __init__(self, G, weight="total_fee", max_trees=256):
+        self.G = G if isinstance(G, CSRGraph) else CSRGraph.from_networkx(G)
+        self.weight = weight
+        self.max_trees = max_trees
+        self.trees = OrderedDict()
+        self._init_adjacency()
+
+    def _init_adjacency(self):
+        G = self.G
+        N = len(G.nodes_list)
+        usable = G.active == 1
+        if len(G.excluded) > 0:
+            excluded = list(G.excluded)
+            usable &= ~np.isin(G.src, excluded) & ~np.isin(G.indices, excluded)
+        cost = np.ones(len(G.indices)) if self.weight is None else np.asarray(G.weights[self.weight])
+        src, dst, cost = G.src[usable], G.indices[usable], cost[usable]
+        self.adjacency = []
+        for ends, others in [(src, dst), (dst, src)]:
+            order = np.argsort(ends, kind="stable")
+            indptr = np.concatenate([[0], np.cumsum(np.bincount(ends, minlength=N))])
+            self.adjacency.append((indptr.tolist(), others[order].tolist(), cost[order].tolist()))
+
+    def _tree(self, target):
+        tree = self.trees.get(target)
+        if tree is None:
+            tree = BackwardSearch(self.adjacency[1], self.G.index[target], self.weight in FEE_KEYS)
+            self.trees[target] = tree
+            if len(self.trees) > self.max_trees:
+                self.trees.popitem(last=False)
+        else:
+            self.trees.move_to_end(target)
+        return tree
+
+    def alternative_paths(self, source, target, routers):
+        """Cheapest path from 'source' to 'target' avoiding each node in 'routers'. If there is no such path, an empty path is returned."""
+        G = self.G
+        s, t = G.index.get(source), G.index.get(target)
+        if s is None or t is None:
+            return [[] for _ in routers]
+        tree = self._tree(target)
+        tree.settle(s)
+        if tree.dist[s] == np.inf:
+            return [[] for _ in routers]
+        indptr, ends, cost = self.adjacency[0]
+        free_last_hop = self.weight in FEE_KEYS
+        paths = []
+        for router in routers:
+            r = G.index[router]
+            # A* search: the first settled node with a tree path avoiding the router is on the cheapest alternative path
+            pred, done = {s:-1}, set()
+            best = {s:0.0}
+            heap = [(tree.dist[s], 0.0, s)]
+            meet = -1
+            while heap:
+                key, d_v, v = heappop(heap)
+                if v in done:
+                    continue
+                # lower bounds grow as the tree is extended
+                tree.settle(v)
+                if tree.dist[v] == np.inf:
+                    continue
+                if d_v + tree.dist[v] > key:
+                    heappush(heap, (d_v + tree.dist[v], d_v, v))
+                    continue
+                if not tree.passes(v, r):
+                    meet = v
+                    break
+                done.add(v)
+                for pos in range(indptr[v], indptr[v+1]):
+                    w = ends[pos]
+                    if w == r or w in done:
+                        continue
+                    h_w = tree.lower_bound(w)
+                    if h_w == np.inf:
+                        continue
+                    vw_dist = d_v + (0.0 if free_last_hop and w == t else cost[pos])
+                    if vw_dist < best.get(w, np.inf):
+                        best[w] = vw_dist
+                        pred[w] = v
+                        heappush(heap, (vw_dist + h_w, vw_dist, w))
+            if meet == -1:
+                paths.append([])
+                continue
+            path = [meet]
+            while pred[path[-1]] != -1:
+                path.append(pred[path[-1]])
+            path.reverse()
+            while path[-1] != t:
+                path.append(tree.succ[path[-1]])
+            paths.append([G.nodes_list[v] for v in path])
+        return paths
+
+def replacement_path_tasks(hashed_transactions):
+    """Source, target and the list of routers of each transaction in the router buckets (see 'get_shortest_paths'), ordered by target"""
+    tasks = OrderedDict()
+    for node, bucket in hashed_transactions.items():
+        for tx_id, source, target in zip(bucket["transaction_id"], bucket["source"], bucket["target"]):
+            if not tx_id in tasks:
+                tasks[tx_id] = (tx_id, source, target, [])
+            tasks[tx_id][3].append(node)
+    tasks = pd.DataFrame(list(tasks.values()), columns=["transaction_id", "source", "target", "routers"])
+    return tasks.sort_values("target", kind="stable")
+
+def get_replacement_paths(G, tasks, weight="total_fee", search=None):
+    """Alternative path of each transaction in 'tasks' (see 'replacement_path_tasks') for the removal of each of its routers. The cost of the paths is calculated as in 'process_path'."""
+    from .path_searching import process_path
+    if search is None:
+        search = ReplacementPathSearch(G, weight)
+    records = []
+    for row in tasks.itertuples():
+        paths = search.alternative_paths(row.source, row.target, row.routers)
+        for node, p in zip(row.routers, paths):
+            cost = process_path(p, 0, None, G, "total_fee", False)[0] if len(p) > 0 else None
+            records.append((row.transaction_id, node, cost, len(p)-1, p))
+    return pd.DataFrame(records, columns=["transaction_id", "node", "cost", "length", "path"])
+
+def order_by_buckets(alternative_paths, hashed_transactions, cost_prefix=""):
+    """Records in the order (and format) of the node removal search: bucket by bucket, transactions in the order of the bucket"""
+    keys = pd.DataFrame({
+        "transaction_id":np.concatenate([bucket["transaction_id"].values for bucket in hashed_transactions.values()]),
+        "node":np.concatenate([[node]*len(bucket) for node, bucket in hashed_transactions.items()]),
+    })
+    merged = keys.merge(alternative_paths, on=["transaction_id", "node"], how="left")
+    merged.index = np.concatenate([np.arange(len(bucket)) for bucket in hashed_transactions.values()])
+    merged = merged.rename({"cost":cost_prefix+"cost"}, axis=1)
+    return merged[["transaction_id", cost_prefix+"cost", "length", "path", "node"]]
@@ -0,0 +1,110 @@
+import networkx as nx
+import pandas as pd
+from collections import OrderedDict, Counter
+
+from .graph_preprocessing import CapacityState
+from .csr_graph import CSRGraph
+from .path_searching import init_capacity_state, init_search_graph, find_shortest_path, compute_shortest_path_tree, process_path, update_backward_edge, store_edge_capacity
+
+class RouteOracle():
+    """Cheapest routes of single payments on a prepared payment graph"""
+    def __init__(self, G, capacity_map=None, amount_sat=None, weight="total_fee", engine="csr", max_trees=256, min_tree_queries=2, landmarks=None):
+        if capacity_map != None and amount_sat is None:
+            raise ValueError("Set 'amount_sat' to track channel capacities!")
+        self.capacity_map = init_capacity_state(capacity_map)
+        self.G = init_search_graph(G, self.capacity_map, engine)
+        self.amount = amount_sat
+        self.weight = weight
+        self.landmarks = landmarks
+        self.max_trees = max_trees
+        self.min_tree_queries = min_tree_queries
+        self.trees = OrderedDict()
+        self.queries = Counter()
+        self.num_trees = 0
+        self.num_invalidated = 0
+
+    def tree(self, source):
+        tree = self.trees.get(source)
+        if tree is None:
+            tree = compute_shortest_path_tree(self.G, source, self.weight)
+            self.num_trees += 1
+            self.trees[source] = tree
+            if len(self.trees) > self.max_trees:
+                self.trees.popitem(last=False)
+        else:
+            self.trees.move_to_end(source)
+        return tree
+
+    def route(self, source, target, use_tree=None):
+        """Cost, router fees and path of the cheapest route. Raises 'NetworkXNoPath' if the target cannot be reached."""
+        for node in [source, target]:
+            if not node in self.G:
+                raise nx.NodeNotFound("Node %s is not in the graph" % node)
+        if source == target:
+            raise nx.NetworkXNoPath("Payments to the source itself are not routed")
+        self.queries[source] += 1
+        if use_tree is None:
+            use_tree = source in self.trees or self.queries[source] >= self.min_tree_queries
+        if use_tree:
+            p = self.tree(source).path(target)
+        else:
+            p = find_shortest_path(self.G, source, target, self.weight, landmarks=self.landmarks)
+        cost, router_fees, _ = process_path(p, 0, None, self.G, self.weight, False)
+        return cost, router_fees, p
+
+    def routes(self, queries):
+        """Cheapest routes for a frame (or list of pairs) of 'source' and 'target' nodes"""
+        if not isinstance(queries, pd.DataFrame):
+            queries = pd.DataFrame(list(queries), columns=["source","target"])
+        records = [None] * len(queries)
+        positions = pd.Series(range(len(queries))).groupby(queries["source"].values, sort=False)
+        for source, group in positions:
+            for i in group.values:
+                target = queries["target"].iloc[i]
+                try:
+                    cost, router_fees, p = self.route(source, target, True if len(group) >= self.min_tree_queries else None)
+                    records[i] = (source, target, cost, len(p)-1, router_fees, p)
+                except (nx.NetworkXNoPath, nx.NodeNotFound):
+                    records[i] = (source, target, None, -1, {}, [])
+        return pd.DataFrame(records, columns=["source","target","cost","length","router_fees","path"])
+
+    def invalidate(self, changes):
+        """Drop the cached trees that could be modified by the edge changes (see 'process_path')"""
+        for change in changes:
+            for source in [s for s, tree in self.trees.items() if tree.affected_by(change, self.weight)]:
+                del self.trees[source]
+                self.num_invalidated += 1
+
+    def pay(self, source, target):
+        """Route a payment of 'amount_sat' on the cheapest path and deplete the channel capacities along the path. It returns the same values as 'route'."""
+        if self.capacity_map is None:
+            raise ValueError("Payments can only be executed with a capacity map!")
+        cost, router_fees, p = self.route(source, target)
+        changes = []
+        process_path(p, self.amount, self.capacity_map, self.G, self.weight, True, changes)
+        self.invalidate(changes)
+        return cost, router_fees, p
+
+    def update_capacity(self, src, trg, capacity):
+        """Set the available capacity of the directed channel 'src'->'trg'. The channel is removed from (or restored in) the graph if it can no longer (or can again) route the payment amount."""
+        if self.capacity_map is None:
+            raise ValueError("Capacities can only be updated with a capacity map!")
+        cap, fee, total_cap = self.capacity_map[(src,trg)]
+        changes = []
+        restored = False
+        if cap >= self.amount and capacity < self.amount:
+            self.G.remove_edge(src, trg)
+            changes.append(("remove", src, trg))
+        elif cap < self.amount and capacity >= self.amount:
+            update_backward_edge(self.G, src, trg, fee, changes)
+            restored = True
+        if isinstance(self.capacity_map, CapacityState):
+            e = self.capacity_map.index[(src,trg)]
+            self.capacity_map._cap[e] = capacity
+            # restored networkx edges get their capacity and fee policy back (see 'process_backward_edge')
+            if restored and not isinstance(self.G, CSRGraph):
+                store_edge_capacity(self.capacity_map, self.G, e)
+        else:
+            self.capacity_map[(src,trg)] = [capacity, fee, total_cap]
+        self.invalidate(changes)
+        return changes
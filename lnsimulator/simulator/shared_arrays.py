@@ -0,0 +1,37 @@
+import numpy as np
+
+ALIGNMENT = 64
+
+def has_shared_memory():
+    """Shared memory blocks require Python >= 3.8, otherwise arrays are sent to worker processes by pickling"""
+    try:
+        from multiprocessing import shared_memory
+        return True
+    except ImportError:
+        return False
+
+def publish_arrays(arrays):
+    """Copy NumPy arrays into a single shared memory block. It returns the block (owned by the caller, who must unlink it) and a picklable layout for 'attach_arrays'."""
+    from multiprocessing import shared_memory
+    layout, offset = [], 0
+    for key, arr in arrays.items():
+        offset = (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+        layout.append((key, arr.dtype.str, arr.shape, offset))
+        offset += arr.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for (key, dtype, shape, off) in layout:
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=off)[...] = arrays[key]
+    return shm, (shm.name, layout)
+
+def attach_arrays(spec):
+    """Attach to a shared memory block created by 'publish_arrays'. Arrays are read-only views (no copy) that are valid while the returned block is referenced."""
+    from multiprocessing import shared_memory
+    name, layout = spec
+    # worker processes share the resource tracker of the creator process that unlinks the block
+    shm = shared_memory.SharedMemory(name=name)
+    arrays = {}
+    for key, dtype, shape, off in layout:
+        arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=off)
+        arr.flags.writeable = False
+        arrays[key] = arr
+    return shm, arrays
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+from .graph_preprocessing import POLICY_KEYS, prepare_edges_for_simulation
+
+# columns of the directed edges that the simulation depends on
+DELTA_COLUMNS = ["capacity", "disabled"] + POLICY_KEYS
+
+class SnapshotDelta():
+    """Added, removed and changed directed edges of two preprocessed snapshots"""
+    def __init__(self, added, removed, changed, rows):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.rows = rows
+        pairs = pd.concat([part[["src","trg"]] for part in [added, removed, changed]])
+        self.pairs = pairs.drop_duplicates().reset_index(drop=True)
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+    def summary(self):
+        return {"added":len(self.added), "removed":len(self.removed), "changed":len(self.changed), "pairs":len(self.pairs)}
+
+def diff_snapshots(old_edges, new_edges, columns=DELTA_COLUMNS):
+    """Added, removed and changed directed edges between two preprocessed edge tables. Only the 'columns' that are present in both tables are compared (e.g. add 'last_update' for simulations with 'time_window')."""
+    keys = ["channel_id","src","trg"] if "channel_id" in old_edges.columns and "channel_id" in new_edges.columns else ["src","trg"]
+    compared = [col for col in columns if col in old_edges.columns and col in new_edges.columns]
+    old_part = old_edges[keys + compared].assign(old_pos=np.arange(len(old_edges)))
+    new_part = new_edges[keys + compared].assign(new_pos=np.arange(len(new_edges)))
+    merged = old_part.merge(new_part, on=keys, how="outer", suffixes=("_old","_new"))
+    both = (merged["old_pos"].notnull() & merged["new_pos"].notnull()).values
+    modified = np.zeros(len(merged), dtype=np.bool_)
+    for col in compared:
+        old_values, new_values = merged[col + "_old"], merged[col + "_new"]
+        modified |= both & ~((old_values == new_values) | (old_values.isnull() & new_values.isnull())).values
+    positions = lambda mask, col: np.sort(merged.loc[mask, col].values.astype(np.int64))
+    added = new_edges.iloc[positions(merged["old_pos"].isnull().values, "new_pos")]
+    removed = old_edges.iloc[positions(merged["new_pos"].isnull().values, "old_pos")]
+    changed = new_edges.iloc[positions(modified, "new_pos")]
+    delta = SnapshotDelta(added, removed, changed, None)
+    pair_rows = new_edges[["src","trg"]].assign(new_pos=np.arange(len(new_edges))).merge(delta.pairs, on=["src","trg"])
+    delta.rows = new_edges.iloc[np.sort(pair_rows["new_pos"].values)]
+    return delta
+
+def apply_edge_delta(edges, delta, amount_sat, drop_disabled, drop_low_cap):
+    """Update a prepared edge table (see 'prepare_edges_for_simulation') with a snapshot delta"""
+    pair_index = delta.pairs.set_index(["src","trg"]).index
+    affected = edges.set_index(["src","trg"]).index.isin(pair_index)
+    updated = prepare_edges_for_simulation(delta.rows, amount_sat, drop_disabled, drop_low_cap, verbose=False)
+    updated = updated[edges.columns].astype(edges.dtypes.to_dict())
+    # pairs are in the order of the aggregation (sorted by 'src' and 'trg')
+    new_edges = pd.concat([edges[~affected], updated]).sort_values(["src","trg"], kind="stable").reset_index(drop=True)
+    return new_edges, edges[affected], updated
+
+def update_node_params(node_variables, edges, old_rows, new_rows):
+    """Update the node parameters (see 'init_node_params') after edges of the prepared table were replaced"""
+    stats = node_variables.set_index("pub_key")[["degree","total_capacity"]]
+    for sign, rows in [(-1, old_rows), (1, new_rows)]:
+        for col in ["src","trg"]:
+            grouped = rows.groupby(col)["capacity"].agg(["size","sum"])
+            grouped.columns = ["degree","total_capacity"]
+            stats = stats.add(sign * grouped, fill_value=0)
+    order = pd.unique(np.column_stack([edges["src"].values, edges["trg"].values]).ravel())
+    stats = stats.reindex(order)
+    node_variables = pd.DataFrame({
+        "pub_key":order,
+        "degree":stats["degree"].values.astype(node_variables["degree"].dtype),
+        "total_capacity":stats["total_capacity"].values.astype(edges["capacity"].dtype),
+    })
+    return node_variables
+
+def update_search_graph(G, old_rows, new_rows, amount_sat):
+    """Replace the edges 'old_rows' of a networkx payment graph with 'new_rows' in place"""
+    touched = set()
+    for src, trg in zip(old_rows["src"], old_rows["trg"]):
+        if G.has_edge(src, trg):
+            G.remove_edge(src, trg)
+            touched.update([src, trg])
+    attrs = ["total_fee","capacity"] + [key for key in POLICY_KEYS if key in new_rows.columns]
+    for row in new_rows[new_rows["capacity"] >= amount_sat].itertuples(index=False):
+        data = {key:getattr(row, key) for key in attrs}
+        G.add_edge(row.src, row.trg, **data)
+    G.remove_nodes_from([node for node in touched if G.degree(node) == 0])
+    return G
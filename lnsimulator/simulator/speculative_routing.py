@@ -0,0 +1,142 @@
+import multiprocessing
+import networkx as nx
+import numpy as np
+
+from .csr_graph import CSRGraph, SharedGraphHandle
+from .shared_arrays import has_shared_memory
+
+def apply_edge_changes(G, changes):
+    """Replay the edge changes of 'process_path' (in the same order, so the adjacency order of the graphs stays identical)"""
+    for change in changes:
+        if change[0] == "remove":
+            G.remove_edge(change[1], change[2])
+        else:
+            G.add_weighted_edges_from([(change[1], change[2], change[3])], weight="total_fee")
+
+def speculative_search(G, source, target, weight):
+    """Shortest path (None if there is no path) and the scope of the search (see 'CSRGraph.shortest_path'). The scope is None if an endpoint is missing from the graph."""
+    if not source in G or not target in G:
+        return None, None
+    scope = ([], [], [])
+    try:
+        path = G.shortest_path(source, target, weight=weight, scope=scope)
+    except nx.NetworkXNoPath:
+        path = None
+    return path, scope
+
+def speculative_worker(conn, graph, weight):
+    """Search paths on a private copy of the graph. Each request contains the edge changes since the previous request and the payments to route."""
+    G = graph.attach() if isinstance(graph, SharedGraphHandle) else graph
+    conn.send("ready")
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        changes, queries = message
+        apply_edge_changes(G, changes)
+        conn.send([speculative_search(G, source, target, weight) for source, target in queries])
+    conn.close()
+
+class SpeculativePathSearch():
+    """Parallel path search of the next payments with capacity depletion (CSR engine only)"""
+    def __init__(self, G, transactions, weight="total_fee", threads=2, batch_size=32):
+        if not isinstance(G, CSRGraph):
+            raise ValueError("Speculative path search requires a CSR graph (engine='csr')!")
+        self.G = G
+        self.weight = weight
+        self.batch_size = batch_size
+        self.queries = list(zip(transactions["source"], transactions["target"]))
+        self.pos = 0
+        self.results = {}
+        # edges changed since the paths of the current batch were searched
+        self.added, self.removed = [], set()
+        self.pending = []
+        self.num_batches = 0
+        self.num_conflicts = 0
+        self.workers = []
+        if threads > 1:
+            # without shared memory each worker receives a pickled copy of the graph
+            shm, handle = G.to_shared_memory() if has_shared_memory() else (None, G)
+            try:
+                for _ in range(threads-1):
+                    conn, child_conn = multiprocessing.Pipe()
+                    proc = multiprocessing.Process(target=speculative_worker, args=(child_conn, handle, weight), daemon=True)
+                    proc.start()
+                    child_conn.close()
+                    self.workers.append((proc, conn))
+                for _, conn in self.workers:
+                    conn.recv()
+            finally:
+                # workers keep their mapping of the shared arrays
+                if shm != None:
+                    shm.close()
+                    shm.unlink()
+
+    def _launch(self):
+        """Search the paths of the next batch on the current graph"""
+        start = self.pos
+        queries = self.queries[start:start+self.batch_size]
+        parts = np.array_split(np.arange(len(queries)), len(self.workers)+1)
+        for (_, conn), part in zip(self.workers, parts[1:]):
+            conn.send((self.pending, [queries[i] for i in part]))
+        self.pending = []
+        results = [speculative_search(self.G, *queries[i], self.weight) for i in parts[0]]
+        for (_, conn), part in zip(self.workers, parts[1:]):
+            worker_results = conn.recv()
+            for _, scope in worker_results:
+                if scope != None:
+                    self.G.expanded += len(scope[0]) + len(scope[1])
+            results += worker_results
+        self.results = dict(zip(range(start, start+len(queries)), results))
+        self.added, self.removed = [], set()
+        self.num_batches += 1
+
+    def path(self, source, target):
+        # payments with missing endpoints are not routed
+        while True:
+            if not self.pos in self.results:
+                self._launch()
+            query = self.queries[self.pos]
+            path, scope = self.results.pop(self.pos)
+            self.pos += 1
+            if query == (source, target):
+                break
+        if scope is None or self._conflicts(scope):
+            self.num_conflicts += 1
+            return self.G.shortest_path(source, target, weight=self.weight)
+        if path is None:
+            raise nx.NetworkXNoPath("No path between %s and %s." % (source, target))
+        return path
+
+    def _conflicts(self, scope):
+        """Check whether the edge changes since the search could have changed its course"""
+        if not self.removed.isdisjoint(scope[2]):
+            return True
+        if len(self.added) > 0:
+            # settling order of the nodes in each direction
+            forward = {v:k for k, v in enumerate(scope[0])}
+            backward = {v:k for k, v in enumerate(scope[1])}
+            for i, j in self.added:
+                if i in forward and forward.get(j, len(forward)) > forward[i]:
+                    return True
+                if j in backward and backward.get(i, len(backward)) > backward[j]:
+                    return True
+        return False
+
+    def invalidate(self, changes):
+        for change in changes:
+            self.pending.append(change)
+            if change[0] == "remove":
+                self.removed.add(self.G._edge_id(change[1], change[2]))
+            else:
+                self.added.append((self.G.index[change[1]], self.G.index[change[2]]))
+
+    def close(self):
+        for proc, conn in self.workers:
+            conn.send(None)
+            conn.close()
+            proc.join()
+        self.workers = []
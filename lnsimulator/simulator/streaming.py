@@ -0,0 +1,73 @@
+import os, json
+import pandas as pd
+from collections import Counter
+
+class ResultStreamWriter():
+    """Append simulation results of transaction chunks to CSV files in 'output_dir'"""
+    def __init__(self, output_dir, cost_prefix="original_"):
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.output_dir = output_dir
+        self.cost_col = cost_prefix + "cost"
+        self.files = {
+            "transactions":"%s/transactions.csv" % output_dir,
+            "paths":"%s/paths.csv" % output_dir,
+            "router_fees":"%s/router_fees.csv" % output_dir,
+        }
+        for fp in self.files.values():
+            if os.path.exists(fp):
+                os.remove(fp)
+        self.router_fees = {}
+        self.router_traffic = Counter()
+        self.source_costs = {}
+        self.source_traffic = Counter()
+        self.lengths = Counter()
+        self.depletions = Counter()
+        self.num_transactions = 0
+        self.num_success = 0
+
+    def _append(self, key, df):
+        fp = self.files[key]
+        df.to_csv(fp, mode="a", header=not os.path.exists(fp), index=False)
+
+    def write(self, transactions, shortest_paths, all_router_fees, total_depletions):
+        """Flush the results of a transaction chunk to disk and update aggregated statistics"""
+        paths = shortest_paths.copy()
+        paths["path"] = paths["path"].apply(lambda p: " ".join(p))
+        self._append("transactions", transactions)
+        self._append("paths", paths)
+        self._append("router_fees", all_router_fees)
+        self.num_transactions += len(transactions)
+        self.num_success += int(transactions["success"].sum())
+        self.lengths.update(shortest_paths["length"])
+        self.depletions.update(total_depletions)
+        for node, fee in all_router_fees.groupby("node")["fee"].sum().items():
+            self.router_fees[node] = self.router_fees.get(node, 0.0) + fee
+        self.router_traffic.update(all_router_fees["node"])
+        # same filter as in 'get_total_fee_for_sources'
+        tmp_sp = shortest_paths[shortest_paths["length"]>0]
+        costs = transactions[["transaction_id","source"]].merge(tmp_sp[["transaction_id",self.cost_col]], on="transaction_id", how="right")
+        for source, cost in costs.groupby("source")[self.cost_col].sum().items():
+            self.source_costs[source] = self.source_costs.get(source, 0.0) + cost
+        self.source_traffic.update(costs["source"])
+
+    def close(self, params):
+        """Export aggregated statistics in the format of 'TransactionSimulator.export'"""
+        with open('%s/params.json' % self.output_dir, 'w') as fp:
+            json.dump(params, fp)
+        length_distrib = pd.Series(self.lengths, name="count").sort_values(ascending=False)
+        length_distrib.index.name = "length"
+        length_distrib.to_csv("%s/lengths_distrib.csv" % self.output_dir)
+        total_income = pd.DataFrame({
+            "node":list(self.router_fees.keys()),
+            "fee":list(self.router_fees.values()),
+            "num_trans":[self.router_traffic[n] for n in self.router_fees],
+        }).sort_values("fee", ascending=False)
+        total_income.to_csv("%s/router_incomes.csv" % self.output_dir, index=False)
+        total_fee = pd.DataFrame({
+            "source":list(self.source_traffic.keys()),
+            "mean_fee":[self.source_costs[s] / self.source_traffic[s] for s in self.source_traffic],
+            "num_trans":list(self.source_traffic.values()),
+        }).set_index("source").sort_index()
+        total_fee.to_csv("%s/source_fees.csv" % self.output_dir, index=True)
+        return total_income, total_fee
@@ -1,28 +1,39 @@
 import pandas as pd
 import numpy as np
 
-def sample_providers(node_variables, K, providers):
+def sample_providers(node_variables, K, providers, rng=np.random):
     provider_records = node_variables[node_variables["pub_key"].isin(providers)]
     nodes = list(provider_records["pub_key"])
     probas = list(provider_records["degree"] / provider_records["degree"].sum())
-    return np.random.choice(nodes, size=K, replace=True, p=probas)
+    return rng.choice(nodes, size=K, replace=True, p=probas)
 
-def sample_transactions(node_variables, amount_in_satoshi, K, eps, active_providers, verbose=False):
+def sample_transactions(node_variables, amount_in_satoshi, K, eps, active_providers, verbose=False, rng=np.random):
+    """Sample K transactions with random source and target nodes. If 'amount_in_satoshi' is a list of amounts, the amount of each transaction is drawn from it uniformly at random."""
     nodes = list(node_variables["pub_key"])
-    src_selected = np.random.choice(nodes, size=K, replace=True)
+    src_selected = rng.choice(nodes, size=K, replace=True)
     if eps > 0:
         n_prov = int(eps*K)
-        trg_providers = sample_providers(node_variables, n_prov, active_providers)
-        trg_rnd = np.random.choice(nodes, size=K-n_prov, replace=True)
+        trg_providers = sample_providers(node_variables, n_prov, active_providers, rng)
+        trg_rnd = rng.choice(nodes, size=K-n_prov, replace=True)
         trg_selected = np.concatenate((trg_providers,trg_rnd))
-        np.random.shuffle(trg_selected)
+        rng.shuffle(trg_selected)
     else:
-        trg_selected = np.random.choice(nodes, size=K, replace=True)
+        trg_selected = rng.choice(nodes, size=K, replace=True)
     transactions = pd.DataFrame(list(zip(src_selected, trg_selected)), columns=["source","target"])
-    transactions["amount_SAT"] = amount_in_satoshi
+    if np.ndim(amount_in_satoshi) > 0:
+        transactions["amount_SAT"] = rng.choice(amount_in_satoshi, size=K, replace=True)
+    else:
+        transactions["amount_SAT"] = amount_in_satoshi
     transactions["transaction_id"] = transactions.index
     transactions = transactions[transactions["source"] != transactions["target"]]
     if verbose:
         print("Number of loop transactions (removed):", K-len(transactions))
         print("Merchant target ratio:", len(transactions[transactions["target"].isin(active_providers)]) / len(transactions))
-    return transactions[["transaction_id","source","target","amount_SAT"]]
\ No newline at end of file
+    return transactions[["transaction_id","source","target","amount_SAT"]]
+
+def stream_transactions(node_variables, amount_in_satoshi, K, eps, active_providers, chunk_size=10000, verbose=False, rng=np.random):
+    """Sample K transactions in chunks of 'chunk_size'. Transaction ids are unique across chunks."""
+    for offset in range(0, K, chunk_size):
+        transactions = sample_transactions(node_variables, amount_in_satoshi, min(chunk_size, K-offset), eps, active_providers, verbose=verbose, rng=rng)
+        transactions["transaction_id"] += offset
+        yield transactions
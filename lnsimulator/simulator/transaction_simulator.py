@@ -1,48 +1,155 @@
-import sys, os, json
+import sys, os, json, copy, time
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from tqdm import tqdm
-import functools
 import concurrent.futures
+import networkx as nx
 
-from .transaction_sampling import sample_transactions
+from .transaction_sampling import sample_transactions, stream_transactions
 from .graph_preprocessing import *
-from .path_searching import get_shortest_paths
+from .path_searching import get_shortest_paths, init_capacity_state, init_search_graph, route_transactions, RoutingOptions, SEARCHES
+from .streaming import ResultStreamWriter
+from .path_storage import PathTable, check_file_format, write_table, paths_to_arrow
+from .csr_graph import CSRGraph, SharedGraphHandle
+from .shared_arrays import has_shared_memory
+from .graph_cache import PreparedGraphCache
+from .metrics import SimulationMetrics
+from .replacement_paths import ReplacementPathSearch, replacement_path_tasks, get_replacement_paths, order_by_buckets
+from .snapshot_delta import apply_edge_delta, update_node_params, update_search_graph
+from .landmarks import select_landmarks
 
-def shortest_paths_with_exclusion(capacity_map, G, cost_prefix, weight, hash_bucket_item):
+def shortest_paths_with_exclusion(capacity_map, G, cost_prefix, engine, options, hash_bucket_item):
     node, bucket_transactions = hash_bucket_item
-    H = G.copy()
-    H.remove_node(node)
-    if node + "_trg" in G.nodes():
-        H.remove_node(node + "_trg") # delete node copy as well
-    new_paths, _, _, _ = get_shortest_paths(capacity_map, H, bucket_transactions,  hash_transactions=False, cost_prefix=cost_prefix, weight=weight)
+    excluded = [node]
+    new_paths, _, _, _ = get_shortest_paths(capacity_map, G, bucket_transactions,  hash_transactions=False, cost_prefix=cost_prefix, options=options, engine=engine, excluded=excluded)
     new_paths["node"] = node
     return new_paths
 
-def get_shortest_paths_with_node_removals(capacity_map, G, hashed_transactions, cost_prefix="", weight=None, threads=4):
+_worker_state = {}
+
+def init_node_removal_worker(graph, capacity_map, transactions, cost_prefix, engine, options):
+    """Store the graph, capacities and transactions of the node removal stage in the worker process"""
+    if isinstance(graph, SharedGraphHandle):
+        graph = graph.attach()
+    if isinstance(capacity_map, SharedCapacityHandle):
+        capacity_map = capacity_map.attach()
+    _worker_state["args"] = (capacity_map, graph, cost_prefix, engine, options)
+    _worker_state["transactions"] = None if transactions is None else transactions.set_index("transaction_id", drop=False)
+
+def node_removal_worker(bucket):
+    start = time.perf_counter()
+    node, transaction_ids = bucket
+    bucket_transactions = _worker_state["transactions"].loc[transaction_ids]
+    new_paths = shortest_paths_with_exclusion(*_worker_state["args"], (node, bucket_transactions))
+    return new_paths, (node, len(transaction_ids), time.perf_counter() - start, os.getpid())
+
+def replacement_paths_worker(tasks):
+    start = time.perf_counter()
+    capacity_map, graph, cost_prefix, engine, options = _worker_state["args"]
+    weight = options.weight
+    if not "search" in _worker_state:
+        _worker_state["search"] = ReplacementPathSearch(graph, weight)
+    new_paths = get_replacement_paths(graph, tasks, weight, _worker_state["search"])
+    return new_paths, ("targets:%s" % tasks["target"].iloc[0], len(tasks), time.perf_counter() - start, os.getpid())
+
+def get_shortest_paths_with_node_removals(capacity_map, G, hashed_transactions, cost_prefix="", options=None, threads=4, engine="networkx", metrics=None, replacement_paths=False):
+    """Alternative paths of the routed transactions if a router is removed"""
     print("Parallel execution on %i threads in progress.." % threads)
+    options = (RoutingOptions() if options is None else options).for_node_removals().validate(capacity_map)
+    weight = options.weight
+    if replacement_paths and options.min_amount != None:
+        raise ValueError("Replacement paths are not supported for payments with different amounts!")
+    if replacement_paths:
+        if len(hashed_transactions) == 0:
+            return pd.DataFrame([])
+        tasks = replacement_path_tasks(hashed_transactions)
+        # transactions with the same target are processed by the same worker
+        targets = tasks["target"].unique()
+        chunks = [tasks[tasks["target"].isin(part)] for part in np.array_split(targets, min(len(targets), 4*threads)) if len(part) > 0]
+    else:
+        chunks = None
     if threads > 1:
-        f_partial = functools.partial(shortest_paths_with_exclusion, capacity_map, G, cost_prefix, weight)
-        executor = concurrent.futures.ProcessPoolExecutor(threads)
-        alternative_paths = list(executor.map(f_partial, hashed_transactions.items()))
-        executor.shutdown()
+        shared_blocks = []
+        graph, capacities, transactions = G, capacity_map, None
+        # without shared memory (Python < 3.8) graph and capacities are pickled
+        if isinstance(G, CSRGraph) and has_shared_memory():
+            shm, graph = G.to_shared_memory()
+            shared_blocks.append(shm)
+        if chunks is None:
+            # transactions are sent once to each worker, buckets only contain transaction ids
+            transactions = pd.concat(list(hashed_transactions.values())).drop_duplicates("transaction_id")
+            buckets = [(node, list(bucket["transaction_id"])) for node, bucket in hashed_transactions.items()]
+            if isinstance(capacity_map, CapacityState) and has_shared_memory():
+                shm, capacities = capacity_map.to_shared_memory()
+                shared_blocks.append(shm)
+        else:
+            # replacement paths are searched on the graph only
+            capacities = None
+        try:
+            with concurrent.futures.ProcessPoolExecutor(threads, initializer=init_node_removal_worker, initargs=(graph, capacities, transactions, cost_prefix, engine, options)) as executor:
+                if chunks != None:
+                    results = list(executor.map(replacement_paths_worker, chunks))
+                else:
+                    chunksize = max(1, len(buckets) // (4*threads))
+                    results = list(executor.map(node_removal_worker, buckets, chunksize=chunksize))
+            alternative_paths = [new_paths for new_paths, _ in results]
+            if metrics != None:
+                for _, timing in results:
+                    metrics.add_bucket(*timing)
+        finally:
+            for shm in shared_blocks:
+                shm.close()
+                shm.unlink()
+    elif chunks != None:
+        search = ReplacementPathSearch(G, weight)
+        alternative_paths = []
+        for tasks in tqdm(chunks, mininterval=10):
+            start = time.perf_counter()
+            alternative_paths.append(get_replacement_paths(G, tasks, weight, search))
+            if metrics != None:
+                metrics.add_bucket("targets:%s" % tasks["target"].iloc[0], len(tasks), time.perf_counter() - start, os.getpid())
     else:
         alternative_paths = []
         for hash_bucket_item in tqdm(hashed_transactions.items(), mininterval=10):
-            alternative_paths.append(shortest_paths_with_exclusion(capacity_map, G, cost_prefix, weight, hash_bucket_item))
+            start = time.perf_counter()
+            alternative_paths.append(shortest_paths_with_exclusion(capacity_map, G, cost_prefix, engine, options, hash_bucket_item))
+            if metrics != None:
+                metrics.add_bucket(hash_bucket_item[0], len(hash_bucket_item[1]), time.perf_counter() - start, os.getpid())
+    if chunks != None:
+        return order_by_buckets(pd.concat(alternative_paths), hashed_transactions, cost_prefix)
     return pd.concat(alternative_paths)
 
 class TransactionSimulator():
-    def __init__(self, edges, merchants, amount_sat, count, epsilon=0.8, drop_disabled=True, drop_low_cap=True, with_depletion=True, time_window=None, verbose=False):
+    def __init__(self, edges, merchants, amount_sat, count, epsilon=0.8, drop_disabled=True, drop_low_cap=True, with_depletion=True, time_window=None, verbose=False, chunk_size=None, seed=None, profiler=None):
         self.verbose = verbose
+        # stage timings of the simulator, see 'export' (metrics.json)
+        self.init_metrics = SimulationMetrics(profiler)
+        # without seed the global NumPy random state is used
+        self.rng = np.random if seed is None else np.random.default_rng(seed)
         self.with_depletion = with_depletion
         self.amount = amount_sat
-        self.edges = prepare_edges_for_simulation(edges, amount_sat, drop_disabled, drop_low_cap, time_window, verbose=self.verbose)
-        self.node_variables, self.merchants, active_ratio = init_node_params(self.edges, merchants, verbose=self.verbose)
-        self.transactions = sample_transactions(self.node_variables, amount_sat, count, epsilon, self.merchants, verbose=self.verbose)
+        # with a list of payment amounts the graph is prepared for the smallest amount and fees are calculated for each payment
+        self.min_amount = None if np.ndim(amount_sat) == 0 else min(amount_sat)
+        edge_amount = amount_sat if self.min_amount is None else self.min_amount
+        self.count = count
+        self.epsilon = epsilon
+        self.chunk_size = chunk_size
+        with self.init_metrics.stage("edge_preparation"):
+            self.edges = prepare_edges_for_simulation(edges, edge_amount, drop_disabled, drop_low_cap, time_window, verbose=self.verbose)
+        with self.init_metrics.stage("node_params"):
+            self.node_variables, self.merchants, active_ratio = init_node_params(self.edges, merchants, verbose=self.verbose)
+        # all possible providers, active providers are updated with snapshot deltas (see 'apply_delta')
+        self.providers = merchants
+        self.graph_cache = PreparedGraphCache(self.edges, edge_amount, with_depletion, verbose=self.verbose)
+        if chunk_size is None:
+            with self.init_metrics.stage("transaction_sampling"):
+                self.transactions = sample_transactions(self.node_variables, amount_sat, count, epsilon, self.merchants, verbose=self.verbose, rng=self.rng)
+        else:
+            # transactions are sampled chunk by chunk in 'simulate_stream'
+            self.transactions = None
         self.params = {
-            "amount":amount_sat,
+            "amount":np.asarray(amount_sat).tolist(),
             "count":count,
             "epsilon":epsilon,
             "with_depletion":with_depletion,
@@ -50,36 +157,129 @@ class TransactionSimulator():
             "drop_low_cap": drop_low_cap,
             "time_window":time_window
         }
+        self.metrics = self.init_metrics.copy()
     
-    def simulate(self, weight="total_fee", with_node_removals=False, max_threads=2, excluded=[], required_length=None, cap_change_nodes=[], capacity_fraction=1.0):
-        edges_tmp = self.edges.copy()
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # the global random state (np.random module) cannot be pickled
+        if state["rng"] is np.random:
+            state["rng"] = None
+        # profiler hooks are not sent to other processes
+        for key in ["init_metrics", "metrics"]:
+            state[key] = state[key].copy()
+            state[key].profiler = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.rng is None:
+            self.rng = np.random
+
+    def spawn(self, seed):
+        """Return a simulator for the same channels with its own random stream and newly sampled transactions. Preprocessed edges, node parameters and prepared graph structures are shared with this simulator."""
+        sim = copy.copy(self)
+        sim.rng = np.random.default_rng(seed)
+        sim.init_metrics = SimulationMetrics(self.init_metrics.profiler)
+        if self.chunk_size is None:
+            with sim.init_metrics.stage("transaction_sampling"):
+                sim.transactions = sample_transactions(self.node_variables, self.amount, self.count, self.epsilon, self.merchants, verbose=self.verbose, rng=sim.rng)
+        sim.metrics = sim.init_metrics.copy()
+        return sim
+
+    def derive(self, count=None, epsilon=None, with_depletion=None, seed=None):
+        """Return a simulator for the same prepared edges with other 'count', 'epsilon' or 'with_depletion' settings"""
+        sim = copy.copy(self)
+        sim.rng = np.random if seed is None else np.random.default_rng(seed)
+        sim.count = self.count if count is None else count
+        sim.epsilon = self.epsilon if epsilon is None else epsilon
+        sim.with_depletion = self.with_depletion if with_depletion is None else with_depletion
+        if sim.with_depletion != self.with_depletion:
+            sim.graph_cache = PreparedGraphCache(self.edges, self.graph_cache.amount, sim.with_depletion, verbose=self.verbose)
+        sim.params = dict(self.params, count=sim.count, epsilon=sim.epsilon, with_depletion=sim.with_depletion)
+        sim.init_metrics = SimulationMetrics(self.init_metrics.profiler)
+        if self.chunk_size is None:
+            with sim.init_metrics.stage("transaction_sampling"):
+                sim.transactions = sample_transactions(self.node_variables, self.amount, sim.count, sim.epsilon, self.merchants, verbose=self.verbose, rng=sim.rng)
+        sim.metrics = sim.init_metrics.copy()
+        return sim
+
+    def apply_delta(self, delta, resample=True):
+        """Move the simulator to the next snapshot with the difference of the snapshots (see 'diff_snapshots')"""
+        if self.params["time_window"] != None:
+            raise ValueError("Snapshot deltas are not supported with 'time_window': the recency filter depends on the whole snapshot!")
+        amount = self.graph_cache.amount
+        self.init_metrics = SimulationMetrics(self.init_metrics.profiler)
+        with self.init_metrics.stage("edge_preparation"):
+            edges, old_rows, new_rows = apply_edge_delta(self.edges, delta, amount, self.params["drop_disabled"], self.params["drop_low_cap"])
+        with self.init_metrics.stage("node_params"):
+            self.node_variables = update_node_params(self.node_variables, edges, old_rows, new_rows)
+            self.merchants = list(set(self.providers).intersection(set(self.node_variables["pub_key"])))
+        graph_cache = PreparedGraphCache(edges, amount, self.with_depletion, verbose=self.verbose)
+        G = self.graph_cache.graphs.get(None)
+        if G != None:
+            # graphs of capacity change scenarios are not kept
+            with self.init_metrics.stage("graph_construction"):
+                graph_cache.graphs[None] = update_search_graph(G.copy(), old_rows, new_rows, amount)
+        self.edges = edges
+        self.graph_cache = graph_cache
+        if resample and self.chunk_size is None:
+            with self.init_metrics.stage("transaction_sampling"):
+                self.transactions = sample_transactions(self.node_variables, self.amount, self.count, self.epsilon, self.merchants, verbose=self.verbose, rng=self.rng)
+        if self.verbose:
+            print("Snapshot delta applied:", delta.summary())
+        self.metrics = self.init_metrics.copy()
+        return self
+
+    def prepare_graph(self, excluded=[], cap_change_nodes=[], capacity_fraction=1.0, engine="networkx"):
+        """Initialize channel capacities and the graph for path search. Graph structures are memoized across calls, capacity changes and node exclusions are applied as overlays."""
+        current_capacity_map, G = self.graph_cache.prepare(cap_change_nodes, capacity_fraction, engine, self.rng, self.metrics)
         if len(cap_change_nodes) > 0 and capacity_fraction < 1.0:
-            filt = edges_tmp["src"].isin(cap_change_nodes) | edges_tmp["trg"].isin(cap_change_nodes)
-            edges_tmp.loc[filt,"capacity"] *= capacity_fraction
-            edges_tmp = edges_tmp[edges_tmp["capacity"] >= self.amount]
             print("Capacity change executed: (%s, %.4f)" % (str(cap_change_nodes), capacity_fraction))
-        if self.with_depletion:
-            current_capacity_map, edges_with_capacity = init_capacities(edges_tmp, self.transactions, self.amount, self.verbose)
-            G = generate_graph_for_path_search(edges_with_capacity, self.transactions, self.amount)
-        else:
-            current_capacity_map = None
-            G = generate_graph_for_path_search(edges_tmp, self.transactions, self.amount)
         if len(excluded) > 0:
             print(G.number_of_edges(), G.number_of_nodes())
-            for node in excluded:
-                if node in G.nodes():
-                    G.remove_node(node)
-                pseudo_node = str(node) + "_trg"
-                if pseudo_node in G.nodes():
-                    G.remove_node(pseudo_node)
+            if engine == "csr":
+                G = G.view(list(excluded))
+            elif self.with_depletion:
+                G.remove_nodes_from(list(excluded))
+            else:
+                # the prepared graph is shared by other simulations
+                G = nx.restricted_view(G, list(excluded), []).copy()
             if self.verbose:
                 print(G.number_of_edges(), G.number_of_nodes())
             print("Additional nodes were EXCLUDED!")
         print("Graph and capacities were INITIALIZED")
+        return current_capacity_map, G
+
+    def landmark_index(self, num_landmarks=8, landmark_selection="degree", weight="total_fee"):
+        """Landmark index of the channels of the simulator (see 'LandmarkIndex')"""
+        return self.graph_cache.landmarks(select_landmarks(self.node_variables, num_landmarks, landmark_selection), weight)
+
+    def routing_options(self, weight="total_fee", required_length=None, length_routing="genetic", batch_sources=False, speculative_threads=None, search="bidirectional", num_landmarks=8, landmark_selection="degree"):
+        """Validated path search options of a simulation (see 'RoutingOptions'). With search='alt' the landmark index is built (see 'landmark_index')."""
+        if not search in SEARCHES:
+            raise ValueError("Invalid path search: %s (use one of %s)" % (search, SEARCHES))
+        landmarks = None
+        if search == "alt":
+            with self.metrics.stage("landmarks"):
+                landmarks = self.landmark_index(num_landmarks, landmark_selection, weight)
+        return RoutingOptions(weight, required_length, length_routing, batch_sources, speculative_threads, self.min_amount, landmarks).validate()
+
+    def simulate(self, weight="total_fee", with_node_removals=False, max_threads=2, excluded=[], required_length=None, cap_change_nodes=[], capacity_fraction=1.0, engine="networkx", batch_sources=False, compact_paths=False, length_routing="genetic", replacement_paths=False, speculative_threads=None, search="bidirectional", num_landmarks=8, landmark_selection="degree"):
+        if self.transactions is None:
+            raise RuntimeError("Transactions are sampled in chunks (chunk_size=%i), use 'simulate_stream' instead!" % self.chunk_size)
+        # stage timings and path search counters of this simulation (see 'self.metrics')
+        self.metrics = self.init_metrics.copy()
+        options = self.routing_options(weight, required_length, length_routing, batch_sources, speculative_threads, search, num_landmarks, landmark_selection)
+        with self.metrics.stage("prepare_graph"):
+            current_capacity_map, G = self.prepare_graph(excluded, cap_change_nodes, capacity_fraction, engine)
         if self.verbose:
-            print("Using weight='%s' for the simulation" % weight)    
+            print("Using weight='%s' for the simulation" % weight)
+            print("Using '%s' path search engine" % engine)
+        # compact mode: paths are stored in 'self.paths' instead of the 'path' column
+        self.paths = PathTable() if compact_paths else None
         print("Transactions simulated on original graph STARTED..")
-        shortest_paths, hashed_transactions, all_router_fees, total_depletions = get_shortest_paths(current_capacity_map, G, self.transactions, hash_transactions=with_node_removals, cost_prefix="original_", weight=weight, required_length=required_length)
+        with self.metrics.stage("routing"):
+            shortest_paths, hashed_transactions, all_router_fees, total_depletions = get_shortest_paths(current_capacity_map, G, self.transactions, hash_transactions=with_node_removals, cost_prefix="original_", options=options, engine=engine, path_table=self.paths, rng=self.rng, metrics=self.metrics)
         success_tx_ids = set(all_router_fees["transaction_id"])
         self.transactions["success"] = self.transactions["transaction_id"].apply(lambda x: x in success_tx_ids)
         print("Transactions simulated on original graph DONE")
@@ -90,7 +290,8 @@ class TransactionSimulator():
             print(shortest_paths["length"].value_counts())
         if with_node_removals:
             print("Base fee optimization STARTED..")
-            alternative_paths = get_shortest_paths_with_node_removals(current_capacity_map, G, hashed_transactions, weight=weight, threads=max_threads)
+            with self.metrics.stage("node_removals"):
+                alternative_paths = get_shortest_paths_with_node_removals(current_capacity_map, G, hashed_transactions, options=options, threads=max_threads, engine=engine, metrics=self.metrics, replacement_paths=replacement_paths)
             print("Base fee optimization DONE")
             if self.verbose:
                 if verbose:
@@ -102,25 +303,65 @@ class TransactionSimulator():
         self.alternative_paths = alternative_paths
         self.all_router_fees = all_router_fees
         return shortest_paths, alternative_paths, all_router_fees, total_depletions
+
+    def simulate_stream(self, output_dir, weight="total_fee", excluded=[], required_length=None, cap_change_nodes=[], capacity_fraction=1.0, engine="networkx", batch_sources=False, length_routing="genetic", speculative_threads=None, search="bidirectional", num_landmarks=8, landmark_selection="degree"):
+        """Simulate 'count' transactions sampled in chunks of 'chunk_size'. Results are written to 'output_dir' after each chunk, so memory usage does not grow with 'count'. Capacity depletions are carried over between chunks."""
+        if self.chunk_size is None:
+            raise RuntimeError("Set 'chunk_size' for the simulator to use streaming simulation!")
+        self.metrics = self.init_metrics.copy()
+        options = self.routing_options(weight, required_length, length_routing, batch_sources, speculative_threads, search, num_landmarks, landmark_selection)
+        with self.metrics.stage("prepare_graph"):
+            init_capacity_map, G_origi = self.prepare_graph(excluded, cap_change_nodes, capacity_fraction, engine)
+            capacity_map = init_capacity_state(init_capacity_map)
+            G = init_search_graph(G_origi, capacity_map, engine)
+        del G_origi, init_capacity_map
+        writer = ResultStreamWriter(output_dir, cost_prefix="original_")
+        chunks = stream_transactions(self.node_variables, self.amount, self.count, self.epsilon, self.merchants, chunk_size=self.chunk_size, verbose=self.verbose, rng=self.rng)
+        print("Streaming simulation STARTED..")
+        for transactions in tqdm(chunks, total=int(np.ceil(self.count / self.chunk_size)), mininterval=10):
+            with self.metrics.stage("routing"):
+                shortest_paths, _, all_router_fees, total_depletions = route_transactions(capacity_map, G, transactions, hash_transactions=False, cost_prefix="original_", options=options, rng=self.rng, metrics=self.metrics)
+            success_tx_ids = set(all_router_fees["transaction_id"])
+            transactions["success"] = transactions["transaction_id"].isin(success_tx_ids)
+            writer.write(transactions, shortest_paths, all_router_fees, total_depletions)
+        print("Streaming simulation DONE")
+        print("Transaction succes rate: %.4f" % (writer.num_success / max(writer.num_transactions, 1)))
+        total_income, total_fee = writer.close(self.params)
+        self.metrics.export(output_dir)
+        print("Export DONE")
+        return total_income, total_fee
     
-    def export(self, output_dir):
+    def export(self, output_dir, file_format="csv"):
+        """Export aggregated results. With 'parquet' or 'feather' file format transactions, paths and router fees are exported as well."""
+        check_file_format(file_format)
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
         with open('%s/params.json' % output_dir, 'w') as fp:
             json.dump(self.params, fp)
+        self.metrics.export(output_dir)
         length_distrib = self.shortest_paths["length"].value_counts()
-        length_distrib.to_csv("%s/lengths_distrib.csv" % output_dir)
         total_income = get_total_income_for_routers(self.all_router_fees)
-        total_income.to_csv("%s/router_incomes.csv" % output_dir, index=False)
         total_fee = get_total_fee_for_sources(self.transactions, self.shortest_paths)
-        total_fee.to_csv("%s/source_fees.csv" % output_dir, index=True)
+        if file_format == "csv":
+            length_distrib.to_csv("%s/lengths_distrib.csv" % output_dir)
+            total_income.to_csv("%s/router_incomes.csv" % output_dir, index=False)
+            total_fee.to_csv("%s/source_fees.csv" % output_dir, index=True)
+        else:
+            write_table(length_distrib.rename_axis("length").reset_index(name="count"), "%s/lengths_distrib" % output_dir, file_format)
+            write_table(total_income, "%s/router_incomes" % output_dir, file_format)
+            write_table(total_fee.reset_index(), "%s/source_fees" % output_dir, file_format)
+            write_table(self.transactions, "%s/transactions" % output_dir, file_format)
+            write_table(self.all_router_fees, "%s/router_fees" % output_dir, file_format)
+            paths, path_table = paths_to_arrow(self.shortest_paths, self.paths)
+            write_table(paths, "%s/paths" % output_dir, file_format)
+            write_table(path_table.nodes_frame(), "%s/path_nodes" % output_dir, file_format)
         print("Export DONE")
         return total_income, total_fee
     
 ### process results ###
 
 def get_total_income_for_routers(all_router_fees):
-    grouped = all_router_fees.groupby("node")
+    grouped = all_router_fees.groupby("node", observed=True)
     aggr_router_income = grouped.agg({"fee":"sum","transaction_id":"count"}).reset_index().sort_values("fee",ascending=False)
     return aggr_router_income.rename({"transaction_id":"num_trans"}, axis=1)
 
@@ -139,14 +380,17 @@ def inspect_base_fee_thresholds(ordered_deltas, pos_thresholds, min_ratio):
     original_income = ordered_deltas["fee"].sum()
     original_num_transactions = len(ordered_deltas)
     incomes, probas = [original_income], [1.0]
+    # transactions that will still pay the increased base_fee: suffix of the ordered deltas
+    deltas = ordered_deltas["delta_cost"].values
+    suffix_fees = np.concatenate([np.cumsum(ordered_deltas["fee"].values[::-1])[::-1], [0.0]])
     # inspect only positive deltas
     for th in thresholds[1:]:
-        # transactions that will still pay the increased base_fee
-        df = ordered_deltas[ordered_deltas["delta_cost"] >= th]
-        prob = len(df) / original_num_transactions
+        first = np.searchsorted(deltas, th, side="left")
+        cnt = original_num_transactions - first
+        prob = cnt / original_num_transactions
         probas.append(prob)
         # adjusted router income at the new threshold
-        adj_income = df["fee"].sum() + len(df) * th
+        adj_income = suffix_fees[first] + cnt * th
         incomes.append(adj_income)
         if prob < min_ratio:
             break
@@ -162,14 +406,17 @@ def visualize_thresholds(incomes, probas, thresholds, original_num_transactions)
     ax2.plot(x, probas, 'gx-')
     ax2.set_xscale("log")
 
-def calculate_max_income(n, p_altered, shortest_paths, all_router_fees, visualize=False, min_ratio=0.0):
-    trans = p_altered[p_altered["node"] == n]
-    trans = trans.merge(shortest_paths[["transaction_id","original_cost"]], on="transaction_id", how="inner")
-    trans = trans.merge(all_router_fees, on=["transaction_id","node"], how="inner")#'fee' column is merged
+def calculate_delta_costs(p_altered, shortest_paths, all_router_fees):
+    """Cost difference of the alternative path (if the router is removed) and the original path for the routed transactions of each router"""
+    trans = p_altered[["transaction_id","node","cost"]].merge(shortest_paths[["transaction_id","original_cost"]], on="transaction_id", how="inner")
+    trans = trans.merge(all_router_fees[["transaction_id","node","fee"]], on=["transaction_id","node"], how="inner")
     # router could ask for this cost difference
-    trans["delta_cost"] = trans["cost"] - trans["original_cost"]
+    trans["delta_cost"] = [round(x, 2) for x in trans["cost"] - trans["original_cost"]]
+    return trans[["transaction_id","node","fee","delta_cost"]]
+
+def calculate_max_income(n, p_altered, shortest_paths, all_router_fees, visualize=False, min_ratio=0.0):
+    trans = calculate_delta_costs(p_altered[p_altered["node"] == n], shortest_paths, all_router_fees)
     ordered_deltas = trans[["transaction_id","fee","delta_cost"]].sort_values("delta_cost")
-    ordered_deltas["delta_cost"] = ordered_deltas["delta_cost"].apply(lambda x: round(x, 2))
     pos_thresholds = sorted(list(ordered_deltas[ordered_deltas["delta_cost"]>0.0]["delta_cost"].unique()))
     incomes, probas, thresholds, alt_income, alt_num_trans = inspect_base_fee_thresholds(ordered_deltas, pos_thresholds, min_ratio)
     if visualize:
@@ -177,26 +424,52 @@ def calculate_max_income(n, p_altered, shortest_paths, all_router_fees, visualiz
     max_idx = np.argmax(incomes)
     return thresholds[max_idx], incomes[max_idx], probas[max_idx], alt_income, alt_num_trans
 
+def calculate_max_incomes(deltas, routers):
+    """Optimal base fee increment for every router at once (see 'calculate_max_income')"""
+    codes = pd.Categorical(deltas["node"], categories=routers).codes
+    delta = deltas["delta_cost"].values.astype("float64")
+    fee = deltas["fee"].values.astype("float64")
+    order = np.lexsort((-delta, codes))
+    codes, delta, fee = codes[order], delta[order], fee[order]
+    alt_income = np.bincount(codes, weights=fee, minlength=len(routers))
+    alt_traffic = np.bincount(codes, minlength=len(routers))
+    kept_fees = pd.Series(fee).groupby(codes).cumsum().values
+    kept_traffic = pd.Series(codes).groupby(codes).cumcount().values + 1
+    # last position of each (router, threshold) pair with positive threshold
+    last = np.ones(len(codes), dtype=bool)
+    last[:-1] = (codes[1:] != codes[:-1]) | (delta[1:] != delta[:-1])
+    last &= delta > 0.0
+    candidates = pd.DataFrame({
+        "code":np.concatenate([np.arange(len(routers)), codes[last]]),
+        "opt_delta":np.concatenate([np.zeros(len(routers)), delta[last]]),
+        "opt_alt_income":np.concatenate([alt_income, kept_fees[last] + kept_traffic[last] * delta[last]]),
+        "kept_traffic":np.concatenate([alt_traffic, kept_traffic[last]]),
+    })
+    best = np.lexsort((candidates["opt_delta"].values, -candidates["opt_alt_income"].values, candidates["code"].values))
+    opt = candidates.iloc[best].drop_duplicates("code").set_index("code").reindex(np.arange(len(routers)))
+    opt_fees_df = pd.DataFrame({
+        "node":routers,
+        "opt_delta":opt["opt_delta"].values,
+        "opt_alt_income":opt["opt_alt_income"].values,
+        # routers without transactions keep their (empty) traffic
+        "opt_alt_traffic":np.where(alt_traffic > 0, opt["kept_traffic"].values / np.maximum(alt_traffic, 1), 1.0),
+        "alt_income":alt_income,
+        "alt_traffic":alt_traffic,
+    })
+    return opt_fees_df
+
 def calc_optimal_base_fee(shortest_paths, alternative_paths, all_router_fees):
     # paths with length at least 2
     valid_sp = shortest_paths[shortest_paths["length"]>1]
     # drop failed alternative paths
     p_altered = alternative_paths[~alternative_paths["cost"].isnull()]
-    num_routers = len(alternative_paths["node"].unique())
-    num_routers_with_alternative_paths = len(p_altered["node"].unique())
     routers = list(p_altered["node"].unique())
-    opt_strategy = []
-    for n in tqdm(routers, mininterval=5):
-        opt_delta, opt_income, opt_ratio, origi_income, origi_num_trans = calculate_max_income(n, p_altered, valid_sp, all_router_fees, visualize=False)
-        opt_strategy.append((n, opt_delta, opt_income, opt_ratio, origi_income, origi_num_trans))
-    opt_fees_df = pd.DataFrame(opt_strategy, columns=["node", "opt_delta", "opt_alt_income", "opt_alt_traffic", "alt_income", "alt_traffic"])
+    opt_fees_df = calculate_max_incomes(calculate_delta_costs(p_altered, valid_sp, all_router_fees), routers)
     total_income = get_total_income_for_routers(all_router_fees).rename({"fee":"total_income","num_trans":"total_traffic"}, axis=1)
     merged_infos = total_income.merge(opt_fees_df, on="node", how="outer")
     merged_infos = merged_infos.sort_values("total_income", ascending=False)
     merged_infos = merged_infos.fillna(0.0)
     merged_infos["failed_traffic"] = merged_infos["total_traffic"] - merged_infos["alt_traffic"]
     merged_infos["failed_traffic_ratio"] = merged_infos["failed_traffic"] / merged_infos["total_traffic"]
-    merged_infos["income_diff"] = merged_infos.apply(lambda x: x["opt_alt_income"] - x["alt_income"] +  x["failed_traffic"] * x["opt_delta"], axis=1)
-    merged_infos
-    #print(merged_infos.drop("node", axis=1).mean())
+    merged_infos["income_diff"] = merged_infos["opt_alt_income"] - merged_infos["alt_income"] + merged_infos["failed_traffic"] * merged_infos["opt_delta"]
     return merged_infos[["node","total_income","total_traffic","failed_traffic_ratio","opt_delta","income_diff"]], p_altered
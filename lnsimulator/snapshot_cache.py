@@ -0,0 +1,80 @@
+import os, json, hashlib
+import pandas as pd
+
+def default_cache_dir():
+    return os.environ.get("LNSIMULATOR_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "lnsimulator"))
+
+def binary_format():
+    """Feather (Arrow IPC) columnar files are used if pyarrow is available, otherwise pickle"""
+    try:
+        import pyarrow
+        return "feather"
+    except ImportError:
+        return "pkl"
+
+class SnapshotCache():
+    """On-disk cache of preprocessed directed edge tables keyed by the content hash of the source file"""
+    def __init__(self, cache_dir=None):
+        self.cache_dir = default_cache_dir() if cache_dir is None else cache_dir
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        self.hash_file = os.path.join(self.cache_dir, "hashes.json")
+
+    def file_key(self, file_path, prefix=""):
+        """Content hash of a file (prefixed by the name of the preprocessing step)"""
+        stat = os.stat(file_path)
+        file_id = "%s:%i:%i" % (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        hashes = {}
+        if os.path.exists(self.hash_file):
+            with open(self.hash_file) as f:
+                hashes = json.load(f)
+        if not file_id in hashes:
+            h = hashlib.sha256()
+            with open(file_path, "rb") as f:
+                for block in iter(lambda: f.read(1<<20), b""):
+                    h.update(block)
+            hashes[file_id] = h.hexdigest()
+            with open(self.hash_file, "w") as f:
+                json.dump(hashes, f)
+        return prefix + hashes[file_id]
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def snapshots(self, key):
+        """Snapshot ids stored for the key (None if the key is not cached)"""
+        meta_file = os.path.join(self._entry_dir(key), "meta.json")
+        if not os.path.exists(meta_file):
+            return None
+        with open(meta_file) as f:
+            return json.load(f)["snapshots"]
+
+    def load(self, key, snapshot_id):
+        with open(os.path.join(self._entry_dir(key), "meta.json")) as f:
+            meta = json.load(f)
+        file_format = meta["format"]
+        if not snapshot_id in meta["snapshots"]:
+            return pd.DataFrame(columns=meta["columns"])
+        fp = os.path.join(self._entry_dir(key), "snapshot_%i.%s" % (snapshot_id, file_format))
+        if file_format == "feather":
+            return pd.read_feather(fp)
+        return pd.read_pickle(fp)
+
+    def store(self, key, edges):
+        """Store directed edges partitioned by 'snapshot_id'"""
+        entry_dir = self._entry_dir(key)
+        if not os.path.exists(entry_dir):
+            os.makedirs(entry_dir)
+        file_format = binary_format()
+        snapshot_ids = []
+        for snapshot_id, part in edges.groupby("snapshot_id", sort=True):
+            fp = os.path.join(entry_dir, "snapshot_%i.%s" % (snapshot_id, file_format))
+            part = part.reset_index(drop=True)
+            if file_format == "feather":
+                part.to_feather(fp)
+            else:
+                part.to_pickle(fp)
+            snapshot_ids.append(int(snapshot_id))
+        # meta data is written last: an interrupted run leaves no valid entry
+        with open(os.path.join(entry_dir, "meta.json"), "w") as f:
+            json.dump({"snapshots":snapshot_ids, "format":file_format, "columns":list(edges.columns)}, f)
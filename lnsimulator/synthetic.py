@@ -0,0 +1,127 @@
+import json
+import pandas as pd
+import numpy as np
+
+# maximal channel capacity before large channels (wumbo) were enabled
+MAX_CHANNEL_CAPACITY = 16777215
+# timestamp of the snapshots in 'ln_edges.csv' (2019-10-29)
+SNAPSHOT_TIME = 1572307200
+
+def generate_node_keys(num_nodes, rng):
+    """Random compressed public keys (66 hex characters)"""
+    raw = rng.bytes(32*num_nodes).hex()
+    prefixes = rng.choice(["02","03"], num_nodes)
+    return [prefixes[i] + raw[64*i:64*(i+1)] for i in range(num_nodes)]
+
+def generate_channels(num_nodes, channels_per_node=6.0, exponent=2.2, max_degree_ratio=0.1, rng=np.random):
+    """Undirected channels of a scale-free graph (Chung-Lu model without isolated nodes)"""
+    weights = rng.pareto(exponent - 1.0, num_nodes) + 1.0
+    num_channels = int(channels_per_node * num_nodes)
+    # hub nodes are connected to at most a 'max_degree_ratio' fraction of the nodes
+    degrees = np.minimum(weights / weights.sum() * 2 * num_channels, max(max_degree_ratio * num_nodes, 1.0))
+    probas = degrees / degrees.sum()
+    extra = max(num_channels - num_nodes, 0)
+    node1 = np.concatenate([np.arange(num_nodes), rng.choice(num_nodes, extra, p=probas)])
+    node2 = rng.choice(num_nodes, num_nodes + extra, p=probas)
+    first, second = np.minimum(node1, node2), np.maximum(node1, node2)
+    keep = first != second
+    _, unique_idx = np.unique(first[keep].astype(np.int64) * num_nodes + second[keep], return_index=True)
+    unique_idx.sort()
+    return node1[keep][unique_idx], node2[keep][unique_idx]
+
+def generate_capacities(num_channels, median=1000000, sigma=1.2, min_capacity=20000, rng=np.random):
+    """Lognormal channel capacities in satoshis"""
+    capacities = rng.lognormal(np.log(median), sigma, num_channels)
+    return np.clip(capacities, min_capacity, MAX_CHANNEL_CAPACITY).astype("int64")
+
+def generate_fee_policies(num_nodes, rng=np.random):
+    """Fee policy of each node: most nodes use the default policy of the LN implementations (1000 msat base fee, 1 ppm fee rate), others charge lognormal fees"""
+    base_fee = np.round(rng.lognormal(np.log(2000), 1.5, num_nodes))
+    base_fee = np.where(rng.random(num_nodes) < 0.15, 0.0, base_fee)
+    base_fee = np.where(rng.random(num_nodes) < 0.65, 1000.0, base_fee)
+    fee_rate = np.clip(np.round(rng.lognormal(np.log(100), 1.5, num_nodes)), 1, 50000)
+    fee_rate = np.where(rng.random(num_nodes) < 0.55, 1.0, fee_rate)
+    return base_fee, fee_rate
+
+def generate_edges(num_nodes, channels_per_node=6.0, exponent=2.2, disabled_ratio=0.05, custom_policy_ratio=0.1, snapshot_id=0, ts_upper_bound=SNAPSHOT_TIME, rng=np.random):
+    """Directed edges of a synthetic LN snapshot in the format of 'preprocess_json_file'"""
+    keys = generate_node_keys(num_nodes, rng)
+    node1, node2 = generate_channels(num_nodes, channels_per_node, exponent, rng=rng)
+    num_channels = len(node1)
+    base_fee, fee_rate = generate_fee_policies(num_nodes, rng)
+    custom_base_fee, custom_fee_rate = generate_fee_policies(2*num_channels, rng)
+    # directed edges: node1->node2 and node2->node1 for each channel
+    src = np.empty(2*num_channels, dtype=np.int64)
+    trg = np.empty(2*num_channels, dtype=np.int64)
+    src[0::2], trg[0::2] = node1, node2
+    src[1::2], trg[1::2] = node2, node1
+    custom = rng.random(2*num_channels) < custom_policy_ratio
+    channel_ids = (np.arange(num_channels) + 600000 * 2**40).repeat(2)
+    # channel updates of the last two weeks
+    age = np.minimum(rng.exponential(3*86400, num_channels), 14*86400).astype("int64")
+    min_htlc = np.where(rng.random(2*num_channels) < 0.9, 1000.0, rng.choice([1.0, 10000.0, 100000.0], 2*num_channels))
+    keys = np.array(keys, dtype=object)
+    return pd.DataFrame({
+        "snapshot_id":snapshot_id,
+        "src":keys[src],
+        "trg":keys[trg],
+        "last_update":(ts_upper_bound - 1 - age).repeat(2),
+        "channel_id":channel_ids,
+        "capacity":generate_capacities(num_channels, rng=rng).repeat(2),
+        "disabled":rng.random(2*num_channels) < disabled_ratio,
+        "fee_base_msat":np.where(custom, custom_base_fee, base_fee[trg]),
+        "fee_rate_milli_msat":np.where(custom, custom_fee_rate, fee_rate[trg]),
+        "min_htlc":min_htlc,
+    })
+
+def generate_merchants(edges, merchant_ratio=0.1, rng=np.random):
+    """Random merchant nodes. Nodes with more channels are more likely to be merchants."""
+    degrees = edges["src"].value_counts().sort_index()
+    num_merchants = max(int(merchant_ratio * len(degrees)), 1)
+    probas = degrees.values / degrees.values.sum()
+    return list(degrees.index[rng.choice(len(degrees), num_merchants, replace=False, p=probas)])
+
+def generate_snapshot(num_nodes, channels_per_node=6.0, merchant_ratio=0.1, seed=None, **kwargs):
+    """Synthetic LN snapshot with 'num_nodes' nodes: directed edges (see 'generate_edges') and the list of merchants. Additional keyword arguments are passed to 'generate_edges'."""
+    rng = np.random if seed is None else np.random.default_rng(seed)
+    edges = generate_edges(num_nodes, channels_per_node, rng=rng, **kwargs)
+    return edges, generate_merchants(edges, merchant_ratio, rng)
+
+def _policy(record):
+    return {
+        "time_lock_delta":40,
+        "min_htlc":str(int(record["min_htlc"])),
+        "fee_base_msat":str(int(record["fee_base_msat"])),
+        "fee_rate_milli_msat":str(int(record["fee_rate_milli_msat"])),
+        "disabled":bool(record["disabled"]),
+    }
+
+def write_snapshot_json(edges, json_file, chunk_size=10000):
+    """Write directed edges (both directions of each channel next to each other, see 'generate_edges') into a JSON file in the format of LND 'describegraph'. The file can be loaded with 'preprocess_json_file'."""
+    first, second = edges.iloc[0::2].reset_index(drop=True), edges.iloc[1::2].reset_index(drop=True)
+    if len(first) != len(second) or not (first["src"].values == second["trg"].values).all():
+        raise ValueError("The two directions of each channel must be stored next to each other!")
+    nodes = pd.unique(np.concatenate([first["src"].values, first["trg"].values]))
+    last_update = int(edges["last_update"].max())
+    with open(json_file, "w") as f:
+        f.write('{\n"nodes": [\n')
+        for i in range(0, len(nodes), chunk_size):
+            records = [json.dumps({"last_update":last_update, "pub_key":key, "alias":"", "addresses":[], "color":"#3399ff"}) for key in nodes[i:i+chunk_size]]
+            f.write((",\n" if i > 0 else "") + ",\n".join(records))
+        f.write('\n],\n"edges": [\n')
+        for i in range(0, len(first), chunk_size):
+            records = []
+            for e1, e2 in zip(first.iloc[i:i+chunk_size].to_dict("records"), second.iloc[i:i+chunk_size].to_dict("records")):
+                records.append(json.dumps({
+                    "channel_id":str(e1["channel_id"]),
+                    "chan_point":"%064x:0" % e1["channel_id"],
+                    "last_update":int(e1["last_update"]),
+                    "node1_pub":e1["src"],
+                    "node2_pub":e1["trg"],
+                    "capacity":str(e1["capacity"]),
+                    # the policy of the target node applies to the directed edge (see 'generate_directed_graph')
+                    "node1_policy":_policy(e2),
+                    "node2_policy":_policy(e1),
+                }))
+            f.write((",\n" if i > 0 else "") + ",\n".join(records))
+        f.write("\n]\n}\n")
@@ -0,0 +1,139 @@
+import pandas as pd
+import numpy as np
+import sys, os, json, time, tempfile, subprocess
+from collections import OrderedDict
+from lnsimulator.ln_utils import preprocess_json_file
+from lnsimulator.synthetic import generate_snapshot, write_snapshot_json
+from lnsimulator.simulator.graph_preprocessing import init_capacities, generate_graph_for_path_search
+from lnsimulator.simulator.path_searching import get_shortest_paths
+from lnsimulator.simulator.genetic_routing import GeneticPaymentRouter
+from lnsimulator.simulator.csr_graph import CSRGraph
+import lnsimulator.simulator.transaction_simulator as ts
+
+amount = 60000
+count = 1000
+epsilon = 0.8
+engine = "networkx"
+max_threads = 2
+seed = 0
+# node removals are only benchmarked for the routers with the most transactions (None: every router)
+max_removal_routers = 100
+# number of short paths extended by the genetic router
+required_length = 4
+genetic_routes = 100
+# a stage is reported as a regression if it is slower than the previous run by this ratio
+regression_ratio = 1.2
+min_regression_seconds = 0.05
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class StageTimer():
+    """Wall time of the benchmarked stages"""
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    def run(self, name, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.stages[name] = time.perf_counter() - start
+        print("%s: %.3f seconds" % (name, self.stages[name]))
+        return result
+
+def run_benchmark(num_nodes):
+    """Time the main stages of the simulator on a synthetic snapshot with 'num_nodes' nodes"""
+    timer = StageTimer()
+    rng = np.random.default_rng(seed)
+    edges, merchants = timer.run("generate_snapshot", generate_snapshot, num_nodes, seed=seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_file = os.path.join(tmp_dir, "snapshot.json")
+        write_snapshot_json(edges, json_file)
+        timer.run("preprocess_json_file", preprocess_json_file, json_file)
+    simulator = timer.run("simulator_init", ts.TransactionSimulator, edges, merchants, amount, count, epsilon=epsilon, seed=seed)
+    transactions = simulator.transactions
+    capacity_map, edges_with_capacity = timer.run("init_capacities", init_capacities, simulator.edges, amount, rng=rng)
+    G = timer.run("graph_construction", generate_graph_for_path_search, edges_with_capacity, amount)
+    G_all = generate_graph_for_path_search(simulator.edges, amount)
+    G_genetic = G_all
+    if engine == "csr":
+        G, G_all = timer.run("csr_graph_construction", lambda: (CSRGraph.from_networkx(G, capacity_map), CSRGraph.from_networkx(G_all)))
+    shortest_paths, hashed_transactions, all_router_fees, _ = timer.run("shortest_paths_with_depletion", get_shortest_paths, capacity_map, G, transactions, hash_transactions=True, cost_prefix="original_", engine=engine, rng=rng)
+    no_depletion_paths, _, _, _ = timer.run("shortest_paths_without_depletion", get_shortest_paths, None, G_all, transactions, hash_transactions=False, engine=engine, rng=rng)
+    if max_removal_routers != None:
+        routers = sorted(hashed_transactions, key=lambda n: len(hashed_transactions[n]), reverse=True)[:max_removal_routers]
+        hashed_transactions = {n:hashed_transactions[n] for n in routers}
+    alternative_paths = timer.run("node_removals", ts.get_shortest_paths_with_node_removals, capacity_map, G, hashed_transactions, threads=max_threads, engine=engine)
+    timer.run("calc_optimal_base_fee", ts.calc_optimal_base_fee, shortest_paths, alternative_paths, all_router_fees)
+    # networkx paths of the search without depletion are extended to 'required_length' hops
+    routes = [p for p in no_depletion_paths["path"] if len(p) > 2 and len(p)-1 < required_length][:genetic_routes]
+    router = GeneticPaymentRouter(required_length, G_genetic, rng=np.random.default_rng(seed))
+    timer.run("genetic_router", lambda: [router.run(list(route), size=100, best_ratio=0.25) for route in routes])
+    return OrderedDict([
+        ("timestamp", int(time.time())),
+        ("commit", git_commit()),
+        ("nodes", num_nodes),
+        ("directed_edges", len(edges)),
+        ("simulated_edges", len(simulator.edges)),
+        ("amount", amount),
+        ("count", count),
+        ("engine", engine),
+        ("threads", max_threads),
+        ("removal_routers", len(hashed_transactions)),
+        ("genetic_routes", len(routes)),
+        ("seed", seed),
+        ("stages", timer.stages),
+    ])
+
+def load_results(results_file):
+    results = []
+    if os.path.exists(results_file):
+        with open(results_file) as f:
+            for line in f:
+                if line.strip() != "":
+                    results.append(json.loads(line))
+    return results
+
+def same_setting(r1, r2):
+    return all(r1.get(key) == r2.get(key) for key in ["nodes", "amount", "count", "engine", "threads", "removal_routers", "genetic_routes", "seed"])
+
+def compare_results(previous, current):
+    """Stage timings of the current run compared to the previous run with the same setting. It returns the list of regressed stages."""
+    rows = []
+    for name, seconds in current["stages"].items():
+        before = previous["stages"].get(name)
+        ratio = seconds / before if before else np.nan
+        regression = before != None and ratio > regression_ratio and seconds - before > min_regression_seconds
+        rows.append((name, before, seconds, ratio, "REGRESSION" if regression else ""))
+    comparison = pd.DataFrame(rows, columns=["stage", "previous", "current", "ratio", "status"])
+    print("Compared to %s (commit: %s):" % (time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(previous["timestamp"])), previous["commit"]))
+    print(comparison.to_string(index=False))
+    return list(comparison[comparison["status"] == "REGRESSION"]["stage"])
+
+def run_benchmarks(results_file, sizes):
+    results = load_results(results_file)
+    regressions = []
+    for num_nodes in sizes:
+        print("\n# Benchmark with %i nodes" % num_nodes)
+        record = run_benchmark(num_nodes)
+        previous = [r for r in results if same_setting(r, record)]
+        if len(previous) > 0:
+            regressions += ["%i nodes: %s" % (num_nodes, stage) for stage in compare_results(previous[-1], record)]
+        results.append(record)
+        with open(results_file, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    return regressions
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3:
+        regressions = run_benchmarks(sys.argv[1], [int(size) for size in sys.argv[2:]])
+        if len(regressions) > 0:
+            print("\nRegressions:")
+            print("\n".join(regressions))
+            sys.exit(1)
+        print("\ndone")
+    else:
+        print("You must support at least 2 input arguments:")
+        print("   run_benchmarks.py <results_file> <number_of_nodes> [<number_of_nodes> ...]")
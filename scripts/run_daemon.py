@@ -0,0 +1,25 @@
+import pandas as pd
+import sys
+from lnsimulator.simulator.daemon import SimulationDaemon, DEFAULT_PORT
+
+data_dir = "../ln_data/"
+cache_dir = "%s/cache/" % data_dir
+
+if __name__ == "__main__":
+    if len(sys.argv) in [3, 4] and sys.argv[1] in ["raw", "preprocessed"]:
+        daemon = SimulationDaemon(cache_dir=cache_dir)
+        node_meta = pd.read_csv("%s/1ml_meta_data.csv" % data_dir)
+        providers = list(node_meta["pub_key"])
+        print("# Load LN graph data")
+        if sys.argv[1] == "raw":
+            daemon.load_snapshot("default", json_file=sys.argv[2], merchants=providers)
+        else:
+            daemon.load_snapshot("default", edges_file="%s/ln_edges.csv" % data_dir, snapshot_id=sys.argv[2], merchants=providers)
+        port = int(sys.argv[3]) if len(sys.argv) == 4 else DEFAULT_PORT
+        daemon.serve(port=port)
+    else:
+        print("You must support 2 or 3 input arguments:")
+        print("   run_daemon.py raw <json_file_path> [<port>]")
+        print("OR")
+        print("   run_daemon.py preprocessed <snapshot_id (int)> [<port>]")
+        print("Jobs are sent as JSON lines, see 'lnsimulator.simulator.daemon.SimulationClient'.")
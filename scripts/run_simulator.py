@@ -1,10 +1,13 @@
 import pandas as pd
 import sys, os, json
-from lnsimulator.ln_utils import preprocess_json_file
+from lnsimulator.ln_utils import preprocess_json_file, load_preprocessed_snapshot
 import lnsimulator.simulator.transaction_simulator as ts
+from lnsimulator.simulator.parameter_sweep import run_sweep
 
 data_dir = "../ln_data/"
+cache_dir = "%s/cache/" % data_dir
 max_threads = 2
+max_workers = 2
 
 def run_experiment(edges, parameter_file, output_dir):
     if not os.path.exists(output_dir):
@@ -39,24 +42,44 @@ def run_experiment(edges, parameter_file, output_dir):
         opt_fees_df.to_csv("%s/opt_fees.csv" % output_dir, index=False)
     print("\ndone")
 
+def run_parameter_sweep(edges, grid_file, output_dir):
+    print("\n# 2. Load parameter grid")
+    with open(grid_file) as f:
+        grid = json.load(f)
+    print(grid)
+
+    print("\n# 3. Load meta data")
+    node_meta = pd.read_csv("%s/1ml_meta_data.csv" % data_dir)
+    providers = list(node_meta["pub_key"])
+
+    print("\n# 4. Parameter sweep")
+    run_sweep(edges, providers, grid, output_dir, max_workers=max_workers)
+    print("\ndone")
+
+def load_edges(input_type, input_value):
+    print("# 1. Load LN graph data")
+    if input_type == "raw":
+        return preprocess_json_file(input_value, cache_dir=cache_dir)
+    elif input_type == "preprocessed":
+        return load_preprocessed_snapshot("%s/ln_edges.csv" % data_dir, int(input_value), cache_dir=cache_dir)
+    else:
+        raise ValueError("The first arguments must be 'raw' or 'preprocessed'!")
+
 if __name__ == "__main__":
     if len(sys.argv) == 5:
-        input_type = sys.argv[1]
-        print("# 1. Load LN graph data")
-        if input_type == "raw":
-            json_file = sys.argv[2]
-            directed_edges = preprocess_json_file(json_file)
-        elif input_type == "preprocessed":
-            snapshot_id = int(sys.argv[2])
-            snapshots = pd.read_csv("%s/ln_edges.csv" % data_dir)
-            directed_edges = snapshots[snapshots["snapshot_id"]==snapshot_id]
-        else:
-            raise ValueError("The first arguments must be 'raw' or 'preprocessed'!")
+        directed_edges = load_edges(sys.argv[1], sys.argv[2])
         parameter_file = sys.argv[3]
         output_folder = sys.argv[4]
         run_experiment(directed_edges, parameter_file, output_folder)
+    elif len(sys.argv) == 6 and sys.argv[1] == "sweep":
+        directed_edges = load_edges(sys.argv[2], sys.argv[3])
+        grid_file = sys.argv[4]
+        output_folder = sys.argv[5]
+        run_parameter_sweep(directed_edges, grid_file, output_folder)
     else:
         print("You must support 4 input arguments:")
         print("   run_simulator.py raw <json_file_path> <parameter_file> <output_folder>")
         print("OR")
         print("   run_simulator.py preprocessed <snapshot_id (int)> <parameter_file> <output_folder>")
+        print("OR run a parameter sweep (interrupted sweeps are resumed in the same output folder):")
+        print("   run_simulator.py sweep raw|preprocessed <json_file_path|snapshot_id> <grid_file> <output_folder>")
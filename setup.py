@@ -9,6 +9,10 @@ install_requires = [
     "tqdm",
 ]
 
+extras_require = {
+    "arrow": ["pyarrow"],
+}
+
 #setup_requires = ['pytest-runner']
 
 #tests_require = [
@@ -40,6 +44,7 @@ setup(name='lnsimulator',
       author_email='fberes@info.ilab.sztaki.hu',
       packages = find_packages(),
       install_requires=install_requires,
+      extras_require=extras_require,
       #setup_requires = setup_requires,
       #tests_require = tests_require,
       keywords = keywords,
@@ -0,0 +1,26 @@
+import pytest
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.transaction_simulator import TransactionSimulator, calc_optimal_base_fee, calculate_delta_costs, calculate_max_income, calculate_max_incomes
+
+AMOUNT = 60000
+
+def test_optimal_base_fee_matches_router_loop():
+    edges, merchants = generate_snapshot(300, seed=1)
+    sim = TransactionSimulator(edges, merchants, AMOUNT, 400, seed=2)
+    shortest_paths, alternative_paths, all_router_fees, _ = sim.simulate(weight="total_fee", with_node_removals=True, max_threads=1, engine="csr")
+    opt_fees_df, p_altered = calc_optimal_base_fee(shortest_paths, alternative_paths, all_router_fees)
+    valid_sp = shortest_paths[shortest_paths["length"] > 1]
+    routers = list(p_altered["node"].unique())
+    vectorized = calculate_max_incomes(calculate_delta_costs(p_altered, valid_sp, all_router_fees), routers).set_index("node")
+    assert len(routers) > 10
+    for router in routers:
+        opt_delta, opt_income, opt_traffic, alt_income, alt_traffic = calculate_max_income(router, p_altered, valid_sp, all_router_fees)
+        row = vectorized.loc[router]
+        assert row["opt_delta"] == pytest.approx(opt_delta)
+        assert row["opt_alt_income"] == pytest.approx(opt_income)
+        assert row["alt_income"] == pytest.approx(alt_income)
+        assert row["alt_traffic"] == alt_traffic
+        if alt_traffic > 0:
+            assert row["opt_alt_traffic"] == pytest.approx(opt_traffic)
+    assert set(routers).issubset(set(opt_fees_df["node"]))
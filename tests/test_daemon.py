@@ -0,0 +1,56 @@
+import threading
+import pytest
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.transaction_simulator import TransactionSimulator, get_total_income_for_routers
+from lnsimulator.simulator.daemon import SimulationDaemon, SimulationClient, JobServer
+
+JOB = {"type":"simulate", "amount":60000, "count":100, "seed":3, "simulate":{"engine":"csr"}, "outputs":["router_incomes", "lengths"]}
+
+@pytest.fixture(scope="module")
+def snapshot():
+    return generate_snapshot(200, seed=1)
+
+@pytest.fixture()
+def client(snapshot):
+    edges, merchants = snapshot
+    daemon = SimulationDaemon()
+    daemon.add_snapshot("default", edges, merchants)
+    server = JobServer(("127.0.0.1", 0), daemon)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    with SimulationClient(port=server.server_address[1], timeout=60) as client:
+        yield client
+        client.shutdown()
+    thread.join()
+    server.server_close()
+
+def test_simulate_job_round_trip(snapshot, client):
+    edges, merchants = snapshot
+    sim = TransactionSimulator(edges, merchants, 60000, 100, seed=3)
+    shortest_paths, _, all_router_fees, _ = sim.simulate(engine="csr")
+    incomes = get_total_income_for_routers(all_router_fees)
+    # the second job reuses the cached simulator
+    responses = list(client.stream([dict(JOB), dict(JOB)]))
+    assert [response["status"] for response in responses] == ["ok", "ok"]
+    for response in responses:
+        result = response["result"]
+        assert result["success_rate"] == pytest.approx(sim.transactions["success"].mean())
+        assert result["total_income"] == pytest.approx(incomes["fee"].sum())
+        assert result["router_incomes"] == incomes.to_dict("records")
+        assert result["lengths"] == {str(length):int(cnt) for length, cnt in shortest_paths["length"].value_counts().items()}
+    status = client.run({"type":"status"})["result"]
+    assert len(status["simulators"]) == 1 and status["jobs"] == 2
+
+def test_errors_and_what_if(client):
+    response = client.run({"type":"simulate", "simulate":{"engine":"bad"}})
+    assert response["status"] == "error" and "engine" in response["error"]
+    baseline = client.run(dict(JOB))["result"]
+    nodes = [record["node"] for record in baseline["router_incomes"][:2]]
+    what_if = client.run({"type":"what_if", "count":100, "seed":3, "simulate":{"engine":"csr"}, "scenario":{"excluded":nodes}, "nodes":nodes})["result"]
+    assert what_if["baseline"]["success_rate"] == pytest.approx(baseline["success_rate"])
+    assert what_if["success_rate_diff"] == pytest.approx(what_if["scenario"]["success_rate"] - baseline["success_rate"])
+    for record, expected in zip(what_if["nodes"], baseline["router_incomes"]):
+        assert record["node"] == expected["node"]
+        assert record["fee_baseline"] == pytest.approx(expected["fee"])
+        assert record["fee_scenario"] == 0.0
@@ -0,0 +1,20 @@
+import pandas as pd
+import pytest
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.ensemble import normal_quantile, run_ensemble
+
+def test_normal_quantile():
+    assert normal_quantile(0.5) == pytest.approx(0.0, abs=1e-9)
+    assert normal_quantile(0.975) == pytest.approx(1.959964, abs=1e-6)
+    assert normal_quantile(0.995) == pytest.approx(2.575829, abs=1e-6)
+    assert normal_quantile(0.025) == pytest.approx(-1.959964, abs=1e-6)
+
+def test_fixed_seed_does_not_depend_on_workers():
+    edges, merchants = generate_snapshot(200, seed=1)
+    params = dict(num_runs=3, seed=5, simulate_params={"with_node_removals":True})
+    sequential = run_ensemble(edges, merchants, 60000, 100, max_workers=1, **params)
+    parallel = run_ensemble(edges, merchants, 60000, 100, max_workers=2, **params)
+    for expected, result in zip(sequential, parallel):
+        pd.testing.assert_frame_equal(expected, result)
+    assert sequential[1]["num_runs"].iloc[0] == 3
@@ -0,0 +1,70 @@
+import numpy as np
+import networkx as nx
+import pytest
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.graph_preprocessing import prepare_edges_for_simulation, generate_graph_for_path_search
+from lnsimulator.simulator.genetic_routing import CommonNeighborIndex, GeneticPaymentRouter, calculate_cost
+
+AMOUNT = 60000
+
+@pytest.fixture()
+def graph():
+    edges, merchants = generate_snapshot(60, seed=3)
+    return generate_graph_for_path_search(prepare_edges_for_simulation(edges, AMOUNT, True, True, verbose=False), AMOUNT)
+
+def common_neighbors(G, n1, n2):
+    return sorted(set(G.successors(n1)).intersection(G.predecessors(n2)))
+
+def short_routes(G, num_routes=20):
+    rng = np.random.default_rng(4)
+    nodes = sorted(G.nodes())
+    routes = []
+    while len(routes) < num_routes:
+        source, target = rng.choice(nodes, 2, replace=False)
+        try:
+            route = nx.shortest_path(G, source, target, weight="total_fee")
+        except nx.NetworkXNoPath:
+            continue
+        if len(route) <= 3:
+            routes.append(route)
+    return routes
+
+def test_common_neighbor_index_follows_graph_changes(graph):
+    index = CommonNeighborIndex(graph, max_entries=50)
+    pairs = [(u, w) for u, v in graph.edges() for w in graph.successors(v)][:200]
+    for n1, n2 in pairs:
+        assert index.get(n1, n2) == common_neighbors(graph, n1, n2)
+    assert len(index) == 50
+    n1, n2 = pairs[-1]
+    m = index.get(n1, n2)[0]
+    graph.remove_edge(n1, m)
+    index.invalidate([("remove", n1, m)])
+    assert index.get(n1, n2) == common_neighbors(graph, n1, n2)
+    assert not m in index.get(n1, n2)
+
+def test_population_costs_match_route_costs(graph):
+    router = GeneticPaymentRouter(4, graph, rng=np.random.default_rng(5))
+    for route in short_routes(graph, 5):
+        population = router._init_population(route, 50)
+        if len(population) == 0:
+            continue
+        costs, opt_path, opt_cost = router._eval_population(population)
+        expected = [calculate_cost(path, graph) for path in population]
+        assert np.allclose(costs, expected)
+        assert opt_cost == pytest.approx(min(expected))
+        assert calculate_cost(opt_path, graph) == pytest.approx(opt_cost)
+
+def test_reused_router_matches_new_router_per_route(graph):
+    routes = short_routes(graph)
+    reused = GeneticPaymentRouter(4, graph, rng=np.random.default_rng(6))
+    rng = np.random.default_rng(6)
+    num_found = 0
+    for route in routes:
+        result = reused.run(route)
+        assert result == GeneticPaymentRouter(4, graph, rng=rng).run(route)
+        if result[1] == 4:
+            num_found += 1
+            assert len(set(result[2])) == 5
+            assert result[2][0] == route[0] and result[2][-1] == route[-1]
+    assert num_found > 0
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.transaction_simulator import TransactionSimulator
+from lnsimulator.simulator.graph_preprocessing import init_capacities, generate_graph_for_path_search
+
+AMOUNT = 60000
+
+@pytest.fixture(scope="module")
+def snapshot():
+    return generate_snapshot(300, seed=1)
+
+def simulator(snapshot, with_depletion, count=200):
+    edges, merchants = snapshot
+    return TransactionSimulator(edges, merchants, AMOUNT, count, with_depletion=with_depletion, seed=2)
+
+def costs(paths):
+    return paths["original_cost"].fillna(-1.0).values.astype("float64")
+
+def scenarios(sim):
+    hubs = list(sim.edges["src"].value_counts().index[:3])
+    return [
+        {},
+        {"excluded":hubs[:1]},
+        {"cap_change_nodes":hubs, "capacity_fraction":0.3},
+        {},
+        {"cap_change_nodes":hubs, "capacity_fraction":0.3},
+    ]
+
+def fresh_build(edges, cap_change_nodes, capacity_fraction, rng):
+    edges = edges.copy()
+    if len(cap_change_nodes) > 0:
+        filt = edges["src"].isin(cap_change_nodes) | edges["trg"].isin(cap_change_nodes)
+        edges["capacity"] = np.where(filt, edges["capacity"] * capacity_fraction, edges["capacity"])
+        edges = edges[edges["capacity"] >= AMOUNT]
+    capacity_map, edges_with_capacity = init_capacities(edges, AMOUNT, rng=rng)
+    return capacity_map, generate_graph_for_path_search(edges_with_capacity, AMOUNT)
+
+@pytest.mark.parametrize("engine", ["networkx", "csr"])
+def test_cached_scenarios_match_fresh_simulator(snapshot, engine):
+    cached = simulator(snapshot, False)
+    for kwargs in scenarios(cached):
+        paths, _, _, _ = cached.simulate(weight="total_fee", engine=engine, **kwargs)
+        expected, _, _, _ = simulator(snapshot, False).simulate(weight="total_fee", engine=engine, **kwargs)
+        assert np.allclose(costs(paths), costs(expected))
+    if engine == "networkx":
+        assert len(cached.graph_cache.graphs) == 2
+
+@pytest.mark.parametrize("engine", ["networkx", "csr"])
+def test_prepared_graph_matches_fresh_build(snapshot, engine):
+    sim = simulator(snapshot, True)
+    for kwargs in scenarios(sim):
+        if "excluded" in kwargs:
+            continue
+        cap_change_nodes = kwargs.get("cap_change_nodes", [])
+        capacity_fraction = kwargs.get("capacity_fraction", 1.0)
+        capacity_map, G = sim.graph_cache.prepare(cap_change_nodes, capacity_fraction, engine, np.random.default_rng(7))
+        expected_map, expected_G = fresh_build(sim.edges, cap_change_nodes, capacity_fraction, np.random.default_rng(7))
+        assert np.allclose(capacity_map.cap, expected_map.cap)
+        assert G.number_of_edges() == expected_G.number_of_edges()
+        for u, v, data in expected_G.edges(data=True):
+            assert G.has_edge(u, v)
+            assert G[u][v]["capacity"] == pytest.approx(data["capacity"])
+            assert G[u][v]["total_fee"] == pytest.approx(data["total_fee"])
@@ -0,0 +1,21 @@
+import pytest
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.graph_preprocessing import prepare_edges_for_simulation, generate_graph_for_path_search, init_capacities
+from lnsimulator.simulator.transaction_simulator import TransactionSimulator
+
+AMOUNT = 60000
+
+def test_former_call_shape_with_transactions_is_rejected():
+    edges, merchants = generate_snapshot(100, seed=1)
+    sim = TransactionSimulator(edges, merchants, AMOUNT, 50, seed=2)
+    edges = prepare_edges_for_simulation(edges, AMOUNT, True, True, verbose=False)
+    with pytest.raises(TypeError, match="transactions"):
+        init_capacities(edges, sim.transactions, AMOUNT)
+    with pytest.raises(TypeError):
+        generate_graph_for_path_search(edges, sim.transactions, AMOUNT)
+    with pytest.raises(TypeError, match="transactions"):
+        generate_graph_for_path_search(edges, sim.transactions)
+    capacity_map, edges_with_capacity = init_capacities(edges, AMOUNT)
+    G = generate_graph_for_path_search(edges_with_capacity, AMOUNT)
+    assert G.number_of_edges() == len(edges_with_capacity)
@@ -0,0 +1,44 @@
+import numpy as np
+import networkx as nx
+import pytest
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.graph_preprocessing import prepare_edges_for_simulation, generate_graph_for_path_search
+from lnsimulator.simulator.csr_graph import CSRGraph
+from lnsimulator.simulator.hop_routing import HopConstrainedRouter
+
+AMOUNT = 60000
+
+def brute_force_cost(G, source, target, k):
+    """Cheapest simple path with exactly 'k' hops (the last hop is free)"""
+    best = None
+    for path in nx.all_simple_paths(G, source, target, cutoff=k):
+        if len(path) == k+1:
+            cost = sum(G[u][v]["total_fee"] for u, v in zip(path[:-2], path[1:-1]))
+            best = cost if best is None else min(best, cost)
+    return best
+
+@pytest.mark.parametrize("engine", ["networkx", "csr"])
+def test_hop_constrained_router_matches_brute_force(engine):
+    edges, merchants = generate_snapshot(40, seed=3)
+    G = generate_graph_for_path_search(prepare_edges_for_simulation(edges, AMOUNT, True, True, verbose=False), AMOUNT)
+    k = 3
+    router = HopConstrainedRouter(k, G if engine == "networkx" else CSRGraph.from_networkx(G))
+    nodes = sorted(G.nodes())
+    rng = np.random.default_rng(4)
+    pairs = [tuple(pair) for pair in rng.choice(nodes, (30, 2))]
+    num_paths = 0
+    for source, target in pairs:
+        if source == target:
+            continue
+        expected = brute_force_cost(G, source, target, k)
+        path = router.shortest_path(source, target)
+        if expected is None:
+            assert path is None
+            continue
+        num_paths += 1
+        assert len(path) == k+1 and len(set(path)) == k+1
+        assert path[0] == source and path[-1] == target
+        cost = sum(G[u][v]["total_fee"] for u, v in zip(path[:-2], path[1:-1]))
+        assert cost == pytest.approx(expected)
+    assert num_paths > 0
@@ -0,0 +1,71 @@
+import io, json
+import numpy as np
+import pandas as pd
+import pytest
+
+from lnsimulator.synthetic import generate_snapshot, write_snapshot_json
+from lnsimulator.ln_utils import JSONStreamReader, read_graph_json, generate_directed_graph
+
+POLICY_KEYS = ['disabled', 'fee_base_msat', 'fee_rate_milli_msat', 'min_htlc']
+
+@pytest.fixture(scope="module")
+def json_file(tmp_path_factory):
+    edges, _ = generate_snapshot(100, seed=1)
+    fp = str(tmp_path_factory.mktemp("snapshot") / "graph.json")
+    write_snapshot_json(edges, fp)
+    return fp
+
+def stream_items(text, chunk_size):
+    """Rebuild a JSON object from the (key, item) pairs of the stream reader"""
+    result = {}
+    for key, item in JSONStreamReader(io.StringIO(text), chunk_size).items():
+        result.setdefault(key, []).append(item)
+    return result
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1<<20])
+def test_stream_reader_matches_json_load(json_file, chunk_size):
+    with open(json_file) as f:
+        text = f.read()
+    expected = json.loads(text)
+    assert stream_items(text, chunk_size) == expected
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64])
+def test_stream_reader_values(chunk_size):
+    text = ' { "a" : [ 1, 2.5e3 , {"b": "[]"} ], "empty":[], "n": 12345678, "s": "x,y}" } '
+    items = list(JSONStreamReader(io.StringIO(text), chunk_size).items())
+    assert items == [("a", 1), ("a", 2500.0), ("a", {"b":"[]"}), ("n", 12345678), ("s", "x,y}")]
+    assert list(JSONStreamReader(io.StringIO("{}"), chunk_size).items()) == []
+    with pytest.raises(json.JSONDecodeError):
+        list(JSONStreamReader(io.StringIO('{"a": [1, 2'), chunk_size).items())
+
+def test_read_graph_json_matches_json_load(json_file):
+    edge_keys = ["node1_pub", "node2_pub", "last_update", "capacity", "channel_id", "node1_policy", "node2_policy"]
+    nodes, edges = read_graph_json(json_file, ["pub_key", "last_update"], edge_keys, chunk_size=1000)
+    with open(json_file) as f:
+        graph = json.load(f)
+    pd.testing.assert_frame_equal(nodes, pd.DataFrame(graph["nodes"])[["pub_key", "last_update"]])
+    pd.testing.assert_frame_equal(edges, pd.DataFrame(graph["edges"])[edge_keys])
+
+def directed_graph_loop(edges, policy_keys=POLICY_KEYS):
+    """Row by row transformation of the channels into directed edges"""
+    directed_edges = []
+    for _, row in edges.iterrows():
+        e1 = [row[x] for x in ["snapshot_id","node1_pub","node2_pub","last_update","channel_id","capacity"]]
+        e2 = [row[x] for x in ["snapshot_id","node2_pub","node1_pub","last_update","channel_id","capacity"]]
+        e1 += [None for x in policy_keys] if row["node2_policy"] is None else [row["node2_policy"][x] for x in policy_keys]
+        e2 += [None for x in policy_keys] if row["node1_policy"] is None else [row["node1_policy"][x] for x in policy_keys]
+        directed_edges += [e1, e2]
+    return pd.DataFrame(directed_edges, columns=["snapshot_id","src","trg","last_update","channel_id","capacity"] + policy_keys)
+
+def test_generate_directed_graph_matches_loop(json_file):
+    edge_keys = ["node1_pub", "node2_pub", "last_update", "capacity", "channel_id", "node1_policy", "node2_policy"]
+    _, edges = read_graph_json(json_file, ["pub_key"], edge_keys)
+    edges["snapshot_id"] = 0
+    # channels with a missing policy
+    edges.loc[3, "node1_policy"] = None
+    edges.loc[5, "node2_policy"] = None
+    edges.index = np.arange(10, 10 + len(edges))
+    directed = generate_directed_graph(edges)
+    expected = directed_graph_loop(edges)
+    assert len(directed) == 2 * len(edges)
+    pd.testing.assert_frame_equal(directed.astype(object).where(directed.notnull(), None), expected.astype(object).where(expected.notnull(), None))
@@ -0,0 +1,48 @@
+import json
+from contextlib import contextmanager
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.transaction_simulator import TransactionSimulator
+from lnsimulator.simulator.metrics import SimulationMetrics
+
+def test_nested_stages_and_profiler_hook():
+    profiled = []
+    @contextmanager
+    def profiler(name):
+        profiled.append(name)
+        yield
+    metrics = SimulationMetrics(profiler)
+    for _ in range(2):
+        with metrics.stage("outer"):
+            with metrics.stage("inner"):
+                sum(range(10000))
+    metrics.add_time("loop", 0.5, calls=10)
+    metrics.count("searches", 3)
+    assert profiled == ["outer", "outer"]
+    assert metrics.stages["outer"]["calls"] == 2 and metrics.stages["inner"]["calls"] == 2
+    assert metrics.seconds("outer") >= metrics.seconds("inner") > 0
+    assert metrics.stages["loop"] == {"seconds":0.5, "calls":10}
+    copied = metrics.copy()
+    copied.count("searches")
+    copied.add_time("loop", 0.5)
+    assert metrics.counters["searches"] == 3 and metrics.stages["loop"]["calls"] == 10
+
+def test_simulation_metrics_are_exported(tmp_path):
+    edges, merchants = generate_snapshot(200, seed=1)
+    sim = TransactionSimulator(edges, merchants, 60000, 100, seed=2)
+    for _ in range(2):
+        sim.simulate(weight="total_fee", with_node_removals=True, max_threads=1, engine="csr")
+        metrics = sim.metrics.to_dict()
+        # each simulation starts from the initialization metrics
+        assert metrics["counters"]["transactions"] == len(sim.transactions)
+    for stage in ["edge_preparation", "transaction_sampling", "prepare_graph", "capacity_init", "graph_construction", "routing", "path_search", "node_removals"]:
+        assert stage in metrics["stages"], stage
+    assert 0 < metrics["counters"]["searches"] <= len(sim.transactions)
+    assert metrics["counters"]["nodes_expanded"] > 0
+    assert metrics["rates"]["transactions_per_second"] > 0
+    assert len(sim.metrics.buckets) > 0
+    sim.export(str(tmp_path))
+    with open("%s/metrics.json" % tmp_path) as f:
+        exported = json.load(f)
+    assert exported["counters"] == metrics["counters"]
+    assert list(exported["stages"].keys()) == list(metrics["stages"].keys())
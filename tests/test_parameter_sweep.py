@@ -0,0 +1,51 @@
+import os, json
+import pandas as pd
+import pytest
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.parameter_sweep import expand_grid, cell_id, run_sweep
+
+GRID = {"count":50, "seed":[1, 2, 3, 4]}
+
+@pytest.fixture(scope="module")
+def snapshot():
+    return generate_snapshot(150, seed=1)
+
+def sweep(snapshot, output_dir, max_workers):
+    edges, merchants = snapshot
+    return run_sweep(edges, merchants, GRID, str(output_dir), max_workers=max_workers, find_alternative_paths=False)
+
+def completed_seeds(output_dir):
+    with open("%s/completed.jsonl" % output_dir) as f:
+        return sorted(json.loads(line)["params"]["seed"] for line in f)
+
+def block_cell(output_dir, seed):
+    """Make the export of a cell fail by putting a file at its output folder"""
+    cell = [cell for cell in expand_grid(GRID) if cell["seed"] == seed][0]
+    os.makedirs(str(output_dir), exist_ok=True)
+    path = "%s/%s" % (output_dir, cell_id(cell))
+    open(path, "w").close()
+    return path
+
+def sorted_summary(summary):
+    return summary.sort_values("cell_id").reset_index(drop=True)
+
+@pytest.mark.parametrize("max_workers, expected_seeds", [(1, [1]), (2, [1, 3, 4])])
+def test_interrupted_sweep_resumes(snapshot, tmp_path, max_workers, expected_seeds):
+    expected = sweep(snapshot, tmp_path / "full", 1)
+    output_dir = tmp_path / "interrupted"
+    blocked = block_cell(output_dir, 2)
+    with pytest.raises(OSError):
+        sweep(snapshot, output_dir, max_workers)
+    # cells are recorded when they finish, also in the group of the failed cell
+    assert completed_seeds(output_dir) == expected_seeds
+    os.remove(blocked)
+    resumed = sweep(snapshot, output_dir, max_workers)
+    assert completed_seeds(output_dir) == [1, 2, 3, 4]
+    pd.testing.assert_frame_equal(sorted_summary(expected), sorted_summary(resumed))
+
+def test_parallel_sweep_matches_sequential(snapshot, tmp_path):
+    sequential = sweep(snapshot, tmp_path / "sequential", 1)
+    parallel = sweep(snapshot, tmp_path / "parallel", 2)
+    assert len(parallel) == 4
+    pd.testing.assert_frame_equal(sorted_summary(sequential), sorted_summary(parallel))
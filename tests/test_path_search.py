@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+import networkx as nx
+import pytest
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.transaction_simulator import TransactionSimulator
+from lnsimulator.simulator.path_searching import init_capacity_state, init_search_graph, route_transactions, find_shortest_path, compute_shortest_path_tree, process_path
+
+AMOUNT = 60000
+
+@pytest.fixture(scope="module")
+def snapshot():
+    return generate_snapshot(300, seed=1)
+
+def simulate(snapshot, count=200, with_depletion=True, amount=AMOUNT, **kwargs):
+    edges, merchants = snapshot
+    sim = TransactionSimulator(edges, merchants, amount, count, with_depletion=with_depletion, seed=2)
+    return sim.simulate(weight="total_fee", **kwargs)
+
+def costs(paths, column="original_cost"):
+    return paths[column].fillna(-1.0).values.astype("float64")
+
+def payment_cost(G, path):
+    return process_path(path, AMOUNT, None, G, "total_fee", False)[0]
+
+def depleted_state(snapshot, engine, count=300):
+    """Search graph after routing the first half of the transactions with depletion, and the remaining transactions"""
+    edges, merchants = snapshot
+    sim = TransactionSimulator(edges, merchants, AMOUNT, count, seed=2)
+    init_capacities, G_origi = sim.prepare_graph(engine=engine)
+    capacity_map = init_capacity_state(init_capacities)
+    G = init_search_graph(G_origi, capacity_map, engine)
+    route_transactions(capacity_map, G, sim.transactions.iloc[:count//2], hash_transactions=False)
+    transactions = sim.transactions.iloc[count//2:]
+    in_graph = [s in G and t in G for s, t in zip(transactions["source"], transactions["target"])]
+    return G, transactions[in_graph]
+
+def alternative_costs(alternative_paths):
+    df = alternative_paths.sort_values(["transaction_id", "node"])[["transaction_id", "node", "cost"]].reset_index(drop=True)
+    df["cost"] = costs(df, "cost")
+    return df
+
+@pytest.mark.parametrize("with_depletion", [True, False])
+def test_csr_engine_matches_networkx(snapshot, with_depletion):
+    nx_paths, nx_alternatives, _, _ = simulate(snapshot, with_depletion=with_depletion, with_node_removals=True, max_threads=1)
+    csr_paths, csr_alternatives, _, _ = simulate(snapshot, with_depletion=with_depletion, with_node_removals=True, max_threads=1, engine="csr")
+    assert np.allclose(costs(nx_paths), costs(csr_paths))
+    pd.testing.assert_frame_equal(alternative_costs(nx_alternatives), alternative_costs(csr_alternatives))
+
+@pytest.mark.parametrize("engine", ["networkx", "csr"])
+def test_source_batching_matches_default_without_depletion(snapshot, engine):
+    default, _, _, _ = simulate(snapshot, with_depletion=False, engine=engine)
+    batched, _, _, _ = simulate(snapshot, with_depletion=False, engine=engine, batch_sources=True)
+    assert list(default["transaction_id"]) == list(batched["transaction_id"])
+    assert np.allclose(costs(default), costs(batched))
+
+@pytest.mark.parametrize("engine", ["networkx", "csr"])
+def test_source_trees_match_search_on_depleted_graph(snapshot, engine):
+    # with depletion only the cost of each query is the same: ties can be broken differently
+    G, transactions = depleted_state(snapshot, engine)
+    num_paths = 0
+    for source, group in transactions.groupby("source"):
+        tree = compute_shortest_path_tree(G, source, "total_fee")
+        for target in group["target"]:
+            try:
+                expected = find_shortest_path(G, source, target, "total_fee")
+            except nx.NetworkXNoPath:
+                with pytest.raises(nx.NetworkXNoPath):
+                    tree.path(target)
+                continue
+            assert payment_cost(G, tree.path(target)) == pytest.approx(payment_cost(G, expected))
+            num_paths += 1
+    assert num_paths > 50
+
+@pytest.mark.parametrize("engine, replacement_paths", [("networkx", False), ("csr", False), ("csr", True)])
+def test_parallel_node_removals_match_sequential(snapshot, engine, replacement_paths):
+    with_depletion = not replacement_paths
+    _, sequential, _, _ = simulate(snapshot, with_depletion=with_depletion, engine=engine, with_node_removals=True, max_threads=1, replacement_paths=replacement_paths)
+    _, parallel, _, _ = simulate(snapshot, with_depletion=with_depletion, engine=engine, with_node_removals=True, max_threads=2, replacement_paths=replacement_paths)
+    pd.testing.assert_frame_equal(alternative_costs(sequential), alternative_costs(parallel))
+
+def test_replacement_paths_match_bucket_search(snapshot):
+    # replacement paths ignore depletion by the other transactions of a router bucket
+    _, bucket_alternatives, _, _ = simulate(snapshot, with_depletion=False, engine="csr", with_node_removals=True, max_threads=1)
+    _, replacement_alternatives, _, _ = simulate(snapshot, with_depletion=False, engine="csr", with_node_removals=True, max_threads=1, replacement_paths=True)
+    pd.testing.assert_frame_equal(alternative_costs(bucket_alternatives), alternative_costs(replacement_alternatives))
+
+def test_speculative_routing_matches_sequential(snapshot):
+    sequential, _, sequential_fees, _ = simulate(snapshot, engine="csr")
+    speculative, _, speculative_fees, _ = simulate(snapshot, engine="csr", speculative_threads=2)
+    assert np.allclose(costs(sequential), costs(speculative))
+    assert list(sequential["path"]) == list(speculative["path"])
+    pd.testing.assert_frame_equal(sequential_fees, speculative_fees)
+
+@pytest.mark.parametrize("with_depletion", [True, False])
+def test_mixed_amounts_csr_engine_matches_networkx(snapshot, with_depletion):
+    amounts = [20000, 60000, 200000]
+    nx_paths, nx_alternatives, _, _ = simulate(snapshot, with_depletion=with_depletion, amount=amounts, with_node_removals=True, max_threads=1)
+    csr_paths, csr_alternatives, _, _ = simulate(snapshot, with_depletion=with_depletion, amount=amounts, with_node_removals=True, max_threads=1, engine="csr")
+    assert np.allclose(costs(nx_paths), costs(csr_paths))
+    pd.testing.assert_frame_equal(alternative_costs(nx_alternatives), alternative_costs(csr_alternatives))
+
+@pytest.mark.parametrize("engine", ["networkx", "csr"])
+def test_single_amount_list_matches_scalar_amount(snapshot, engine):
+    scalar, _, scalar_fees, _ = simulate(snapshot, engine=engine)
+    listed, _, listed_fees, _ = simulate(snapshot, engine=engine, amount=[AMOUNT])
+    assert list(scalar["transaction_id"]) == list(listed["transaction_id"])
+    assert np.allclose(costs(scalar), costs(listed))
+    assert np.allclose(scalar_fees["fee"].values, listed_fees["fee"].values)
+
+@pytest.mark.parametrize("engine", ["networkx", "csr"])
+def test_landmark_search_matches_bidirectional_per_query(snapshot, engine):
+    # with depletion only the cost of each query on the same graph state is the same: ties can be broken differently
+    edges, merchants = snapshot
+    landmarks = TransactionSimulator(edges, merchants, AMOUNT, 10, seed=2).landmark_index(4)
+    G, transactions = depleted_state(snapshot, engine)
+    num_paths = 0
+    for source, target in zip(transactions["source"], transactions["target"]):
+        try:
+            expected = find_shortest_path(G, source, target, "total_fee")
+        except nx.NetworkXNoPath:
+            with pytest.raises(nx.NetworkXNoPath):
+                find_shortest_path(G, source, target, "total_fee", landmarks=landmarks)
+            continue
+        path = find_shortest_path(G, source, target, "total_fee", landmarks=landmarks)
+        assert path[0] == source and path[-1] == target
+        assert payment_cost(G, path) == pytest.approx(payment_cost(G, expected))
+        num_paths += 1
+    assert num_paths > 50
+
+@pytest.mark.parametrize("engine", ["networkx", "csr"])
+def test_landmark_search_matches_bidirectional_without_depletion(snapshot, engine):
+    bidirectional, _, _, _ = simulate(snapshot, with_depletion=False, engine=engine)
+    alt, _, _, _ = simulate(snapshot, with_depletion=False, engine=engine, search="alt", num_landmarks=4)
+    assert np.allclose(costs(bidirectional), costs(alt))
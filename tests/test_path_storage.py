@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.transaction_simulator import TransactionSimulator
+from lnsimulator.simulator.path_storage import PathTable
+
+AMOUNT = 60000
+
+@pytest.fixture(scope="module")
+def snapshot():
+    return generate_snapshot(300, seed=1)
+
+def test_path_table_take_and_extend():
+    paths = [["a", "b", "c"], [], ["c", "a"], ["d"]]
+    table = PathTable.from_paths(paths)
+    assert table.to_lists() == paths
+    assert list(table.offsets) == [0, 3, 3, 5, 6]
+    assert table.take([3, 0, 1]).to_lists() == [["d"], ["a", "b", "c"], []]
+    other = table.empty_like()
+    other.add(["b", "e"])
+    table.extend(other)
+    assert table.to_lists() == paths + [["b", "e"]]
+    assert table.nodes == ["a", "b", "c", "d", "e"]
+    with pytest.raises(ValueError):
+        table.extend(PathTable.from_paths([["a"]]))
+
+@pytest.mark.parametrize("batch_sources", [False, True])
+def test_compact_paths_match_path_column(snapshot, batch_sources):
+    edges, merchants = snapshot
+    results = []
+    for compact_paths in [False, True]:
+        sim = TransactionSimulator(edges, merchants, AMOUNT, 200, with_depletion=not batch_sources, seed=2)
+        shortest_paths, _, all_router_fees, _ = sim.simulate(weight="total_fee", engine="csr", batch_sources=batch_sources, compact_paths=compact_paths)
+        results.append((sim, shortest_paths, all_router_fees))
+    (_, default_paths, default_fees), (compact_sim, compact_paths, compact_fees) = results
+    assert not "path" in compact_paths.columns
+    assert compact_sim.paths.to_lists() == list(default_paths["path"])
+    pd.testing.assert_frame_equal(default_paths.drop(columns=["path"]), compact_paths)
+    assert list(compact_fees["node"].astype(str)) == list(default_fees["node"])
+    assert np.allclose(compact_fees["fee"], default_fees["fee"])
+
+@pytest.mark.parametrize("file_format", ["parquet", "feather"])
+def test_arrow_export_round_trip(snapshot, tmp_path, file_format):
+    pytest.importorskip("pyarrow")
+    edges, merchants = snapshot
+    sim = TransactionSimulator(edges, merchants, AMOUNT, 200, seed=2)
+    shortest_paths, _, all_router_fees, _ = sim.simulate(weight="total_fee", compact_paths=True)
+    output_dir = str(tmp_path)
+    total_income, _ = sim.export(output_dir, file_format=file_format)
+    read = pd.read_parquet if file_format == "parquet" else pd.read_feather
+    paths = read("%s/paths.%s" % (output_dir, file_format))
+    nodes = read("%s/path_nodes.%s" % (output_dir, file_format))
+    pub_keys = dict(zip(nodes["node_id"], nodes["pub_key"]))
+    assert [[pub_keys[i] for i in p] for p in paths["path"]] == sim.paths.to_lists()
+    assert np.allclose(paths["original_cost"].fillna(-1.0), shortest_paths["original_cost"].fillna(-1.0).astype("float64"))
+    incomes = read("%s/router_incomes.%s" % (output_dir, file_format))
+    assert np.isclose(incomes["fee"].sum(), all_router_fees["fee"].sum())
+    assert list(read("%s/transactions.%s" % (output_dir, file_format))["transaction_id"]) == list(sim.transactions["transaction_id"])
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import networkx as nx
+import pytest
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.transaction_simulator import TransactionSimulator
+from lnsimulator.simulator.graph_preprocessing import generate_graph_for_path_search
+from lnsimulator.simulator.path_searching import find_shortest_path, process_path
+from lnsimulator.simulator.route_oracle import RouteOracle
+
+AMOUNT = 60000
+
+@pytest.fixture(scope="module")
+def snapshot():
+    return generate_snapshot(300, seed=1)
+
+def rebuild_graph(capacity_map):
+    """Payment graph built from scratch for the current channel capacities"""
+    edges = pd.DataFrame(dict({"src":capacity_map.src, "trg":capacity_map.trg, "capacity":capacity_map.cap, "total_fee":capacity_map.fee}, **capacity_map.policy))
+    return generate_graph_for_path_search(edges, AMOUNT)
+
+def route_cost(G, source, target):
+    try:
+        return process_path(find_shortest_path(G, source, target, "total_fee"), AMOUNT, None, G, "total_fee", False)[0]
+    except (nx.NetworkXNoPath, nx.NodeNotFound):
+        return None
+
+def oracle_cost(oracle, source, target):
+    try:
+        return oracle.route(source, target)[0]
+    except (nx.NetworkXNoPath, nx.NodeNotFound):
+        return None
+
+@pytest.mark.parametrize("engine", ["networkx", "csr"])
+def test_invalidated_trees_match_fresh_search(snapshot, engine):
+    edges, merchants = snapshot
+    sim = TransactionSimulator(edges, merchants, AMOUNT, 300, seed=2)
+    capacity_map, G = sim.prepare_graph(engine=engine)
+    oracle = RouteOracle(G, capacity_map, AMOUNT, engine=engine, min_tree_queries=1)
+    pairs = list(zip(sim.transactions["source"], sim.transactions["target"]))
+    for source, target in pairs[:150]:
+        oracle_cost(oracle, source, target)
+        try:
+            oracle.pay(source, target)
+        except (nx.NetworkXNoPath, nx.NodeNotFound):
+            pass
+    state = oracle.capacity_map
+    rng = np.random.default_rng(3)
+    restored = rng.choice(np.where(state.cap < AMOUNT)[0], 20, replace=False)
+    depleted = rng.choice(np.where(state.cap >= AMOUNT)[0], 20, replace=False)
+    for e in restored:
+        oracle.update_capacity(state.src[e], state.trg[e], 2.0*AMOUNT)
+    for e in depleted:
+        oracle.update_capacity(state.src[e], state.trg[e], 0.0)
+    fresh = rebuild_graph(state)
+    assert oracle.num_invalidated > 0
+    assert oracle.G.number_of_edges() == fresh.number_of_edges()
+    if engine == "networkx":
+        assert set(oracle.G.edges()) == set(fresh.edges())
+        for e in restored:
+            assert oracle.G[state.src[e]][state.trg[e]] == fresh[state.src[e]][state.trg[e]]
+    num_paths = 0
+    for source, target in pairs[150:]:
+        expected = route_cost(fresh, source, target)
+        cost = oracle_cost(oracle, source, target)
+        if expected is None:
+            assert cost is None
+            continue
+        assert cost == pytest.approx(expected)
+        num_paths += 1
+    assert num_paths > 50
@@ -0,0 +1,48 @@
+import os
+import pandas as pd
+import pytest
+
+import lnsimulator.snapshot_cache as snapshot_cache
+from lnsimulator.synthetic import generate_snapshot, write_snapshot_json
+from lnsimulator.ln_utils import preprocess_json_file, load_preprocessed_snapshot
+
+@pytest.fixture(params=["default", "pkl"])
+def cache_format(request, monkeypatch):
+    if request.param == "pkl":
+        monkeypatch.setattr(snapshot_cache, "binary_format", lambda: "pkl")
+    return request.param
+
+def test_json_cache_hit_matches_preprocessing(tmp_path, cache_format):
+    edges, _ = generate_snapshot(100, seed=1)
+    json_file = str(tmp_path / "graph.json")
+    write_snapshot_json(edges, json_file)
+    cache_dir = str(tmp_path / "cache")
+    expected = preprocess_json_file(json_file)
+    miss = preprocess_json_file(json_file, cache_dir=cache_dir)
+    hit = preprocess_json_file(json_file, cache_dir=cache_dir)
+    pd.testing.assert_frame_equal(miss.reset_index(drop=True), expected.reset_index(drop=True))
+    pd.testing.assert_frame_equal(hit, expected.reset_index(drop=True))
+    cache = snapshot_cache.SnapshotCache(cache_dir)
+    key = cache.file_key(json_file, prefix="json_")
+    assert cache.snapshots(key) == [0]
+    # a modified file gets a new key
+    write_snapshot_json(edges.iloc[:100], json_file)
+    assert cache.file_key(json_file, prefix="json_") != key
+    assert len(preprocess_json_file(json_file, cache_dir=cache_dir)) == 100
+
+def test_csv_cache_loads_single_snapshots(tmp_path, cache_format):
+    snapshots = []
+    for snapshot_id in [0, 1, 3]:
+        edges, _ = generate_snapshot(50, seed=snapshot_id, snapshot_id=snapshot_id)
+        snapshots.append(edges)
+    edges_file = str(tmp_path / "ln_edges.csv")
+    pd.concat(snapshots).to_csv(edges_file, index=False)
+    cache_dir = str(tmp_path / "cache")
+    for _ in range(2):
+        for snapshot_id in [0, 1, 2, 3]:
+            expected = load_preprocessed_snapshot(edges_file, snapshot_id)
+            cached = load_preprocessed_snapshot(edges_file, snapshot_id, cache_dir=cache_dir)
+            assert len(cached) == len(expected)
+            if len(expected) > 0:
+                pd.testing.assert_frame_equal(cached, expected.reset_index(drop=True))
+    assert len([name for name in os.listdir(cache_dir) if name.startswith("csv_")]) == 1
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.transaction_simulator import TransactionSimulator
+from lnsimulator.simulator.snapshot_delta import diff_snapshots
+
+AMOUNT = 60000
+
+def costs(paths):
+    return paths["original_cost"].fillna(-1.0).values.astype("float64")
+
+def perturb_snapshot(edges, seed):
+    """Next snapshot: some channels are closed and some fee policies change"""
+    rng = np.random.default_rng(seed)
+    channels = edges["channel_id"].unique()
+    closed = rng.choice(channels, len(channels) // 20, replace=False)
+    new_edges = edges[~edges["channel_id"].isin(closed)].copy()
+    changed = rng.choice(len(new_edges), len(new_edges) // 20, replace=False)
+    new_edges.iloc[changed, new_edges.columns.get_loc("fee_base_msat")] = rng.choice([0.0, 500.0, 1500.0], len(changed))
+    return new_edges.reset_index(drop=True)
+
+def test_apply_delta_matches_fresh_simulator():
+    edges, merchants = generate_snapshot(300, seed=1)
+    new_edges = perturb_snapshot(edges, 5)
+    sim = TransactionSimulator(edges, merchants, AMOUNT, 200, with_depletion=False, seed=2)
+    # the cached payment graph is updated by the delta
+    sim.simulate(weight="total_fee")
+    sim.apply_delta(diff_snapshots(edges, new_edges), resample=False)
+    fresh = TransactionSimulator(new_edges, merchants, AMOUNT, 200, with_depletion=False, seed=2)
+    fresh.transactions = sim.transactions.copy()
+    pd.testing.assert_frame_equal(sim.node_variables.sort_values("pub_key").reset_index(drop=True), fresh.node_variables.sort_values("pub_key").reset_index(drop=True), check_dtype=False)
+    for engine in ["networkx", "csr"]:
+        updated_paths = sim.simulate(weight="total_fee", engine=engine)[0]
+        fresh_paths = fresh.simulate(weight="total_fee", engine=engine)[0]
+        assert np.allclose(costs(updated_paths), costs(fresh_paths))
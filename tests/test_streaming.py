@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lnsimulator.synthetic import generate_snapshot
+from lnsimulator.simulator.transaction_simulator import TransactionSimulator, get_total_income_for_routers
+
+AMOUNT = 60000
+
+@pytest.mark.parametrize("engine", ["networkx", "csr"])
+def test_streaming_matches_simulate(tmp_path, engine):
+    edges, merchants = generate_snapshot(300, seed=1)
+    output_dir = str(tmp_path / "stream")
+    stream_sim = TransactionSimulator(edges, merchants, AMOUNT, 200, chunk_size=60, seed=2)
+    total_income, _ = stream_sim.simulate_stream(output_dir, engine=engine)
+    transactions = pd.read_csv("%s/transactions.csv" % output_dir)
+    paths = pd.read_csv("%s/paths.csv" % output_dir)
+    assert len(transactions) == 200 and transactions["transaction_id"].is_unique
+    # the streamed transactions are simulated in one pass: capacities are initialized with the same random state
+    sim = TransactionSimulator(edges, merchants, AMOUNT, 200, chunk_size=60, seed=2)
+    sim.chunk_size = None
+    sim.transactions = transactions[["transaction_id", "source", "target", "amount_SAT"]].copy()
+    shortest_paths, _, all_router_fees, _ = sim.simulate(weight="total_fee", engine=engine)
+    assert list(paths["transaction_id"]) == list(shortest_paths["transaction_id"])
+    assert np.allclose(paths["original_cost"].fillna(-1.0), shortest_paths["original_cost"].fillna(-1.0).astype("float64"))
+    assert list(transactions["success"]) == list(sim.transactions["success"])
+    expected_income = get_total_income_for_routers(all_router_fees).set_index("node").sort_index()
+    streamed_income = total_income.set_index("node").sort_index()
+    assert list(streamed_income.index) == list(expected_income.index)
+    assert np.allclose(streamed_income["fee"], expected_income["fee"])
+    assert list(streamed_income["num_trans"]) == list(expected_income["num_trans"])